@@ -23,6 +23,7 @@
 #include <libsigrokdecode.h>
 
 #include <vector>
+#include <QStringList>
 #include <assert.h>
 
 #include "annotation.h"
@@ -114,6 +115,80 @@ Annotation::~Annotation()
 {     
 }
   
+//Structured annotations carry several values, separated by spaces in the
+//numeric string. A line refers to the N-th one with "{$N}", and to the
+//whole string with "{$}". "{$N:d}" and "{$N:x}" show the N-th one in
+//decimal and lower case hex, whatever the display format; "{$N:04x}"
+//also pads it with zeros to four digits.
+static bool has_value_fields(const QString &src)
+{
+	int pos = src.indexOf("{$");
+
+	while (pos >= 0){
+		if (pos + 2 < src.length() && src.at(pos + 2).isDigit())
+			return true;
+		pos = src.indexOf("{$", pos + 2);
+	}
+	return false;
+}
+
+static QString fill_value_fields(const QString &src, const char *hex_str, int fmt,
+								 AnnotationResTable &table)
+{
+	QStringList values = QString(hex_str).split(' ');
+	QString out;
+	int pos = 0;
+
+	while (true)
+	{
+		int start = src.indexOf("{$", pos);
+		if (start < 0)
+			break;
+		int end = src.indexOf('}', start + 2);
+		if (end < 0)
+			break;
+
+		QString field = src.mid(start + 2, end - start - 2);
+		int base = 0;
+		int width = 0;
+		bool ok = true;
+		int colon = field.indexOf(':');
+		if (colon >= 0){
+			QString spec = field.mid(colon + 1);
+			field.truncate(colon);
+			if (spec.endsWith('d'))
+				base = 10;
+			else if (spec.endsWith('x'))
+				base = 16;
+			spec.chop(1);
+			if (!spec.isEmpty())
+				width = spec.toInt(&ok);
+			if (base == 0 || (!spec.isEmpty() && !spec.startsWith('0')))
+				ok = false;
+		}
+
+		int index = (!ok || field.isEmpty()) ? -1 : field.toInt(&ok);
+
+		if (!ok || index >= values.size() || (index < 0 && base != 0)){
+			//not a field, keep the text
+			out += src.mid(pos, end + 1 - pos);
+		}
+		else{
+			out += src.mid(pos, start - pos);
+			if (index < 0)
+				out += QString(table.format_numberic(hex_str, fmt));
+			else if (base != 0)
+				out += QString::number(values[index].toULongLong(&ok, 16), base)
+							.rightJustified(width, '0');
+			else
+				out += QString(table.format_numberic(values[index].toUtf8().data(), fmt));
+		}
+		pos = end + 1;
+	}
+	out += src.mid(pos);
+	return out;
+}
+
 const std::vector<QString>& Annotation::annotations() const
 {  
 	 AnnotationSourceItem *pobj = _status->m_resTable.GetItem(_resIndex);	 
@@ -142,7 +217,14 @@ const std::vector<QString>& Annotation::annotations() const
 
 			 //have custom string
 			 for (QString &rd_src : resItem.src_lines)
-			 {			
+			 {
+				 if (has_value_fields(rd_src)){
+					 resItem.cvt_lines.push_back(fill_value_fields(rd_src,
+							resItem.str_number_hex, resItem.cur_display_format,
+							_status->m_resTable));
+					 continue;
+				 }
+
 				 QString src = rd_src.replace("{$}", "%s");
 
 				 const char *num_str = _status->m_resTable.format_numberic(resItem.str_number_hex, resItem.cur_display_format);
@@ -171,6 +171,8 @@ static void decoder_free(struct srd_decoder *dec)
 
 	g_slist_free_full(dec->options, &decoder_option_free);
 	g_slist_free_full(dec->binary, (GDestroyNotify)&g_strfreev);
+	if (dec->ann_templates)
+		g_ptr_array_free(dec->ann_templates, TRUE);
 	g_slist_free_full(dec->annotation_rows, &annotation_row_free);
 	g_slist_free_full(dec->annotations, (GDestroyNotify)&g_strfreev);
 	g_slist_free_full(dec->opt_channels, &channel_free);
@@ -655,6 +657,71 @@ err_out:
 	return SRD_ERR_PYTHON;
 }
 
+/* Convert annotation templates to an array of char **. */
+static int get_annotation_templates(struct srd_decoder *dec)
+{
+	PyObject *py_templates, *py_template;
+	GPtrArray *templates;
+	char **lines;
+	ssize_t i, size;
+	PyGILState_STATE gstate;
+
+	gstate = PyGILState_Ensure();
+
+	if (!PyObject_HasAttrString(dec->py_dec, "annotation_templates")) {
+		PyGILState_Release(gstate);
+		return SRD_OK;
+	}
+
+	templates = NULL;
+
+	py_templates = PyObject_GetAttrString(dec->py_dec, "annotation_templates");
+	if (!py_templates)
+		goto except_out;
+
+	if (!PyTuple_Check(py_templates)) {
+		srd_err("Protocol decoder %s annotation templates should "
+			"be a tuple.", dec->name);
+		goto err_out;
+	}
+
+	size = PyTuple_Size(py_templates);
+	templates = g_ptr_array_new_full(size, (GDestroyNotify)&g_strfreev);
+	for (i = 0; i < size; i++) {
+		py_template = PyTuple_GetItem(py_templates, i);
+		if (!py_template)
+			goto except_out;
+
+		if (!PyTuple_Check(py_template) || PyTuple_Size(py_template) < 1) {
+			srd_err("Protocol decoder %s annotation templates should "
+				"consist only of non-empty tuples of strings.",
+				dec->name);
+			goto err_out;
+		}
+		if (py_strseq_to_char(py_template, &lines) != SRD_OK)
+			goto err_out;
+
+		g_ptr_array_add(templates, lines);
+	}
+	dec->ann_templates = templates;
+	Py_DECREF(py_templates);
+	PyGILState_Release(gstate);
+
+	return SRD_OK;
+
+except_out:
+	srd_exception_catch(NULL, "Failed to get %s decoder annotation templates",
+			dec->name);
+
+err_out:
+	if (templates)
+		g_ptr_array_free(templates, TRUE);
+	Py_XDECREF(py_templates);
+	PyGILState_Release(gstate);
+
+	return SRD_ERR_PYTHON;
+}
+
 /* Check whether the Decoder class defines the named method. */
 static int check_method(PyObject *py_dec, const char *mod_name,
 		const char *method_name)
@@ -904,6 +971,11 @@ SRD_API int srd_decoder_load(const char *module_name)
 		goto err_out;
 	}
 
+	if (get_annotation_templates(d) != SRD_OK) {
+		fail_txt = "cannot get annotation templates";
+		goto err_out;
+	}
+
 	PyGILState_Release(gstate);
 
 	/* Append it to the list of loaded decoders. */
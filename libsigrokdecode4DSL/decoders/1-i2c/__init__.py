@@ -20,6 +20,12 @@
 '''
 I²C (Inter-Integrated Circuit) is a bidirectional, multi-master
 bus using two signals (SCL = serial clock line, SDA = serial data line).
+
+The 'Bit annotations' option selects whether the bits row shows each bit,
+all bits of a byte in one annotation (default), or nothing.
+
+Stacked decoders can take whole transactions (START to STOP) instead of
+the individual packets, see the OUTPUT_PYTHON format in pd.py.
 '''
 
 from .pd import Decoder
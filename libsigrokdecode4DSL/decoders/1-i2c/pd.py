@@ -27,6 +27,8 @@
 ##
 
 import sigrokdecode as srd
+from common.srdhelper import bit_anns_option, put_bit_anns
+from common.srdhelper.i2c import Transaction
 
 '''
 OUTPUT_PYTHON format:
@@ -45,11 +47,18 @@ Packet:
  - 'ACK' (ACK bit)
  - 'NACK' (NACK bit)
  - 'BITS' (<pdata>: list of data/address bits and their ss/es numbers)
+ - 'TRANSACTION' (<pdata>: the whole transaction from START to STOP, see
+   common/srdhelper/i2c.py)
 
 <pdata> is the data or address byte associated with the 'ADDRESS*' and 'DATA*'
 command. Slave addresses do not include bit 0 (the READ/WRITE indication bit).
 For example, a slave address field could be 0x51 (instead of 0xa2).
 For 'START', 'START REPEAT', 'STOP', 'ACK', and 'NACK' <pdata> is None.
+
+Packets are only sent when a stacked decoder uses their <ptype> (see the
+'input_packets' decoder attribute). 'TRANSACTION' is sent at the STOP
+condition, only to stacked decoders which list it: a decoder which takes
+whole transactions gets one packet instead of about three per byte.
 '''
 
 # CMD: [annotation-type-index, long annotation, short annotation]
@@ -83,6 +92,7 @@ class Decoder(srd.Decoder):
     options = (
         {'id': 'address_format', 'desc': 'Displayed slave address format',
             'default': 'unshifted', 'values': ('shifted', 'unshifted'), 'idn':'dec_1i2c_opt_addr'},
+        bit_anns_option,
     )
     annotations = (
         ('7', 'start', 'Start condition'),
@@ -123,6 +133,8 @@ class Decoder(srd.Decoder):
         self.pdu_start = None
         self.pdu_bits = 0
         self.bits = []
+        self.last_bit_sample = -1
+        self.transaction = None
 
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
@@ -139,7 +151,8 @@ class Decoder(srd.Decoder):
         self.put(self.ss, self.es, self.out_ann, data)
 
     def putp(self, data):
-        self.put(self.ss, self.es, self.out_python, data)
+        if self.packets is None or data[0] in self.packets:
+            self.put(self.ss, self.es, self.out_python, data)
 
     def putb(self, data):
         self.put(self.ss, self.es, self.out_binary, data)
@@ -150,6 +163,11 @@ class Decoder(srd.Decoder):
         self.pdu_bits = 0
         cmd = 'START REPEAT' if (self.is_repeat_start == 1) else 'START'
         self.putp([cmd, None])
+        if self.transactions:
+            if cmd == 'START':
+                self.transaction = Transaction(self.samplenum,
+                    self.options['address_format'] == 'shifted')
+            self.transaction.add_start(self.samplenum)
         self.putx([proto[cmd][0], proto[cmd][1:]])
         self.state = 'FIND ADDRESS'
         self.bitcount = self.databyte = 0
@@ -171,12 +189,15 @@ class Decoder(srd.Decoder):
 
         # Store individual bits and their start/end samplenumbers.
         # In the list, index 0 represents the LSB (I²C transmits MSB-first).
-        self.bits.insert(0, [sda, self.samplenum, self.samplenum])
-        if self.bitcount > 0:
-            self.bits[1][2] = self.samplenum
         if self.bitcount == 7:
-            self.bitwidth = self.bits[1][2] - self.bits[2][2]
-            self.bits[0][2] += self.bitwidth
+            self.bitwidth = self.samplenum - self.last_bit_sample
+        if self.collect_bits:
+            self.bits.insert(0, [sda, self.samplenum, self.samplenum])
+            if self.bitcount > 0:
+                self.bits[1][2] = self.samplenum
+            if self.bitcount == 7:
+                self.bits[0][2] += self.bitwidth
+        self.last_bit_sample = self.samplenum
 
         # Return if we haven't collected all 8 + 1 bits, yet.
         if self.bitcount < 7:
@@ -210,9 +231,10 @@ class Decoder(srd.Decoder):
         self.putp([cmd, d])
 
         self.putb([bin_class, bytes([d])])
+        if self.transaction is not None:
+            self.transaction.add_byte(self.databyte, self.ss, self.es)
 
-        for bit in self.bits:
-            self.put(bit[1], bit[2], self.out_ann, [5, ['%d' % bit[0]]])
+        put_bit_anns(self, self.out_ann, 5, self.bits, self.options['bit_anns'])
 
         if cmd.startswith('ADDRESS'):
             self.ss, self.es = self.samplenum, self.samplenum + self.bitwidth
@@ -232,6 +254,8 @@ class Decoder(srd.Decoder):
         cmd = 'NACK' if (sda == 1) else 'ACK'
         self.putp([cmd, None])
         self.putx([proto[cmd][0], proto[cmd][1:]])
+        if self.transaction is not None:
+            self.transaction.add_ack(sda, self.ss, self.es)
         # There could be multiple data bytes in a row, so either find
         # another data byte or a STOP condition next.
         self.state = 'FIND DATA'
@@ -247,12 +271,27 @@ class Decoder(srd.Decoder):
         self.ss, self.es = self.samplenum, self.samplenum
         self.putp([cmd, None])
         self.putx([proto[cmd][0], proto[cmd][1:]])
+        if self.transaction is not None:
+            t, self.transaction = self.transaction, None
+            t.es = self.samplenum
+            self.put(t.ss, t.es, self.out_python, ['TRANSACTION', t])
         self.state = 'FIND START'
         self.is_repeat_start = 0
         self.wr = -1
         self.bits = []
 
     def decode(self):
+        # Only send the packet types the stacked decoders use, and only
+        # collect the bits when they are sent or annotated. Asked here and
+        # not in start(): a stacked filter's or demux's answer depends on
+        # the decoders stacked on top of it, which are started after this
+        # one.
+        self.packets = self.output_packets(self.out_python)
+        self.collect_bits = self.options['bit_anns'] != 'none' or \
+            self.packets is None or 'BITS' in self.packets
+        self.transactions = self.packets is not None and \
+            'TRANSACTION' in self.packets
+
         while True:
             # State machine.
             if self.state == 'FIND START':
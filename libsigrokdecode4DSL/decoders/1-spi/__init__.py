@@ -27,6 +27,9 @@ Either MISO or MOSI (but not both) can be optional.
 If CS# is supplied, data is only decoded when CS# is asserted (clock
 transitions where CS# is not asserted are ignored). If CS# is not supplied,
 data is decoded on every clock transition (depending on SPI mode).
+
+The 'Bit annotations' option selects whether the MISO/MOSI bits rows show
+each bit, all bits of a word in one annotation (default), or nothing.
 '''
 
 from .pd import Decoder
@@ -24,6 +24,7 @@
 #
 
 import sigrokdecode as srd
+from common.srdhelper import bit_anns_option, put_bit_anns
 from collections import namedtuple
 
 Data = namedtuple('Data', ['ss', 'es', 'val'])
@@ -49,6 +50,9 @@ Packet:
    byte transferred during this block of CS# asserted time. Each Data() has
    fields ss, es, and val.
 
+Packets are only sent when a stacked decoder uses their <ptype> (see the
+'input_packets' decoder attribute).
+
 Examples:
  ['CS-CHANGE', None, 1]
  ['CS-CHANGE', 1, 0]
@@ -109,6 +113,7 @@ class Decoder(srd.Decoder):
             'values': tuple(range(5,129,1)), 'idn':'dec_1spi_opt_wordsize'},
         {'id': 'frame', 'desc': 'Frame Decoder', 'default': 'no',
             'values': ('yes', 'no'), 'idn':'dec_1spi_opt_frame'},
+        bit_anns_option,
     )
     annotations = (
         ('106', 'miso-data', 'MISO data'),
@@ -158,6 +163,9 @@ class Decoder(srd.Decoder):
         self.out_bitrate = self.register(srd.OUTPUT_META,
                 meta=(int, 'Bitrate', 'Bitrate during transfers'))
         self.bw = (self.options['wordsize'] + 7) // 8
+        self.bit_anns = self.options['bit_anns']
+        # Only send the packet types the stacked decoders use.
+        self.packets = self.output_packets(self.out_python)
 
     def metadata(self, key, value):
        if key == srd.SRD_CONF_SAMPLERATE:
@@ -166,6 +174,10 @@ class Decoder(srd.Decoder):
     def putw(self, data):
         self.put(self.ss_block, self.samplenum, self.out_ann, data)
 
+    def putp(self, ss, es, data):
+        if self.packets is None or data[0] in self.packets:
+            self.put(ss, es, self.out_python, data)
+
     def putdata(self, frame):
         # Pass MISO and MOSI bits and then data to the next PD up the stack.
         so = self.misodata if self.have_miso else None
@@ -182,8 +194,8 @@ class Decoder(srd.Decoder):
             bdata = si.to_bytes(self.bw, byteorder='big')
             self.put(ss, es, self.out_binary, [1, bdata])
 
-        self.put(ss, es, self.out_python, ['BITS', si_bits, so_bits])
-        self.put(ss, es, self.out_python, ['DATA', si, so])
+        self.putp(ss, es, ['BITS', si_bits, so_bits])
+        self.putp(ss, es, ['DATA', si, so])
 
         if frame:
             if self.have_miso:
@@ -193,15 +205,9 @@ class Decoder(srd.Decoder):
 
         # Bit annotations.
         if self.have_miso:
-            blen = len(self.misobits)
-            for i in range(0, blen):
-                bit = self.misobits[blen-i-1]
-                self.put(bit[1], bit[2], self.out_ann, [2, ['%d' % bit[0]]])
+            put_bit_anns(self, self.out_ann, 2, self.misobits[::-1], self.bit_anns)
         if self.have_mosi:
-            blen = len(self.mosibits)
-            for i in range(0, blen):
-                bit = self.mosibits[blen-i-1]
-                self.put(bit[1], bit[2], self.out_ann, [3, ['%d' % bit[0]]])
+            put_bit_anns(self, self.out_ann, 3, self.mosibits[::-1], self.bit_anns)
 
 
 
@@ -288,8 +294,7 @@ class Decoder(srd.Decoder):
         if self.have_cs and (first or (self.matched & (0b1 << self.have_cs))):
             # Send all CS# pin value changes.
             oldcs = None if first else 1 - cs
-            self.put(self.samplenum, self.samplenum, self.out_python,
-                     ['CS-CHANGE', oldcs, cs])
+            self.putp(self.samplenum, self.samplenum, ['CS-CHANGE', oldcs, cs])
 
             if frame:
                 if self.cs_asserted(cs):
@@ -303,7 +308,7 @@ class Decoder(srd.Decoder):
                     if self.have_mosi:
                         self.put(self.ss_transfer, self.samplenum, self.out_ann,
                             [6, ['@' + ' '.join(format(x.val, '02X') for x in self.mosibytes)]])
-                    self.put(self.ss_transfer, self.samplenum, self.out_python,
+                    self.putp(self.ss_transfer, self.samplenum,
                         ['TRANSFER', self.mosibytes, self.misobytes])
 
             # Reset decoder state when CS# changes (and the CS# pin is used).
@@ -332,7 +337,7 @@ class Decoder(srd.Decoder):
             raise ChannelError('Either MISO or MOSI (or both) pins required.')
         self.have_cs = self.has_channel(3)
         if not self.have_cs:
-            self.put(0, 0, self.out_python, ['CS-CHANGE', None, None])
+            self.putp(0, 0, ['CS-CHANGE', None, None])
 
         frame = self.options['frame'] == 'yes'
 
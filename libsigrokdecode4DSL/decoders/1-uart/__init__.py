@@ -35,6 +35,11 @@ the correct place where to probe). Once the data is in digital form and
 matches the "UART" description above, this protocol decoder can work with
 it though, no matter whether the source was on TTL UART levels, or RS232,
 or others.
+
+The 'frame' decode mode samples all bit slots of a frame in one go, by
+only waiting for the line's edges and the frame's last sample point. It
+produces the same output as the default 'bit' mode with far fewer wait()
+calls, which helps with long captures.
 '''
 
 from .pd import Decoder
@@ -45,6 +45,8 @@ This is the list of <ptype>s and their respective <pdata> values:
    value of the UART data, and a boolean which reflects the validity of the
    UART frame.
 
+Packets are only sent when a stacked decoder uses their <ptype> (see the
+'input_packets' decoder attribute).
 '''
 
 # Given a parity type to check (odd, even, zero, one), the value of the
@@ -108,6 +110,8 @@ class Decoder(srd.Decoder):
             'values': ('yes', 'no'), 'idn':'dec_1uart_opt_invert'},
 	    {'id': 'anno_startstop', 'desc': 'Display Start/Stop?', 'default': 'no',
             'values': ('yes', 'no'), 'idn':'dec_1uart_anno_startstop'},
+        {'id': 'decode_mode', 'desc': 'Decode mode', 'default': 'bit',
+            'values': ('bit', 'frame'), 'idn':'dec_1uart_opt_decode_mode'},
     )
     annotations = (
         ('108', 'data', 'data'),
@@ -138,6 +142,8 @@ class Decoder(srd.Decoder):
             self.put(self.frame_start, self.samplenum + ceil(halfbit * (1+self.options['num_stop_bits'])), self.out_ann, data)
 
     def putpx(self, data):
+        if self.packets is not None and data[0] not in self.packets:
+            return
         s, halfbit = self.startsample, self.bit_width / 2.0
         self.put(s - floor(halfbit), self.samplenum + ceil(halfbit), self.out_python, data)
 
@@ -146,6 +152,8 @@ class Decoder(srd.Decoder):
         self.put(s - floor(halfbit), s + ceil(halfbit), self.out_ann, data)
 
     def putp(self, data):
+        if self.packets is not None and data[0] not in self.packets:
+            return
         s, halfbit = self.samplenum, self.bit_width / 2.0
         self.put(s - floor(halfbit), s + ceil(halfbit), self.out_python, data)
 
@@ -153,7 +161,8 @@ class Decoder(srd.Decoder):
         self.put(ss, es, self.out_ann, data)
 
     def putpse(self, ss, es, data):
-        self.put(ss, es, self.out_python, data)
+        if self.packets is None or data[0] in self.packets:
+            self.put(ss, es, self.out_python, data)
 
     def putbin(self, data):
         s, halfbit = self.startsample, self.bit_width / 2.0
@@ -183,6 +192,10 @@ class Decoder(srd.Decoder):
         self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.out_ann = self.register(srd.OUTPUT_ANN)
         self.bw = (self.options['num_data_bits'] + 7) // 8
+        # Only send the packet types the stacked decoders use, and only
+        # build the bit list of 'DATA' packets when they are sent.
+        self.packets = self.output_packets(self.out_python)
+        self.want_databits = self.packets is None or 'DATA' in self.packets
 
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
@@ -368,6 +381,146 @@ class Decoder(srd.Decoder):
             self.handle_break()
         self.break_start = None
 
+    def get_frame_offsets(self):
+        # Sample point offsets of all bit slots of a frame, relative to
+        # the frame start: START, data bits, parity (if used) and the
+        # first STOP bit. The frame start is an integer sample number,
+        # so ceil() of the offset matches ceil() of get_sample_point().
+        count = 1 + self.options['num_data_bits']
+        count += 0 if self.options['parity_type'] == 'none' else 1
+        count += 1
+        first = (self.bit_width - 1) / 2.0
+        return [ceil(first + i * self.bit_width) for i in range(count)]
+
+    def sample_frame(self, points, level, inv):
+        # Return the (logical) line levels at the given sample points.
+        # The level only changes at edges, so only wait for edges and
+        # for the last sample point instead of every single bit slot.
+        # Edges are passed to the break detection like in 'bit' mode.
+        levels = []
+        i, count = 0, len(points)
+        last = points[-1]
+        while i < count:
+            (rxtx, ) = self.wait([{0: 'e'}, {'skip': max(0, last - self.samplenum)}])
+            pos = self.samplenum
+            while i < count and points[i] < pos:
+                levels.append(level)
+                i += 1
+            level = (1 - rxtx) if inv else rxtx
+            if self.matched & 0b01:
+                self.inspect_edge(rxtx, inv)
+                if self.state == 'WAIT FOR START BIT':
+                    return None, level
+            if self.matched & 0b10:
+                levels.extend([level] * (count - i))
+                i = count
+        return levels, level
+
+    def handle_frame(self, points, levels):
+        # Emit the same output as the per-bit state machine does, for a
+        # frame whose data, parity and stop bit levels are all known.
+        opt = self.options
+        num_data_bits = opt['num_data_bits']
+        startstop = opt['anno_startstop'] == 'yes'
+        lo, hi = floor(self.bit_width / 2.0), ceil(self.bit_width / 2.0)
+        halfbit = int(self.bit_width / 2)
+
+        # START bit, was checked by the caller.
+        s = points[0]
+        self.putpse(s - lo, s + hi, ['STARTBIT', 0, 0])
+        if startstop:
+            self.putgse(s - lo, s + hi, [1, ['Start bit', 'Start', 'S']])
+
+        # Data bits.
+        data_points = points[1:1 + num_data_bits]
+        data_levels = levels[1:1 + num_data_bits]
+        if self.want_databits:
+            self.databits = [[b, p - halfbit, p + halfbit]
+                             for b, p in zip(data_levels, data_points)]
+        ann = self.out_ann
+        for b, p in zip(data_levels, data_points):
+            self.put(p - lo, p + hi, ann, [6, ['%d' % b]])
+        if opt['bit_order'] == 'msb-first':
+            data_levels = data_levels[::-1]
+        self.datavalue = bitpack(data_levels)
+        # putx() and friends span up to the current sample number, which
+        # is the last data bit's sample point in 'bit' mode.
+        pos = self.samplenum
+        self.startsample = data_points[0]
+        self.samplenum = data_points[-1]
+        self.putpx(['DATA', 0, (self.datavalue, self.databits)])
+        self.putx([0, ['@%02X' % self.datavalue]])
+        bdata = self.datavalue.to_bytes(self.bw, byteorder='big')
+        self.putbin([0, bdata])
+        self.putbin([1, bdata])
+        self.samplenum = pos
+        self.databits = []
+
+        # Parity bit (if used).
+        if opt['parity_type'] != 'none':
+            s = points[1 + num_data_bits]
+            self.paritybit = levels[1 + num_data_bits]
+            if parity_ok(opt['parity_type'], self.paritybit,
+                         self.datavalue, num_data_bits):
+                self.putpse(s - lo, s + hi, ['PARITYBIT', 0, self.paritybit])
+                self.putgse(s - lo, s + hi, [2, ['Parity bit', 'Parity', 'P']])
+            else:
+                self.putpse(s - lo, s + hi, ['PARITY ERROR', 0, (0, 1)])
+                self.putgse(s - lo, s + hi, [3, ['Parity error', 'Parity err', 'PE']])
+                self.frame_valid = False
+
+        # First STOP bit.
+        s = points[-1]
+        self.stopbit1 = levels[-1]
+        if self.stopbit1 != 1:
+            self.putpse(s - lo, s + hi, ['INVALID STOPBIT', 0, self.stopbit1])
+            self.putgse(s - lo, s + hi, [5, ['Frame error', 'Frame err', 'FE']])
+            self.frame_valid = False
+        self.putpse(s - lo, s + hi, ['STOPBIT', 0, self.stopbit1])
+        if startstop:
+            self.putgse(s - lo, s + hi, [2, ['Stop bit', 'Stop', 'T']])
+        self.putpse(self.frame_start, s + hi, ['FRAME', 0,
+            (self.datavalue, self.frame_valid)])
+
+    def decode_frames(self, inv):
+        # Frame level decoding: after the START edge the levels of all bit
+        # slots are taken in one go, see sample_frame(). The START bit is
+        # checked first, so that a spurious START edge is not allowed to
+        # swallow the next frame (same as in 'bit' mode).
+        offsets = self.get_frame_offsets()
+        cond_fall = {0: 'r' if inv else 'f'}
+        cond_rise = {0: 'f' if inv else 'r'}
+        level = 1
+
+        while True:
+            if level == 0:
+                # Line is still low after the last frame, the next edge
+                # is a rising one. Needed for break detection.
+                (rxtx, ) = self.wait(cond_rise)
+                self.inspect_edge(rxtx, inv)
+                level = 1
+                continue
+
+            (rxtx, ) = self.wait(cond_fall)
+            self.inspect_edge(rxtx, inv)
+            self.wait_for_start_bit(rxtx)
+            points = [self.frame_start + o for o in offsets]
+
+            levels, level = self.sample_frame(points[:1], 0, inv)
+            if levels is None:
+                continue
+            if levels[0] != 0:
+                self.startbit = levels[0]
+                self.get_start_bit(self.startbit)
+                continue
+
+            self.state = 'GET DATA BITS'
+            levels, level = self.sample_frame(points[1:], level, inv)
+            if levels is None:
+                continue
+            self.handle_frame(points, [0] + levels)
+            self.state = 'WAIT FOR START BIT'
+
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
@@ -385,6 +538,10 @@ class Decoder(srd.Decoder):
         self.break_min_sample_count = ceil(frame_samples)
         cond_edge_idx = None
 
+        if self.options['decode_mode'] == 'frame':
+            self.decode_frames(inv)
+            return
+
         while True:
             conds = []
 
@@ -52,6 +52,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['spi']
     outputs = []
+    input_packets = ('CS-CHANGE', 'DATA')
     tags = ['IC', 'PC', 'Sensor']
     annotations = (
         ('read', 'Register read commands'),
@@ -18,8 +18,7 @@
 ##
 
 import sigrokdecode as srd
-import subprocess
-import re
+from common import objdump
 
 # See ETMv3 Signal Protocol table 7-11: 'Encoding of Exception[8:0]'.
 exc_names = [
@@ -168,6 +167,8 @@ class Decoder(srd.Decoder):
             'default': '', 'idn':'dec_arm_etmv3_opt_elffile'},
         {'id': 'branch_enc', 'desc': 'Branch encoding',
             'default': 'alternative', 'values': ('alternative', 'original'), 'idn':'dec_arm_etmv3_opt_branch_enc'},
+        {'id': 'cache', 'desc': 'Cache objdump output', 'default': 'yes',
+            'values': ('yes', 'no'), 'idn':'dec_arm_etmv3_opt_cache'},
     )
 
     def __init__(self):
@@ -182,80 +183,25 @@ class Decoder(srd.Decoder):
         self.current_pc = 0
         self.current_loc = None
         self.current_func = None
-        self.next_instr_lookup = {}
-        self.file_lookup = {}
-        self.func_lookup = {}
-        self.disasm_lookup = {}
-        self.source_lookup = {}
+        self.objdump = objdump.Disassembly()
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
         self.load_objdump()
 
     def load_objdump(self):
-        '''Parse disassembly obtained from objdump into two tables:
-        next_instr_lookup: Find the next PC addr from current PC.
-        disasm_lookup: Find the instruction text from current PC.
-        source_lookup: Find the source code line from current PC.
+        '''Get the instructions, source lines, locations and functions
+        from objdump, see common/objdump.
         '''
         if not (self.options['objdump'] and self.options['elffile']):
             return
 
-        opts = [self.options['objdump']]
-        opts += self.options['objdump_opts'].split()
-        opts += [self.options['elffile']]
-
-        try:
-            disasm = subprocess.check_output(opts)
-        except subprocess.CalledProcessError:
-            return
-
-        disasm = disasm.decode('utf-8', 'replace')
-
-        instpat = re.compile('\s*([0-9a-fA-F]+):\t+([0-9a-fA-F ]+)\t+([a-zA-Z][^;]+)\s*;?.*')
-        branchpat = re.compile('(b|bl|b..|bl..|cbnz|cbz)(?:\.[wn])?\s+(?:r[0-9]+,\s*)?([0-9a-fA-F]+)')
-        filepat = re.compile('[^\s]+[/\\\\]([a-zA-Z0-9._-]+:[0-9]+)(?:\s.*)?')
-        funcpat = re.compile('[0-9a-fA-F]+\s*<([^>]+)>:.*')
-
-        prev_src = ''
-        prev_file = ''
-        prev_func = ''
-
-        for line in disasm.split('\n'):
-            m = instpat.match(line)
-            if m:
-                addr = int(m.group(1), 16)
-                raw = m.group(2)
-                disas = m.group(3).strip().replace('\t', ' ')
-                self.disasm_lookup[addr] = disas
-                self.source_lookup[addr] = prev_src
-                self.file_lookup[addr] = prev_file
-                self.func_lookup[addr] = prev_func
-
-                # Next address in direct sequence.
-                ilen = len(raw.replace(' ', '')) // 2
-                next_n = addr + ilen
-
-                # Next address if branch is taken.
-                bm = branchpat.match(disas)
-                if bm:
-                    next_e = int(bm.group(2), 16)
-                else:
-                    next_e = next_n
-
-                self.next_instr_lookup[addr] = (next_n, next_e)
-            else:
-                m = funcpat.match(line)
-                if m:
-                    prev_func = m.group(1)
-                    prev_src = None
-                else:
-                    m = filepat.match(line)
-                    if m:
-                        prev_file = m.group(1)
-                        prev_src = None
-                    else:
-                        prev_src = line.strip()
+        d = objdump.load(self.options['objdump'],
+                         self.options['objdump_opts'].split(),
+                         self.options['elffile'],
+                         cache=self.options['cache'] == 'yes')
+        if d:
+            self.objdump = d
 
     def flush_current_loc(self):
         if self.current_loc is not None:
@@ -287,17 +233,17 @@ class Decoder(srd.Decoder):
         for i, exec_status in enumerate(exec_status):
             pc = self.current_pc
             default_next = pc + 2 if self.cpu_state == 'thumb' else pc + 4
-            target_n, target_e = self.next_instr_lookup.get(pc, (default_next, default_next))
+            target_n, target_e = self.objdump.next_instr(pc) or (default_next, default_next)
             ss = self.startsample + round(tdelta * i)
             es = self.startsample + round(tdelta * (i+1))
 
             self.put(ss, es, self.out_ann,
                      [5, ['PC 0x%08x' % pc, '0x%08x' % pc, '%08x' % pc]])
 
-            new_loc = self.file_lookup.get(pc)
-            new_src = self.source_lookup.get(pc)
-            new_dis = self.disasm_lookup.get(pc)
-            new_func = self.func_lookup.get(pc)
+            new_loc = self.objdump.locations.get(pc)
+            new_src = self.objdump.sources.get(pc)
+            new_dis = self.objdump.text(pc)
+            new_func = self.objdump.functions.get(pc)
 
             # Report source line only when it changes.
             if self.current_loc is not None:
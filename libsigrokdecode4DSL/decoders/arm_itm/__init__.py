@@ -20,6 +20,13 @@
 '''
 This decoder stacks on top of the 'uart' or 'arm_tpiu' PD and decodes the
 ARM Cortex-M processor trace data from Instrumentation Trace Macroblock.
+
+With an .elf file, the functions and source locations are taken from the
+objdump disassembly. The parsed disassembly is cached on disk (in the
+user's cache directory, below dsview/objdump), keyed by the contents of
+the .elf file and the objdump options, so decoding another trace of the
+same firmware doesn't run objdump again. Set 'cache' to 'no' to always
+run objdump.
 '''
 
 from .pd import Decoder
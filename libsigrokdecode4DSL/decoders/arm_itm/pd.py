@@ -19,8 +19,7 @@
 
 import sigrokdecode as srd
 import string
-import subprocess
-import re
+from common import objdump
 
 ARM_EXCEPTIONS = {
     0: 'Thread',
@@ -53,6 +52,8 @@ class Decoder(srd.Decoder):
             'default': '-lSC', 'idn':'dec_arm_itm_opt_objdump_opts'},
         {'id': 'elffile', 'desc': '.elf path',
             'default': '', 'idn':'dec_arm_itm_opt_elffile'},
+        {'id': 'cache', 'desc': 'Cache objdump output', 'default': 'yes',
+            'values': ('yes', 'no'), 'idn':'dec_arm_itm_opt_cache'},
     )
     annotations = (
         ('trace', 'Trace information'),
@@ -98,42 +99,17 @@ class Decoder(srd.Decoder):
         self.load_objdump()
 
     def load_objdump(self):
-        '''Parse disassembly obtained from objdump into a lookup tables'''
+        '''Get function and source location ranges from objdump.'''
         if not (self.options['objdump'] and self.options['elffile']):
             return
 
-        opts = [self.options['objdump']]
-        opts += self.options['objdump_opts'].split()
-        opts += [self.options['elffile']]
-
-        try:
-            disasm = subprocess.check_output(opts)
-        except subprocess.CalledProcessError:
-            return
-
-        disasm = disasm.decode('utf-8', 'replace')
-
-        instpat = re.compile('\s*([0-9a-fA-F]+):\t+([0-9a-fA-F ]+)\t+([a-zA-Z][^;]+)\s*;?.*')
-        filepat = re.compile('[^\s]+[/\\\\]([a-zA-Z0-9._-]+:[0-9]+)(?:\s.*)?')
-        funcpat = re.compile('[0-9a-fA-F]+\s*<([^>]+)>:.*')
-
-        prev_file = ''
-        prev_func = ''
-
-        for line in disasm.split('\n'):
-            m = instpat.match(line)
-            if m:
-                addr = int(m.group(1), 16)
-                self.file_lookup[addr] = prev_file
-                self.func_lookup[addr] = prev_func
-            else:
-                m = funcpat.match(line)
-                if m:
-                    prev_func = m.group(1)
-                else:
-                    m = filepat.match(line)
-                    if m:
-                        prev_file = m.group(1)
+        d = objdump.load(self.options['objdump'],
+                         self.options['objdump_opts'].split(),
+                         self.options['elffile'],
+                         cache=self.options['cache'] == 'yes')
+        if d:
+            self.file_lookup = d.locations
+            self.func_lookup = d.functions
 
     def get_packet_type(self, byte):
         '''Identify packet type based on its first byte.
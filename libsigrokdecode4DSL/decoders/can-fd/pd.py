@@ -25,14 +25,48 @@
 ##
 
 from common.srdhelper import bitpack_msb
+from common.srdhelper.crc import Crc, CRC15_CAN, CRC17_CANFD, CRC21_CANFD
 import sigrokdecode as srd
 
 class SamplerateError(Exception):
     pass
 
+# Wait for the next edge, or for the sample point this many bits ahead.
+RUN_BITS = 10
+
 def dlc2len(dlc):
     return [0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64][dlc]
 
+# Annotation templates, put as [class, template, value...]. The data
+# bytes have a template per byte index and the fixed stuff bits one per
+# bit value, the frontend formats the values.
+class Tpl:
+    DATA = 0                # + byte index
+    ID = DATA + 64
+    EXT_ID = ID + 1
+    FULL_ID = EXT_ID + 1
+    CRC = FULL_ID + 1       # CRC-15, CRC-17, CRC-21
+    FSB = CRC + 3           # + bit
+
+CRC_TYPES = ('CRC-15', 'CRC-17', 'CRC-21')
+
+# The numbers keep their fixed formats, whatever the display format:
+# identifiers in decimal and hex, data bytes and CRCs in padded hex.
+ID_TEXT = '{$0:d} (0x{$0:x})'
+
+templates = \
+    tuple(('Data byte %d: 0x{$0:02x}' % i, 'DB %d: 0x{$0:02x}' % i, '0x{$0:02x}')
+          for i in range(64)) + (
+    ('Identifier: %s' % ID_TEXT, 'ID: %s' % ID_TEXT, ID_TEXT),
+    ('Extended Identifier: %s' % ID_TEXT, 'Extended ID: %s' % ID_TEXT,
+     'Extended ID', ID_TEXT),
+    ('Full Identifier: %s' % ID_TEXT, 'Full ID: %s' % ID_TEXT, ID_TEXT),
+    ) + tuple(('%s sequence: 0x{$0:04x}' % c, '%s: 0x{$0:04x}' % c, '0x{$0:04x}')
+              for c in CRC_TYPES) + \
+    tuple(('Fixed stuff bit: %d' % b, 'FSB: %d' % b, '%d' % b) for b in (0, 1))
+
+BIT_TEXTS = (['0'], ['1'])
+
 def ParityCheck(value):
     paritycheck = False
     parity = [0,3,5,6,9,10,12,15]
@@ -94,12 +128,14 @@ class Decoder(srd.Decoder):
         ('fields', 'Fields', tuple(range(15))),
         ('warnings', 'Warnings', (16,)),
     )
+    annotation_templates = templates
 
     def __init__(self):
         self.reset()
 
     def reset(self):
         self.samplerate = None
+        self.schedules = {}
         self.reset_variables()
 
     def start(self):
@@ -109,6 +145,7 @@ class Decoder(srd.Decoder):
     def set_bit_rate(self, bitrate):
         self.bit_width = float(self.samplerate) / float(bitrate)
         self.sample_point = (self.bit_width / 100.0) * self.options['sample_point']
+        self.schedule = self.schedules.setdefault(bitrate, [])
 
     def set_nominal_bitrate(self):
         self.set_bit_rate(self.options['nominal_bitrate'])
@@ -121,9 +158,8 @@ class Decoder(srd.Decoder):
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
-
-            self.bit_width = float(self.samplerate) / float(self.options['nominal_bitrate'])
-            self.sample_point = (self.bit_width / 100.0) * self.options['sample_point']
+            self.schedules = {}
+            self.set_nominal_bitrate()
 
     # Generic helper for CAN bit annotations.
     def putg(self, ss, es, data):
@@ -154,6 +190,9 @@ class Decoder(srd.Decoder):
         self.sof = self.frame_type = self.dlc = None
         self.rawbits = [] # All bits, including stuff bits
         self.bits = [] # Only actual CAN frame bits (no stuff bits)
+        # Runs of identical bits (including stuff bits).
+        self.run_level = None
+        self.run_len = self.prev_run_len = 0
         self.curbit = 0 # Current bit of CAN frame (bit 0 == SOF)
         self.last_databit = 999 # Positive value that bitnum+x will never match
         self.ss_block = None
@@ -180,14 +219,14 @@ class Decoder(srd.Decoder):
         self.dom_edge_snum = self.samplenum
         self.dom_edge_bcount = self.curbit
 
-    # Determine the position of the next desired bit's sample point.
-
+    # Determine the position of the next desired bit's sample point. The
+    # offsets from the last synchronization are calculated once per bitrate.
     def get_sample_point(self, bitnum):
-
-        samplenum = self.dom_edge_snum
-        samplenum += self.bit_width * (bitnum - self.dom_edge_bcount)
-        samplenum += self.sample_point
-        return int(samplenum)
+        n = bitnum - self.dom_edge_bcount
+        schedule = self.schedule
+        while n >= len(schedule):
+            schedule.append(int(self.bit_width * len(schedule) + self.sample_point))
+        return self.dom_edge_snum + schedule[n]
 
     def is_stuff_bit(self):
         # CAN uses NRZ encoding and bit stuffing.
@@ -201,8 +240,7 @@ class Decoder(srd.Decoder):
         if self.fd and len(self.bits) > self.last_databit + 1:
             return False
 
-        last_6_bits = self.rawbits[-6:]
-        if last_6_bits not in ([0, 0, 0, 0, 0, 1], [1, 1, 1, 1, 1, 0]):
+        if self.run_len != 1 or self.prev_run_len < 5:
             return False
 
         self.stuff_count = self.stuff_count + 1
@@ -212,7 +250,22 @@ class Decoder(srd.Decoder):
         return True
 
     def is_valid_crc(self, crc_bits,crc_type):
-        return True # TODO
+        if not self.fd:
+            # CRC-15 over the (destuffed) bits from SOF to the end of data.
+            crc = Crc(*CRC15_CAN)
+            crc.update_bits(self.bits[:self.last_databit + 1])
+            return crc.value == bitpack_msb(crc_bits)
+
+        # ISO CAN FD: CRC-17/21 with the MSB preset, over the bits from SOF
+        # to the end of data including the dynamic stuff bits, followed by
+        # the stuff count and its parity bit (fixed stuff bits excluded).
+        params = CRC17_CANFD if crc_type == 'CRC-17' else CRC21_CANFD
+        width, poly = params[0], params[1]
+        crc = Crc(width, poly, 1 << (width - 1))
+        num_stuff_bits = len(self.rawbits) - len(self.bits)
+        crc.update_bits(self.rawbits[:self.last_databit + num_stuff_bits + 1])
+        crc.update_bits(self.bits[self.last_databit + 2:self.last_databit + 6])
+        return crc.value == self.crc
 
     def decode_error_frame(self, bits):
         pass # TODO
@@ -238,7 +291,7 @@ class Decoder(srd.Decoder):
                     self.crc_len = 27 # 17 + SBC + stuff bits
                 else:
                     self.crc_len = 32 # 21 + SBC + stuff bits
-                self.putx([15, ['Fixed stuff bit: %d' % can_rx, 'FSB: %d' % can_rx, '%d' % can_rx]])
+                self.putx([15, Tpl.FSB + can_rx])
             else:
                 self.crc_len = 15
 
@@ -279,7 +332,7 @@ class Decoder(srd.Decoder):
         elif self.fd and bitnum > (self.last_databit + 5) and bitnum < (self.last_databit + self.crc_len):
             index = bitnum - (self.last_databit + 5)
             if((index-1)%5 == 0):
-                self.putx([15, ['Fixed stuff bit: %d' % can_rx, 'FSB: %d' % can_rx, '%d' % can_rx]])
+                self.putx([15, Tpl.FSB + can_rx])
             if(index%5 == 0):
                 self.crc_data += self.bits[-4:]
 
@@ -300,8 +353,7 @@ class Decoder(srd.Decoder):
                 self.crc = bitpack_msb(self.crc_data)
             else:
                 self.crc = bitpack_msb(crc_bits)
-            self.putb([11, ['%s sequence: 0x%04x' % (crc_type, self.crc),
-                            '%s: 0x%04x' % (crc_type, self.crc), '0x%04x' % self.crc]])
+            self.putb([11, Tpl.CRC + CRC_TYPES.index(crc_type), self.crc])
             if not self.is_valid_crc(crc_bits,crc_type):
                 self.putb([16, ['CRC is invalid']])
 
@@ -334,7 +386,7 @@ class Decoder(srd.Decoder):
         # End of frame (EOF), 7 recessive bits
         elif bitnum == (self.last_databit + self.crc_len + 10):
             self.putb([2, ['End of frame', 'EOF', 'E']])
-            if self.rawbits[-7:] != [1, 1, 1, 1, 1, 1, 1]:
+            if self.run_level != 1 or self.run_len < 7:
                 self.putb([16, ['End of frame (EOF) must be 7 recessive bits']])
             self.es_packet = self.samplenum
             py_data = tuple([self.frame_type, self.fullid, self.rtr_type,
@@ -412,8 +464,7 @@ class Decoder(srd.Decoder):
                 self.frame_bytes.append(b)
                 ss = self.ss_databytebits[i * 8]
                 es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), '0x%02x' % b]])
+                self.putg(ss, es, [0, Tpl.DATA + i, b])
             self.ss_databytebits = []
 
         elif bitnum > self.last_databit:
@@ -432,14 +483,10 @@ class Decoder(srd.Decoder):
         # Bits 14-31: Extended identifier (EID[17..0])
         elif bitnum == 31:
             self.eid = bitpack_msb(self.bits[14:])
-            s = '%d (0x%x)' % (self.eid, self.eid)
-            self.putb([4, ['Extended Identifier: %s' % s,
-                           'Extended ID: %s' % s, 'Extended ID', '%s' % s]])
+            self.putb([4, Tpl.EXT_ID, self.eid])
 
             self.fullid = self.ident << 18 | self.eid
-            s = '%d (0x%x)' % (self.fullid, self.fullid)
-            self.putb([5, ['Full Identifier: %s' % s, 'Full ID: %s' % s,
-                           '%s' %s]])
+            self.putb([5, Tpl.FULL_ID, self.fullid])
 
             # Bit 12: Substitute remote request (SRR) bit
             self.put12([9, ['Substitute remote request: %d' % self.bits[12],
@@ -516,8 +563,7 @@ class Decoder(srd.Decoder):
                 self.frame_bytes.append(b)
                 ss = self.ss_databytebits[i * 8]
                 es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), '0x%02x' % b]])
+                self.putg(ss, es, [0, Tpl.DATA + i, b])
             self.ss_databytebits = []
 
         elif bitnum > self.last_databit:
@@ -526,6 +572,11 @@ class Decoder(srd.Decoder):
         return False
 
     def handle_bit(self, can_rx):
+        if can_rx == self.run_level:
+            self.run_len += 1
+        else:
+            self.prev_run_len, self.run_len = self.run_len, 1
+            self.run_level = can_rx
         self.rawbits.append(can_rx)
         self.bits.append(can_rx)
 
@@ -539,11 +590,11 @@ class Decoder(srd.Decoder):
                 self.set_fast_bitrate()
 
         if self.is_stuff_bit():
-            self.putx([15, [str(can_rx)]])
+            self.putx([15, BIT_TEXTS[can_rx]])
             self.curbit += 1 # Increase self.curbit (bitnum is not affected).
             return
         else:
-            self.putx([17, [str(can_rx)]])
+            self.putx([17, BIT_TEXTS[can_rx]])
 
         # Bit 0: Start of frame (SOF) bit
         if bitnum == 0:
@@ -564,8 +615,7 @@ class Decoder(srd.Decoder):
             # part of its boiler plate!
             self.ident = bitpack_msb(self.bits[1:])
             self.fullid = self.ident
-            s = '%d (0x%x)' % (self.ident, self.ident),
-            self.putb([3, ['Identifier: %s' % s, 'ID: %s' % s, '%s' % s]])
+            self.putb([3, Tpl.ID, self.ident])
             if (self.ident & 0x7f0) == 0x7f0:
                 self.putb([16, ['Identifier bits 10..4 must not be all recessive']])
 
@@ -596,25 +646,54 @@ class Decoder(srd.Decoder):
 
         self.curbit += 1
 
+    def start_frame(self):
+        self.sof = self.samplenum
+        self.dom_edge_seen(force = True)
+        self.state = 'GET BITS'
+
+    # The line was at 'level' from the previous edge up to the current
+    # sample, where it's 'can_rx' ('edge' is set if it changed here).
+    # Take all bits whose sample points are in this run at once.
+    def handle_run(self, level, can_rx, edge):
+        samplenum = self.samplenum
+        while self.state == 'GET BITS':
+            pos = self.get_sample_point(self.curbit)
+            if pos >= samplenum:
+                break
+            self.samplenum = pos
+            self.handle_bit(level)
+        self.samplenum = samplenum
+
+        if self.state == 'IDLE':
+            # The frame ended within the run, a falling edge here
+            # is the start of the next one.
+            if edge and can_rx == 0:
+                self.start_frame()
+            return
+
+        # Hard synchronization on recessive to dominant edges.
+        if edge and can_rx == 0:
+            self.dom_edge_seen()
+        if pos == samplenum:
+            self.handle_bit(can_rx)
+
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
 
+        level = 1
         while True:
             # State machine.
             if self.state == 'IDLE':
                 # Wait for a dominant state (logic 0) on the bus.
-                
                 (can_rx,) = self.wait({0: 'f'})
-                self.sof = self.samplenum
-                self.dom_edge_seen(force = True)
-                self.state = 'GET BITS'
+                self.start_frame()
             elif self.state == 'GET BITS':
-                # Wait until we're in the correct bit/sampling position.
-                
-                pos = self.get_sample_point(self.curbit)
-                (can_rx,) = self.wait([{'skip': pos - self.samplenum}, {0: 'f'}])
-                if (self.matched & (0b1 << 1)):
-                    self.dom_edge_seen()
-                if (self.matched & (0b1 << 0)):
-                    self.handle_bit(can_rx)
+                # Rather than waiting for each bit's sample point, wait for
+                # the next edge and derive the bits from the run's length.
+                # Don't wait longer than a few bits, the line doesn't change
+                # at the end of a frame.
+                pos = self.get_sample_point(self.curbit + RUN_BITS)
+                (can_rx,) = self.wait([{0: 'e'}, {'skip': pos - self.samplenum}])
+                self.handle_run(level, can_rx, self.matched & (0b1 << 0))
+            level = can_rx
@@ -25,14 +25,66 @@
 ##
 
 from common.srdhelper import bitpack_msb
+from common.srdhelper.crc import Crc, CRC15_CAN
 import sigrokdecode as srd
 
 class SamplerateError(Exception):
     pass
 
+# Wait for the next edge, or for the sample point this many bits ahead.
+RUN_BITS = 10
+
 def dlc2len(dlc):
     return [0, 1, 2, 3, 4, 5, 6, 7, 8, 12, 16, 20, 24, 32, 48, 64][dlc]
 
+def bit_templates(long, short):
+    return tuple(('%s: %d' % (long, b), '%s: %d' % (short, b), '%d' % b) for b in (0, 1))
+
+# Annotation templates, put as [class, template, value...]. Texts which
+# depend on a small number (byte index, DLC, bit) have a template per
+# value, others have the value formatted by the frontend.
+class Tpl:
+    DATA = 0                # + byte index
+    ID = DATA + 8
+    EXT_ID = ID + 1
+    FULL_ID = EXT_ID + 1
+    CRC = FULL_ID + 1
+    DLC = CRC + 1           # + DLC
+    RB0 = DLC + 16          # + bit
+    RB1 = RB0 + 2
+    SRR = RB1 + 2
+    CRC_DELIM = SRR + 2
+    ACK_DELIM = CRC_DELIM + 2
+    ACK = ACK_DELIM + 2     # + bit: ACK, NACK
+    RTR = ACK + 2           # + bit: data, remote
+    IDE = RTR + 2           # + bit: standard, extended
+
+# The numbers keep their fixed formats, whatever the display format:
+# identifiers in decimal and hex, data bytes and CRCs in padded hex.
+ID_TEXT = '{$0:d} (0x{$0:x})'
+
+templates = \
+    tuple(('Data byte %d: 0x{$0:02x}' % i, 'DB %d: 0x{$0:02x}' % i, '0x{$0:02x}')
+          for i in range(8)) + (
+    ('Identifier: %s' % ID_TEXT, 'ID: %s' % ID_TEXT, ID_TEXT),
+    ('Extended Identifier: %s' % ID_TEXT, 'Extended ID: %s' % ID_TEXT,
+     'Extended ID', ID_TEXT),
+    ('Full Identifier: %s' % ID_TEXT, 'Full ID: %s' % ID_TEXT, ID_TEXT),
+    ('CRC-15 sequence: 0x{$0:04x}', 'CRC-15: 0x{$0:04x}', '0x{$0:04x}'),
+    ) + tuple(('Data length code: %d' % d, 'DLC: %d' % d, '%d' % d) for d in range(16)) + \
+    bit_templates('Reserved bit 0', 'RB0') + \
+    bit_templates('Reserved bit 1', 'RB1') + \
+    bit_templates('Substitute remote request', 'SRR') + \
+    bit_templates('CRC delimiter', 'CRC d') + \
+    bit_templates('ACK delimiter', 'ACK d') + \
+    tuple(('ACK slot: %s' % a, 'ACK s: %s' % a, a) for a in ('ACK', 'NACK')) + \
+    tuple(('Remote transmission request: %s frame' % r, 'RTR: %s frame' % r, r)
+          for r in ('data', 'remote')) + \
+    tuple(('Identifier extension bit: %s frame' % f, 'IDE: %s frame' % f, f)
+          for f in ('standard', 'extended'))
+
+BIT_TEXTS = (['0'], ['1'])
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'can'
@@ -75,6 +127,7 @@ class Decoder(srd.Decoder):
         ('fields', 'Fields', tuple(range(15))),
         ('warnings', 'Warnings', (16,)),
     )
+    annotation_templates = templates
 
     def __init__(self):
         self.reset()
@@ -92,6 +145,7 @@ class Decoder(srd.Decoder):
             self.samplerate = value
             self.bit_width = float(self.samplerate) / float(self.options['bitrate'])
             self.sample_point = (self.bit_width / 100.0) * self.options['sample_point']
+            self.schedule = []
 
     # Generic helper for CAN bit annotations.
     def putg(self, ss, es, data):
@@ -120,8 +174,10 @@ class Decoder(srd.Decoder):
     def reset_variables(self):
         self.state = 'IDLE'
         self.sof = self.frame_type = self.dlc = None
-        self.rawbits = [] # All bits, including stuff bits
         self.bits = [] # Only actual CAN frame bits (no stuff bits)
+        # Runs of identical bits (including stuff bits).
+        self.run_level = None
+        self.run_len = self.prev_run_len = 0
         self.curbit = 0 # Current bit of CAN frame (bit 0 == SOF)
         self.last_databit = 999 # Positive value that bitnum+x will never match
         self.ss_block = None
@@ -141,12 +197,14 @@ class Decoder(srd.Decoder):
         self.dom_edge_snum = self.samplenum
         self.dom_edge_bcount = self.curbit
 
-    # Determine the position of the next desired bit's sample point.
+    # Determine the position of the next desired bit's sample point. The
+    # offsets from the last synchronization are calculated once.
     def get_sample_point(self, bitnum):
-        samplenum = self.dom_edge_snum
-        samplenum += self.bit_width * (bitnum - self.dom_edge_bcount)
-        samplenum += self.sample_point
-        return int(samplenum)
+        n = bitnum - self.dom_edge_bcount
+        schedule = self.schedule
+        while n >= len(schedule):
+            schedule.append(int(self.bit_width * len(schedule) + self.sample_point))
+        return self.dom_edge_snum + schedule[n]
 
     def is_stuff_bit(self):
         # CAN uses NRZ encoding and bit stuffing.
@@ -154,18 +212,20 @@ class Decoder(srd.Decoder):
         # But not in the CRC delimiter, ACK, and end of frame fields.
         if len(self.bits) > self.last_databit + 17:
             return False
-        last_6_bits = self.rawbits[-6:]
-        if last_6_bits in ([1, 1, 1, 1, 1, 1], [0, 0, 0, 0, 0, 0]):
+        if self.run_len >= 6:
             self.putx([16, ['Stuff Error' ,'Error','E']])
-        if last_6_bits not in ([0, 0, 0, 0, 0, 1], [1, 1, 1, 1, 1, 0]):
+        if self.run_len != 1 or self.prev_run_len < 5:
             return False
 
-        # Stuff bit. Keep it in self.rawbits, but drop it from self.bits.
+        # Stuff bit. Drop it from self.bits.
         self.bits.pop() # Drop last bit.
         return True
 
     def is_valid_crc(self, crc_bits):
-        return True # TODO
+        # CRC-15 over the (destuffed) bits from SOF to the end of data.
+        crc = Crc(*CRC15_CAN)
+        crc.update_bits(self.bits[:self.last_databit + 1])
+        return crc.value == bitpack_msb(crc_bits)
 
     def decode_error_frame(self, bits):
         pass # TODO
@@ -185,32 +245,26 @@ class Decoder(srd.Decoder):
 
         # CRC sequence (15 bits, 17 bits or 21 bits)
         elif bitnum == (self.last_databit + self.crc_len):
-            crc_type = "CRC-15"
-
             x = self.last_databit + 1
             crc_bits = self.bits[x:x + self.crc_len + 1]
             self.crc = bitpack_msb(crc_bits)
-            self.putb([11, ['%s sequence: 0x%04x' % (crc_type, self.crc),
-                            '%s: 0x%04x' % (crc_type, self.crc), '0x%04x' % self.crc]])
+            self.putb([11, Tpl.CRC, self.crc])
             if not self.is_valid_crc(crc_bits):
                 self.putb([16, ['CRC is invalid']])
 
         # CRC delimiter bit (recessive)
         elif bitnum == (self.last_databit + self.crc_len + 1):
-            self.putx([12, ['CRC delimiter: %d' % can_rx,
-                            'CRC d: %d' % can_rx, '%d' % can_rx]])
+            self.putx([12, Tpl.CRC_DELIM + can_rx])
             if can_rx != 1:
                 self.putx([16, ['CRC delimiter must be a recessive bit']])
 
         # ACK slot bit (dominant: ACK, recessive: NACK)
         elif bitnum == (self.last_databit + self.crc_len + 2):
-            ack = 'ACK' if can_rx == 0 else 'NACK'
-            self.putx([13, ['ACK slot: %s' % ack, 'ACK s: %s' % ack, '%s' % ack]])
+            self.putx([13, Tpl.ACK + can_rx])
 
         # ACK delimiter bit (recessive)
         elif bitnum == (self.last_databit + self.crc_len + 3):
-            self.putx([14, ['ACK delimiter: %d' % can_rx,
-                            'ACK d: %d' % can_rx, '%d' % can_rx]])
+            self.putx([14, Tpl.ACK_DELIM + can_rx])
             if can_rx != 1:
                 self.putx([16, ['ACK delimiter must be a recessive bit']])
 
@@ -221,7 +275,7 @@ class Decoder(srd.Decoder):
         # End of frame (EOF), 7 recessive bits
         elif bitnum == (self.last_databit + self.crc_len + 10):
             self.putb([2, ['End of frame', 'EOF', 'E']])
-            if self.rawbits[-7:] != [1, 1, 1, 1, 1, 1, 1]:
+            if self.run_level != 1 or self.run_len < 7:
                 self.putb([16, ['End of frame (EOF) must be 7 recessive bits']])
             self.es_packet = self.samplenum
             py_data = tuple([self.frame_type, self.fullid, self.rtr_type,
@@ -237,12 +291,9 @@ class Decoder(srd.Decoder):
 
         # Bit 14: RB0 (Reserved bit 0)
         if bitnum == 14:
-            self.putx([7, ['Reserved bit 0: %d' % can_rx,
-                           'RB0: %d' % can_rx, '%d' % can_rx]])
-            rtr = 'remote' if self.bits[12] == 1 else 'data'
-            self.put12([8, ['Remote transmission request: %s frame' % rtr,
-                            'RTR: %s frame' % rtr, '%s' % rtr]])
-            self.rtr_type = rtr
+            self.putx([7, Tpl.RB0 + can_rx])
+            self.put12([8, Tpl.RTR + self.bits[12]])
+            self.rtr_type = 'remote' if self.bits[12] == 1 else 'data'
             self.dlc_start = 15
 
         # Remember start of DLC (see below).
@@ -252,8 +303,7 @@ class Decoder(srd.Decoder):
         # Bits 15-18: Data length code (DLC), in number of bytes (0-8).
         elif bitnum == self.dlc_start + 3:
             self.dlc = bitpack_msb(self.bits[self.dlc_start:self.dlc_start + 4])
-            self.putb([10, ['Data length code: %d' % self.dlc,
-                            'DLC: %d' % self.dlc, '%d' % self.dlc]])
+            self.putb([10, Tpl.DLC + self.dlc])
             self.last_databit = self.dlc_start + 3 + (dlc2len(self.dlc) * 8)
             #if rtr == remote then dlc = 0
             if self.dlc != 0 and self.rtr_type == 'remote':
@@ -281,8 +331,7 @@ class Decoder(srd.Decoder):
                 self.frame_bytes.append(b)
                 ss = self.ss_databytebits[i * 8]
                 es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), '0x%02x' % b]])
+                self.putg(ss, es, [0, Tpl.DATA + i, b])
             self.ss_databytebits = []
 
         elif bitnum > self.last_databit:
@@ -301,18 +350,13 @@ class Decoder(srd.Decoder):
         # Bits 14-31: Extended identifier (EID[17..0])
         elif bitnum == 31:
             self.eid = bitpack_msb(self.bits[14:])
-            s = '%d (0x%x)' % (self.eid, self.eid)
-            self.putb([4, ['Extended Identifier: %s' % s,
-                           'Extended ID: %s' % s, 'Extended ID', '%s' % s]])
+            self.putb([4, Tpl.EXT_ID, self.eid])
 
             self.fullid = self.ident << 18 | self.eid
-            s = '%d (0x%x)' % (self.fullid, self.fullid)
-            self.putb([5, ['Full Identifier: %s' % s, 'Full ID: %s' % s,
-                           '%s' % s]])
+            self.putb([5, Tpl.FULL_ID, self.fullid])
 
             # Bit 12: Substitute remote request (SRR) bit
-            self.put12([9, ['Substitute remote request: %d' % self.bits[12],
-                            'SRR: %d' % self.bits[12], '%d' % self.bits[12]]])
+            self.put12([9, Tpl.SRR + self.bits[12]])
 
         # Bit 32: Remote transmission request (RTR) bit
         # Data frame: dominant, remote frame: recessive
@@ -322,20 +366,16 @@ class Decoder(srd.Decoder):
         if bitnum == 32:
             self.ss_bit32 = self.samplenum
             self.rtr = can_rx
-            rtr = 'remote' if can_rx == 1 else 'data'
-            self.putx([8, ['Remote transmission request: %s frame' % rtr,
-                      'RTR: %s frame' % rtr, '%s' % rtr]])
-            self.rtr_type = rtr
+            self.putx([8, Tpl.RTR + can_rx])
+            self.rtr_type = 'remote' if can_rx == 1 else 'data'
 
         # Bit 33: RB1 (reserved bit)
         elif bitnum == 33:
-            self.putx([7, ['Reserved bit 1: %d' % can_rx,
-                           'RB1: %d' % can_rx, '%d' % can_rx]])
+            self.putx([7, Tpl.RB1 + can_rx])
 
         # Bit 34: RB0 (reserved bit)
         elif bitnum == 34:
-            self.putx([7, ['Reserved bit 0: %d' % can_rx,
-                           'RB0: %d' % can_rx, '%d' % can_rx]])
+            self.putx([7, Tpl.RB0 + can_rx])
 
         # Remember start of DLC (see below).
         elif bitnum == self.dlc_start:
@@ -344,8 +384,7 @@ class Decoder(srd.Decoder):
         # Bits 35-38: Data length code (DLC), in number of bytes (0-8).
         elif bitnum == self.dlc_start + 3:
             self.dlc = bitpack_msb(self.bits[self.dlc_start:self.dlc_start + 4])
-            self.putb([10, ['Data length code: %d' % self.dlc,
-                            'DLC: %d' % self.dlc, '%d' % self.dlc]])
+            self.putb([10, Tpl.DLC + self.dlc])
             self.last_databit = self.dlc_start + 3 + (dlc2len(self.dlc) * 8)
             #if rtr == remote then dlc = 0
             if self.dlc != 0 and self.rtr_type == 'remote':
@@ -370,8 +409,7 @@ class Decoder(srd.Decoder):
                 self.frame_bytes.append(b)
                 ss = self.ss_databytebits[i * 8]
                 es = self.ss_databytebits[((i + 1) * 8) - 1]
-                self.putg(ss, es, [0, ['Data byte %d: 0x%02x' % (i, b),
-                                       'DB %d: 0x%02x' % (i, b), '0x%02x' % b]])
+                self.putg(ss, es, [0, Tpl.DATA + i, b])
             self.ss_databytebits = []
 
         elif bitnum > self.last_databit:
@@ -380,7 +418,11 @@ class Decoder(srd.Decoder):
         return False
 
     def handle_bit(self, can_rx):
-        self.rawbits.append(can_rx)
+        if can_rx == self.run_level:
+            self.run_len += 1
+        else:
+            self.prev_run_len, self.run_len = self.run_len, 1
+            self.run_level = can_rx
         self.bits.append(can_rx)
 
         # Get the index of the current CAN frame bit (without stuff bits).
@@ -388,11 +430,11 @@ class Decoder(srd.Decoder):
 
         # If this is a stuff bit, remove it from self.bits and ignore it.
         if self.is_stuff_bit():
-            self.putx([15, [str(can_rx)]])
+            self.putx([15, BIT_TEXTS[can_rx]])
             self.curbit += 1 # Increase self.curbit (bitnum is not affected).
             return
         else:
-            self.putx([17, [str(can_rx)]])
+            self.putx([17, BIT_TEXTS[can_rx]])
 
         # Bit 0: Start of frame (SOF) bit
         if bitnum == 0:
@@ -412,8 +454,7 @@ class Decoder(srd.Decoder):
             # part of its boiler plate!
             self.ident = bitpack_msb(self.bits[1:])
             self.fullid = self.ident
-            s = '%d (0x%x)' % (self.ident, self.ident),
-            self.putb([3, ['Identifier: %s' % s, 'ID: %s' % s, '%s' % s]])
+            self.putb([3, Tpl.ID, self.ident])
             if (self.ident & 0x7f0) == 0x7f0:
                 self.putb([16, ['Identifier bits 10..4 must not be all recessive']])
 
@@ -425,9 +466,8 @@ class Decoder(srd.Decoder):
         # Bit 13: Identifier extension (IDE) bit
         # Standard frame: dominant, extended frame: recessive
         elif bitnum == 13:
-            ide = self.frame_type = 'standard' if can_rx == 0 else 'extended'
-            self.putx([6, ['Identifier extension bit: %s frame' % ide,
-                           'IDE: %s frame' % ide, '%s' % ide]])
+            self.frame_type = 'standard' if can_rx == 0 else 'extended'
+            self.putx([6, Tpl.IDE + can_rx])
 
         # Bits 14-X: Frame-type dependent, passed to the resp. handlers.
         elif bitnum >= 14:
@@ -445,23 +485,54 @@ class Decoder(srd.Decoder):
 
         self.curbit += 1
 
+    def start_frame(self):
+        self.sof = self.samplenum
+        self.dom_edge_seen(force = True)
+        self.state = 'GET BITS'
+
+    # The line was at 'level' from the previous edge up to the current
+    # sample, where it's 'can_rx' ('edge' is set if it changed here).
+    # Take all bits whose sample points are in this run at once.
+    def handle_run(self, level, can_rx, edge):
+        samplenum = self.samplenum
+        while self.state == 'GET BITS':
+            pos = self.get_sample_point(self.curbit)
+            if pos >= samplenum:
+                break
+            self.samplenum = pos
+            self.handle_bit(level)
+        self.samplenum = samplenum
+
+        if self.state == 'IDLE':
+            # The frame ended within the run, a falling edge here
+            # is the start of the next one.
+            if edge and can_rx == 0:
+                self.start_frame()
+            return
+
+        # Hard synchronization on recessive to dominant edges.
+        if edge and can_rx == 0:
+            self.dom_edge_seen()
+        if pos == samplenum:
+            self.handle_bit(can_rx)
+
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
 
+        level = 1
         while True:
             # State machine.
             if self.state == 'IDLE':
                 # Wait for a dominant state (logic 0) on the bus.
                 (can_rx,) = self.wait({0: 'f'})
-                self.sof = self.samplenum
-                self.dom_edge_seen(force = True)
-                self.state = 'GET BITS'
+                self.start_frame()
             elif self.state == 'GET BITS':
-                # Wait until we're in the correct bit/sampling position.
-                pos = self.get_sample_point(self.curbit)
-                (can_rx,) = self.wait([{'skip': pos - self.samplenum}, {0: 'f'}])
-                if (self.matched & (0b1 << 1)):
-                    self.dom_edge_seen()
-                if (self.matched & (0b1 << 0)):
-                    self.handle_bit(can_rx)
+                # Rather than waiting for each bit's sample point, wait for
+                # the next edge and derive the bits from the run's length.
+                # Don't wait longer than a few bits, the line doesn't change
+                # at the end of a frame.
+                pos = self.get_sample_point(self.curbit + RUN_BITS)
+                (can_rx,) = self.wait([{0: 'e'}, {'skip': pos - self.samplenum}])
+                self.handle_run(level, can_rx, self.matched & (0b1 << 0))
+            level = can_rx
@@ -0,0 +1,231 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+objdump disassembly of an ELF file, for the trace decoders.
+
+parse() turns the output of 'objdump -lSC' (or similar options) into
+sorted tables: the instructions with their text and branch targets, and
+address ranges for the source locations (file:line), source code lines
+and functions. A range covers consecutive instructions with the same
+value, so a function costs one entry instead of one per instruction.
+Ranges are looked up with bisect:
+
+    d = load('arm-none-eabi-objdump', ['-lSC'], 'firmware.elf')
+    d.functions.get(pc), d.locations.get(pc), d.sources.get(pc)
+    d.text(pc), d.next_instr(pc)
+
+load() runs objdump and keeps the tables in an on-disk cache, keyed by
+the contents of the ELF file, the objdump command and its options.
+Decoding another trace of the same firmware skips objdump and parsing.
+'''
+
+from array import array
+from bisect import bisect_left, bisect_right
+import gzip
+import hashlib
+import json
+import os
+import re
+import subprocess
+
+# Bump when the parser or the cache layout changes.
+CACHE_VERSION = 2
+
+instpat = re.compile(r'\s*([0-9a-fA-F]+):\t+([0-9a-fA-F ]+)\t+([a-zA-Z][^;]+)\s*;?.*')
+branchpat = re.compile(r'(b|bl|b..|bl..|cbnz|cbz)(?:\.[wn])?\s+(?:r[0-9]+,\s*)?([0-9a-fA-F]+)')
+filepat = re.compile(r'[^\s]+[/\\]([a-zA-Z0-9._-]+:[0-9]+)(?:\s.*)?')
+funcpat = re.compile(r'[0-9a-fA-F]+\s*<([^>]+)>:.*')
+
+class RangeTable:
+    '''Values for sorted, non-overlapping address ranges [start, end).'''
+
+    def __init__(self, starts=(), ends=(), values=()):
+        self.starts = array('Q', starts)
+        self.ends = array('Q', ends)
+        self.values = list(values)
+
+    def add(self, start, end, value):
+        # Ranges are added in address order, adjacent ones with the same
+        # value are merged.
+        if self.values and self.ends[-1] == start and self.values[-1] == value:
+            self.ends[-1] = end
+        else:
+            self.starts.append(start)
+            self.ends.append(end)
+            self.values.append(value)
+
+    def get(self, addr, default=None):
+        i = bisect_right(self.starts, addr) - 1
+        if i >= 0 and addr < self.ends[i]:
+            return self.values[i]
+        return default
+
+    def __len__(self):
+        return len(self.values)
+
+    def to_json(self):
+        return [self.starts.tolist(), self.ends.tolist(), self.values]
+
+class Disassembly:
+    def __init__(self):
+        self.addrs = array('Q')
+        self.sizes = array('H')
+        # Branch target, the next address for other instructions.
+        self.targets = array('Q')
+        self.texts = []
+        self.locations = RangeTable()
+        self.sources = RangeTable()
+        self.functions = RangeTable()
+
+    def index(self, addr):
+        i = bisect_left(self.addrs, addr)
+        if i < len(self.addrs) and self.addrs[i] == addr:
+            return i
+        return None
+
+    def text(self, addr):
+        '''Disassembly of the instruction at 'addr'.'''
+        i = self.index(addr)
+        return None if i is None else self.texts[i]
+
+    def next_instr(self, addr):
+        '''(next address in sequence, next address if a branch is taken)
+        of the instruction at 'addr', None if there is none.'''
+        i = self.index(addr)
+        if i is None:
+            return None
+        return (addr + self.sizes[i], self.targets[i])
+
+    def to_json(self):
+        return {
+            'version': CACHE_VERSION,
+            'addrs': self.addrs.tolist(),
+            'sizes': self.sizes.tolist(),
+            'targets': self.targets.tolist(),
+            'texts': self.texts,
+            'locations': self.locations.to_json(),
+            'sources': self.sources.to_json(),
+            'functions': self.functions.to_json(),
+        }
+
+    @classmethod
+    def from_json(cls, doc):
+        if doc.get('version') != CACHE_VERSION:
+            raise ValueError('cache version')
+        d = cls()
+        d.addrs = array('Q', doc['addrs'])
+        d.sizes = array('H', doc['sizes'])
+        d.targets = array('Q', doc['targets'])
+        d.texts = doc['texts']
+        d.locations = RangeTable(*doc['locations'])
+        d.sources = RangeTable(*doc['sources'])
+        d.functions = RangeTable(*doc['functions'])
+        return d
+
+def parse(disasm):
+    '''Parse the objdump output text.'''
+    insts = []
+    prev_src = ''
+    prev_file = ''
+    prev_func = ''
+
+    for line in disasm.split('\n'):
+        m = instpat.match(line)
+        if m:
+            addr = int(m.group(1), 16)
+            raw = m.group(2)
+            text = m.group(3).strip().replace('\t', ' ')
+            size = len(raw.replace(' ', '')) // 2
+            # Next address if a branch is taken.
+            bm = branchpat.match(text)
+            target = int(bm.group(2), 16) if bm else addr + size
+            insts.append((addr, size, target, text, prev_file, prev_src, prev_func))
+        else:
+            m = funcpat.match(line)
+            if m:
+                prev_func = m.group(1)
+                prev_src = None
+            else:
+                m = filepat.match(line)
+                if m:
+                    prev_file = m.group(1)
+                    prev_src = None
+                else:
+                    prev_src = line.strip()
+
+    d = Disassembly()
+    # The sort is stable, of the entries for an address the last one is
+    # kept (it overwrote the others in the lookup dicts this replaces).
+    insts.sort(key=lambda i: i[0])
+    for n, (addr, size, target, text, loc, src, func) in enumerate(insts):
+        if n + 1 < len(insts) and insts[n + 1][0] == addr:
+            continue
+        d.addrs.append(addr)
+        d.sizes.append(size)
+        d.targets.append(target)
+        d.texts.append(text)
+        end = addr + max(size, 1)
+        d.locations.add(addr, end, loc)
+        d.sources.add(addr, end, src)
+        d.functions.add(addr, end, func)
+    return d
+
+def cache_dir():
+    base = os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_CACHE_HOME') or \
+        os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'dsview', 'objdump')
+
+def cache_key(objdump, opts, elffile):
+    h = hashlib.sha256()
+    h.update(json.dumps([CACHE_VERSION, objdump, opts]).encode())
+    with open(elffile, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+def load(objdump, opts, elffile, cache=True):
+    '''Disassemble 'elffile' with objdump (command line options 'opts'),
+    return a Disassembly, None if objdump fails.'''
+    path = None
+    if cache:
+        try:
+            path = os.path.join(cache_dir(), cache_key(objdump, opts, elffile) + '.json.gz')
+            with gzip.open(path, 'rb') as f:
+                return Disassembly.from_json(json.loads(f.read().decode()))
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+    try:
+        disasm = subprocess.check_output([objdump] + opts + [elffile])
+    except (subprocess.CalledProcessError, OSError):
+        return None
+    d = parse(disasm.decode('utf-8', 'replace'))
+
+    if path:
+        # A failed write only costs the next decoder start some time.
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp = '%s.%d.tmp' % (path, os.getpid())
+            with gzip.open(tmp, 'wb', compresslevel=1) as f:
+                f.write(json.dumps(d.to_json(), separators=(',', ':')).encode())
+            os.replace(tmp, path)
+        except OSError:
+            pass
+    return d
@@ -0,0 +1,208 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Table driven CRC engine for protocol decoders.
+
+The parameters follow the usual CRC catalogue conventions (width, poly,
+init, reflect, xorout). 'reflect' applies to both the input and the output
+of the algorithm, which holds for all CRCs used by the decoders.
+
+Data can be fed as bytes, as a sequence of bits in the order they were
+seen on the wire, or as an integer holding a number of wire bits. Whole
+bytes always go through a 256 entry lookup table (shared between all
+engines with the same parameters), only trailing bits take the bit by bit
+path. The state is incremental, decoders can feed data as it arrives.
+
+    crc = Crc(*CRC16_MODBUS)
+    crc.update(b'\\x01\\x03\\x00\\x00\\x00\\x01')
+    crc.value   # 0x0a84
+'''
+
+import binascii
+import zlib
+
+# Parameter sets: (width, poly, init, reflect, xorout).
+CRC5_USB = (5, 0x05, 0x1f, True, 0x1f)
+CRC7_MMC = (7, 0x09, 0x00, False, 0x00)
+CRC15_CAN = (15, 0x4599, 0x0000, False, 0x0000)
+CRC16_USB = (16, 0x8005, 0xffff, True, 0xffff)
+CRC16_MODBUS = (16, 0x8005, 0xffff, True, 0x0000)
+CRC16_XMODEM = (16, 0x1021, 0x0000, False, 0x0000)
+# ISO 11898-1 CAN FD starts the CRC-17/21 with the MSB set, the catalogue
+# (and the original Bosch specification) uses zero.
+CRC17_CANFD = (17, 0x1685b, 0x00000, False, 0x00000)
+CRC21_CANFD = (21, 0x102899, 0x000000, False, 0x000000)
+CRC32 = (32, 0x04c11db7, 0xffffffff, True, 0xffffffff)
+
+def reflect_bits(value, width):
+    '''Return the lower 'width' bits of 'value' in reversed order.'''
+    if width <= 0:
+        return 0
+    return int(format(value & ((1 << width) - 1), '0%db' % width)[::-1], 2)
+
+_tables = {}
+
+def _crc_table(width, poly, reflect):
+    key = (width, poly, reflect)
+    table = _tables.get(key)
+    if table is not None:
+        return table
+    table = []
+    if reflect:
+        rpoly = reflect_bits(poly, width)
+        for i in range(256):
+            c = i
+            for _ in range(8):
+                c = (c >> 1) ^ rpoly if c & 1 else c >> 1
+            table.append(c)
+    else:
+        # Register is kept left aligned in at least 8 bits, which makes
+        # the byte wise update work for widths below 8 as well.
+        w = max(width, 8)
+        top, mask = 1 << (w - 1), (1 << w) - 1
+        apoly = poly << (w - width)
+        for i in range(256):
+            c = i << (w - 8)
+            for _ in range(8):
+                c = ((c << 1) ^ apoly) & mask if c & top else (c << 1) & mask
+            table.append(c)
+    _tables[key] = table
+    return table
+
+class Crc:
+    def __init__(self, width, poly, init=0, reflect=False, xorout=0):
+        self.width = width
+        self.poly = poly
+        self.init = init
+        self.reflect = reflect
+        self.xorout = xorout
+        self.table = _crc_table(width, poly, reflect)
+        if reflect:
+            self.rpoly = reflect_bits(poly, width)
+        else:
+            self.shift = max(width, 8) - width
+            self.apoly = poly << self.shift
+            self.mask = (1 << max(width, 8)) - 1
+            self.top = max(width, 8) - 1
+        # Use the C implementations of the Python library where possible.
+        params = (width, poly, init, reflect, xorout)
+        self.fast = {CRC32: 'crc32', CRC16_XMODEM: 'hqx'}.get(params)
+        self.reset()
+
+    def reset(self):
+        '''Restart the computation from the initial value.'''
+        init = self.init
+        if self.fast == 'crc32':
+            # zlib.crc32() takes and returns the final (xor'ed) value.
+            self.reg = init ^ self.xorout
+        elif self.reflect:
+            self.reg = reflect_bits(init, self.width)
+        else:
+            self.reg = init << self.shift
+
+    def update(self, data):
+        '''Feed bytes (or any iterable of byte values).'''
+        if self.fast == 'crc32':
+            self.reg = zlib.crc32(bytes(data), self.reg)
+            return
+        if self.fast == 'hqx':
+            self.reg = binascii.crc_hqx(bytes(data), self.reg)
+            return
+        table, reg = self.table, self.reg
+        if self.reflect:
+            for b in data:
+                reg = (reg >> 8) ^ table[(reg ^ b) & 0xff]
+        else:
+            s, mask = self.top - 7, self.mask
+            for b in data:
+                reg = ((reg << 8) & mask) ^ table[((reg >> s) ^ b) & 0xff]
+        self.reg = reg
+
+    def update_bit(self, bit):
+        '''Feed a single bit.'''
+        if self.fast == 'crc32':
+            self.reg ^= self.xorout
+        reg = self.reg
+        if self.reflect:
+            reg = (reg >> 1) ^ self.rpoly if (reg ^ bit) & 1 else reg >> 1
+        else:
+            msb = (reg >> self.top) & 1
+            reg = (reg << 1) & self.mask
+            if msb ^ bit:
+                reg ^= self.apoly
+        self.reg = reg
+        if self.fast == 'crc32':
+            self.reg ^= self.xorout
+
+    def update_bits(self, bits):
+        '''Feed a sequence of bits (0/1), in the order seen on the wire.'''
+        n = len(bits)
+        whole = n - (n % 8)
+        if whole:
+            if self.reflect:
+                data = bytes(sum(bits[i + j] << j for j in range(8))
+                             for i in range(0, whole, 8))
+            else:
+                data = bytes(sum(bits[i + j] << (7 - j) for j in range(8))
+                             for i in range(0, whole, 8))
+            self.update(data)
+        for i in range(whole, n):
+            self.update_bit(bits[i])
+
+    def update_word(self, value, nbits, lsb_first=False):
+        '''Feed 'nbits' wire bits that are held in an integer. The first
+        wire bit is the MSB of the value, or the LSB if 'lsb_first'.'''
+        value &= (1 << nbits) - 1
+        if lsb_first != self.reflect:
+            value = reflect_bits(value, nbits)
+            lsb_first = self.reflect
+        whole = nbits // 8
+        rest = nbits % 8
+        if lsb_first:
+            self.update(value.to_bytes(whole + 1, 'little')[:whole])
+            value >>= 8 * whole
+            for _ in range(rest):
+                self.update_bit(value & 1)
+                value >>= 1
+        else:
+            self.update((value >> rest).to_bytes(whole, 'big'))
+            for i in range(rest - 1, -1, -1):
+                self.update_bit((value >> i) & 1)
+
+    @property
+    def value(self):
+        '''The CRC of all data fed so far.'''
+        if self.fast:
+            return self.reg if self.fast == 'crc32' else self.reg ^ self.xorout
+        if self.reflect:
+            return self.reg ^ self.xorout
+        return (self.reg >> self.shift) ^ self.xorout
+
+def crc_bytes(params, data):
+    '''One-shot CRC of 'data' for one of the parameter sets above.'''
+    crc = Crc(*params)
+    crc.update(data)
+    return crc.value
+
+def crc_bits(params, bits):
+    '''One-shot CRC of a sequence of wire bits.'''
+    crc = Crc(*params)
+    crc.update_bits(bits)
+    return crc.value
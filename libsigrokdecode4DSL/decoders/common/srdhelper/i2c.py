@@ -0,0 +1,126 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+An I²C transaction (START to STOP), the <pdata> of the 'TRANSACTION'
+packets of the i2c decoder.
+
+The bytes on the bus, address bytes included (with their R/W bit), are
+kept in compact arrays, indexed by the byte number in the transaction:
+
+    t.data                  bytearray, the byte values
+    t.acks                  bytearray, ACK, NACK or NO_ACK (STOP instead
+                            of an ACK bit)
+    t.byte_ss, t.byte_es    array('Q'), samples of the bytes (ss/es of the
+                            'ADDRESS*' and 'DATA*' packets)
+    t.ack_ss, t.ack_es      array('Q'), samples of the ACK bits (0 when
+                            there is none)
+    t.ss, t.es              the START and the STOP condition
+
+A transaction holds one message per START and START REPEAT, which starts
+with an address byte (it's empty when the next START REPEAT or the STOP
+comes first):
+
+    len(t)                  number of messages
+    t.starts                array('Q'), samples of the START (REPEAT)s
+    t.span(m)               (first, end) byte numbers of message m,
+                            'first' is the address byte
+    t.address(m)            7-bit slave address, None for an empty message
+    t.address_packet(m)     <pdata> of the message's 'ADDRESS*' packet,
+                            which depends on the address format option
+    t.is_read(m)            True for a read
+    t.payload(m)            bytes after the address byte
+
+Decoders which also take the single packets get the 7-bit address from
+the 'BITS' packet of the address byte with address_from_bits(), the
+'ADDRESS*' packets carry the 7-bit or the 8-bit form depending on the i2c
+decoder's address format option.
+'''
+
+from array import array
+
+ACK, NACK, NO_ACK = 0, 1, 2
+
+def address_from_bits(bits):
+    '''7-bit slave address from the <pdata> of an address byte's 'BITS'
+    packet (index 0 is the R/W bit).'''
+    return sum(b[0] << i for i, b in enumerate(bits[1:8]))
+
+class Transaction:
+    __slots__ = ('ss', 'es', 'shifted', 'starts', 'heads', 'data', 'acks',
+                 'byte_ss', 'byte_es', 'ack_ss', 'ack_es')
+
+    def __init__(self, ss, shifted=False):
+        self.ss = ss
+        self.es = ss
+        # The 'ADDRESS*' packets carry the 7-bit address.
+        self.shifted = shifted
+        self.starts = array('Q')
+        # Byte number of the address byte of every message.
+        self.heads = array('L')
+        self.data = bytearray()
+        self.acks = bytearray()
+        self.byte_ss = array('Q')
+        self.byte_es = array('Q')
+        self.ack_ss = array('Q')
+        self.ack_es = array('Q')
+
+    # Called by the i2c decoder while the transaction is on the bus.
+
+    def add_start(self, ss):
+        self.starts.append(ss)
+        self.heads.append(len(self.data))
+
+    def add_byte(self, b, ss, es):
+        self.data.append(b)
+        self.acks.append(NO_ACK)
+        self.byte_ss.append(ss)
+        self.byte_es.append(es)
+        self.ack_ss.append(0)
+        self.ack_es.append(0)
+
+    def add_ack(self, nack, ss, es):
+        self.acks[-1] = nack
+        self.ack_ss[-1] = ss
+        self.ack_es[-1] = es
+
+    def __len__(self):
+        return len(self.starts)
+
+    def span(self, m):
+        end = self.heads[m + 1] if m + 1 < len(self.heads) else len(self.data)
+        return self.heads[m], end
+
+    def address(self, m=0):
+        first, end = self.span(m)
+        return self.data[first] >> 1 if first < end else None
+
+    def address_packet(self, m=0):
+        first, end = self.span(m)
+        if first == end:
+            return None
+        return self.data[first] >> 1 if self.shifted else self.data[first]
+
+    def is_read(self, m=0):
+        first, end = self.span(m)
+        return first < end and bool(self.data[first] & 1)
+
+    def payload(self, m=0):
+        first, end = self.span(m)
+        return bytes(self.data[first + 1:end])
@@ -0,0 +1,218 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Sparse image of a memory chip, rebuilt from the decoded accesses.
+
+Memory decoders feed every read, write and erase they decode into a
+MemoryImage. The image is kept in pages of 256 bytes which are only
+allocated when an access touches them. Per page it holds the contents,
+a bitmap of the known bytes (seen in a read, or set by a write or an
+erase), a bitmap of the dirty bytes (changed by a write or an erase in
+this capture) and the sample number and kind of the last access of every
+byte. Looking up an address is a dict lookup and an index, no matter how
+long the capture is.
+
+    image = MemoryImage(size=2048)
+    image.write(0x10, b'\x12\x34', ss)
+    image.get(0x11)             # 0x34, None if not known
+    image.last_access(0x11)     # (ss, WRITE)
+    image.dump()                # bytes from address 0 to the last known one
+'''
+
+from array import array
+
+READ, WRITE, ERASE = 1, 2, 3
+ACCESS_NAMES = {READ: 'read', WRITE: 'write', ERASE: 'erase'}
+
+PAGE_BITS = 8
+PAGE_SIZE = 1 << PAGE_BITS
+PAGE_MASK = PAGE_SIZE - 1
+PAGE_FULL = (1 << PAGE_SIZE) - 1
+
+def bit_runs(mask):
+    '''Yield (position, length) of the runs of set bits in 'mask'.'''
+    pos = 0
+    while mask:
+        low = (mask & -mask).bit_length() - 1
+        mask >>= low
+        pos += low
+        # Number of trailing ones.
+        n = (~mask & (mask + 1)).bit_length() - 1
+        yield pos, n
+        mask >>= n
+        pos += n
+
+class Page:
+    __slots__ = ('data', 'known', 'dirty', 'samples', 'kinds')
+
+    def __init__(self, fill=None, sample=0):
+        if fill is None:
+            self.data = bytearray(PAGE_SIZE)
+            self.known = self.dirty = 0
+            self.samples = array('Q', [0]) * PAGE_SIZE
+            self.kinds = bytearray(PAGE_SIZE)
+        else:
+            # All bytes erased to 'fill' at 'sample'.
+            self.data = bytearray([fill]) * PAGE_SIZE
+            self.known = self.dirty = PAGE_FULL
+            self.samples = array('Q', [sample]) * PAGE_SIZE
+            self.kinds = bytearray([ERASE]) * PAGE_SIZE
+
+class MemoryImage:
+    '''Sparse memory image. 'size' (in bytes, optional) makes addresses
+    wrap around at the end of the chip, 'erased' is the value of an
+    erased byte, which is also used for the unknown bytes of a dump.'''
+
+    def __init__(self, size=None, erased=0xff):
+        self.size = size
+        self.erased = erased
+        self.pages = {}
+        # (erased, sample) after erase_all(): pages which are not
+        # allocated yet hold erased bytes instead of unknown ones.
+        self.background = None
+
+    def page(self, num):
+        p = self.pages.get(num)
+        if p is None:
+            if self.background is None:
+                p = Page()
+            else:
+                p = Page(*self.background)
+            self.pages[num] = p
+        return p
+
+    def access(self, addr, data, kind, sample, wrap=0, program=False):
+        '''Record an access of 'data' starting at 'addr'. With 'wrap' the
+        addresses wrap around within the aligned block of that many
+        bytes (page writes). With 'program' the new value of a known
+        byte is the AND of the old one and the data (NOR flash).'''
+        n = len(data)
+        if wrap:
+            base, off = addr - addr % wrap, addr % wrap
+            if n > wrap:
+                # Only the last 'wrap' bytes end up in the block.
+                off = (off + n - wrap) % wrap
+                data, n = data[n - wrap:], wrap
+            if off + n > wrap:
+                # The rest continues at the start of the block.
+                head = wrap - off
+                self.access(base + off, data[:head], kind, sample, 0, program)
+                self.access(base, data[head:], kind, sample, 0, program)
+                return
+            addr = base + off
+        pos = 0
+        while pos < n:
+            a = addr + pos
+            if self.size:
+                a %= self.size
+            off = a & PAGE_MASK
+            cnt = min(PAGE_SIZE - off, n - pos)
+            if self.size:
+                cnt = min(cnt, self.size - a)
+            p = self.page(a >> PAGE_BITS)
+            bits = ((1 << cnt) - 1) << off
+            chunk = data[pos:pos + cnt]
+            if program and p.known & bits:
+                chunk = bytes(b & p.data[off + i] if (p.known >> (off + i)) & 1 else b
+                              for i, b in enumerate(chunk))
+            p.data[off:off + cnt] = chunk
+            p.known |= bits
+            if kind != READ:
+                p.dirty |= bits
+            p.samples[off:off + cnt] = array('Q', [sample]) * cnt
+            p.kinds[off:off + cnt] = bytes([kind]) * cnt
+            pos += cnt
+
+    def read(self, addr, data, sample):
+        self.access(addr, data, READ, sample)
+
+    def write(self, addr, data, sample, wrap=0):
+        self.access(addr, data, WRITE, sample, wrap)
+
+    def program(self, addr, data, sample, wrap=0):
+        '''NOR flash page program, which can only clear bits.'''
+        self.access(addr, data, WRITE, sample, wrap, True)
+
+    def erase(self, addr, length, sample):
+        self.access(addr, bytes([self.erased]) * length, ERASE, sample)
+
+    def erase_all(self, sample):
+        '''Chip erase, also when the size of the chip is not known.'''
+        self.pages = {}
+        self.background = (self.erased, sample)
+
+    def get(self, addr):
+        '''The value at 'addr', None if it's not known.'''
+        p = self.pages.get(addr >> PAGE_BITS)
+        if p is None:
+            return None if self.background is None else self.background[0]
+        off = addr & PAGE_MASK
+        return p.data[off] if (p.known >> off) & 1 else None
+
+    def last_access(self, addr):
+        '''(sample, kind) of the last access of 'addr', None if there
+        was none.'''
+        p = self.pages.get(addr >> PAGE_BITS)
+        if p is None:
+            return None if self.background is None else (self.background[1], ERASE)
+        off = addr & PAGE_MASK
+        return (p.samples[off], p.kinds[off]) if p.kinds[off] else None
+
+    def is_dirty(self, addr):
+        '''Whether 'addr' was written or erased in this capture.'''
+        p = self.pages.get(addr >> PAGE_BITS)
+        if p is None:
+            return self.background is not None
+        return bool((p.dirty >> (addr & PAGE_MASK)) & 1)
+
+    def runs(self, dirty=False):
+        '''Yield (addr, bytes) of the runs of known bytes (or of dirty
+        bytes only) in address order.'''
+        start, buf = None, None
+        for num in sorted(self.pages):
+            p = self.pages[num]
+            for off, n in bit_runs(p.dirty if dirty else p.known):
+                addr = (num << PAGE_BITS) + off
+                if buf is not None and start + len(buf) == addr:
+                    buf += p.data[off:off + n]
+                    continue
+                if buf is not None:
+                    yield start, bytes(buf)
+                start, buf = addr, bytearray(p.data[off:off + n])
+        if buf is not None:
+            yield start, bytes(buf)
+
+    def end_address(self):
+        '''One past the highest known address, 0 for an empty image.'''
+        if self.background is not None and self.size:
+            return self.size
+        for num in sorted(self.pages, reverse=True):
+            known = self.pages[num].known
+            if known:
+                return (num << PAGE_BITS) + known.bit_length()
+        return 0
+
+    def dump(self):
+        '''The image from address 0 to the highest known address, unknown
+        bytes read as erased ones.'''
+        image = bytearray([self.erased]) * self.end_address()
+        for addr, data in self.runs():
+            image[addr:addr + len(data)] = data
+        return bytes(image)
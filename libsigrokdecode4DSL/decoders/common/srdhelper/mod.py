@@ -17,6 +17,7 @@
 ## along with this program; if not, see <http://www.gnu.org/licenses/>.
 ##
 
+from array import array
 from enum import Enum, IntEnum, unique
 from itertools import chain
 import re
@@ -62,6 +63,47 @@ def bitunpack(num, minbits=0):
         minbits -= 1
     return tuple(res)
 
+def bitrev(num, count):
+    '''Reverse the order of the lower 'count' bits of a number.'''
+    if count <= 0:
+        return 0
+    return int(format(num & ((1 << count) - 1), '0%db' % count)[::-1], 2)
+
+class BitBuffer:
+    '''Accumulate bits of a serial stream in an integer, the first bit
+    received is the LSB. The start/end sample numbers of the bits are
+    kept in compact arrays (index them like the bits).'''
+
+    def __init__(self):
+        self.value = 0
+        self.count = 0
+        self.ss = array('Q')
+        self.es = array('Q')
+
+    def __len__(self):
+        return self.count
+
+    def append(self, bit, ss=0, es=0):
+        if bit:
+            self.value |= 1 << self.count
+        self.count += 1
+        self.ss.append(ss)
+        self.es.append(es)
+
+    def field(self, start, count):
+        '''Return 'count' bits from bit 'start' on, first bit is the LSB.'''
+        return (self.value >> start) & ((1 << count) - 1)
+
+    def field_msb(self, start, count):
+        '''Like field(), but the first bit is the MSB.'''
+        return bitrev(self.field(start, count), count)
+
+    def bitstr(self, start, count):
+        '''Return bits as a '0'/'1' string, in the order they were received.'''
+        if count <= 0:
+            return ''
+        return format(self.field(start, count), '0%db' % count)[::-1]
+
 @unique
 class SrdStrEnum(Enum):
     @classmethod
@@ -105,3 +147,23 @@ class SrdIntEnum(IntEnum):
     @classmethod
     def from_str(cls, name, s):
         return cls.from_list(name, s.split())
+
+# Option for decoders which annotate each single bit of a word. Bit rows
+# easily hold most of a decoder's annotations, but are rarely looked at,
+# so by default a word's bits go into a single annotation.
+#  - 'bit': One annotation per bit.
+#  - 'word': One annotation per word, with all of its bits.
+#  - 'none': No bit annotations.
+bit_anns_option = {'id': 'bit_anns', 'desc': 'Bit annotations', 'default': 'word',
+    'values': ('bit', 'word', 'none'), 'idn':'dec_common_opt_bit_anns'}
+
+def put_bit_anns(decoder, out_ann, ann, bits, mode):
+    '''Annotate the bits of a word as selected by the 'bit_anns' option.
+    'bits' holds [bit, ss, es] items, in any order.'''
+    if mode == 'bit':
+        for bit in bits:
+            decoder.put(bit[1], bit[2], out_ann, [ann, ['%d' % bit[0]]])
+    elif mode == 'word' and bits:
+        bits = sorted(bits, key=lambda b: b[1])
+        text = ''.join(['%d' % b[0] for b in bits])
+        decoder.put(bits[0][1], bits[-1][2], out_ann, [ann, [text]])
@@ -0,0 +1,158 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Online statistics for protocol decoders.
+
+All estimators take one value at a time and use a fixed amount of memory,
+no matter how many values are fed, so they can be kept running over
+captures with millions of measurements.
+
+    stats = RunningStats()
+    for v in values:
+        stats.add(v)
+    stats.mean, stats.stddev, stats.min, stats.max
+'''
+
+import math
+
+class RunningStats:
+    '''Count, mean, variance (Welford's algorithm), minimum and maximum.'''
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+
+    @property
+    def variance(self):
+        '''Sample variance (0 for less than two values).'''
+        return self.m2 / (self.count - 1) if self.count > 1 else 0.0
+
+    @property
+    def stddev(self):
+        return math.sqrt(self.variance)
+
+class P2Quantile:
+    '''Estimate the quantile 'p' (0 < p < 1) with the P² algorithm (Jain
+    and Chlamtac, 1985), which tracks five markers instead of keeping all
+    values. Exact for up to five values.'''
+
+    def __init__(self, p):
+        self.p = p
+        self.q = []
+        self.n = [0, 1, 2, 3, 4]
+        self.np = [0, 2 * p, 4 * p, 2 + 2 * p, 4]
+        self.dn = [0, p / 2, p, (1 + p) / 2, 1]
+
+    def add(self, value):
+        q, n = self.q, self.n
+        if len(q) < 5:
+            q.append(value)
+            q.sort()
+            return
+
+        # Find the cell of the new value, adjust the extreme markers.
+        if value < q[0]:
+            q[0] = value
+            k = 0
+        elif value >= q[4]:
+            q[4] = value
+            k = 3
+        else:
+            k = 0
+            while value >= q[k + 1]:
+                k += 1
+        for i in range(k + 1, 5):
+            n[i] += 1
+        for i in range(5):
+            self.np[i] += self.dn[i]
+
+        # Move the middle markers towards their desired positions, using
+        # the piecewise parabolic (or else linear) prediction.
+        for i in range(1, 4):
+            d = self.np[i] - n[i]
+            if (d >= 1 and n[i + 1] - n[i] > 1) or \
+                    (d <= -1 and n[i - 1] - n[i] < -1):
+                d = 1 if d > 0 else -1
+                qp = q[i] + d / (n[i + 1] - n[i - 1]) * \
+                    ((n[i] - n[i - 1] + d) * (q[i + 1] - q[i]) / (n[i + 1] - n[i]) +
+                     (n[i + 1] - n[i] - d) * (q[i] - q[i - 1]) / (n[i] - n[i - 1]))
+                if not q[i - 1] < qp < q[i + 1]:
+                    qp = q[i] + d * (q[i + d] - q[i]) / (n[i + d] - n[i])
+                q[i] = qp
+                n[i] += d
+
+    @property
+    def value(self):
+        q = self.q
+        if not q:
+            return None
+        if len(q) < 5:
+            return q[min(len(q) - 1, int(round(self.p * (len(q) - 1))))]
+        return q[2]
+
+class Histogram:
+    '''Histogram with a fixed number of bins. The range starts with bins
+    of width 'width' around the first value and doubles the bin width
+    (merging neighbouring bins) whenever a value doesn't fit.'''
+
+    def __init__(self, nbins=64, width=1):
+        self.nbins = nbins + (nbins & 1)
+        self.width = width
+        self.lo = None
+        self.bins = [0] * self.nbins
+
+    def add(self, value):
+        if self.lo is None:
+            self.lo = value - (self.nbins // 2) * self.width
+        while value < self.lo or value >= self.lo + self.nbins * self.width:
+            self.grow(value < self.lo)
+        self.bins[int((value - self.lo) // self.width)] += 1
+
+    def grow(self, left):
+        bins, half = self.bins, self.nbins // 2
+        merged = [bins[i] + bins[i + 1] for i in range(0, self.nbins, 2)]
+        if left:
+            self.lo -= self.nbins * self.width
+            self.bins = [0] * half + merged
+        else:
+            self.bins = merged + [0] * half
+        self.width *= 2
+
+    def items(self):
+        '''Return (lower bin edge, count) for the bins from the first to
+        the last one that isn't empty.'''
+        used = [i for i, c in enumerate(self.bins) if c]
+        if not used:
+            return []
+        return [(self.lo + i * self.width, self.bins[i])
+                for i in range(used[0], used[-1] + 1)]
@@ -0,0 +1,132 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+WAV (PCM) export for the audio decoders.
+
+Samples are collected in a preallocated array and converted to the
+little endian PCM container format a block at a time. The header needs
+the data size, the sample rate and the channel count, so the converted
+blocks are spooled to a temporary file (in memory while it's small) and
+the file is produced at the end of the capture:
+
+    wav = WavWriter(wordsize=24)
+    wav.frame(ss)           # at the start of every frame
+    wav.add(value)          # one word, channels interleaved
+    for data in wav.output(channels=2, samplerate=samplerate):
+        self.put(ss, es, self.out_binary, [0, data])
+
+The sample rate of the audio is derived from the time between the first
+and the last frame.
+'''
+
+from array import array
+import struct
+import sys
+import tempfile
+
+# Samples per conversion block.
+BLOCK = 1 << 16
+# Bytes per output chunk.
+CHUNK = 1 << 18
+# The spool file moves to disk when it grows beyond this size.
+SPOOL = 1 << 22
+
+class WavWriter:
+    def __init__(self, wordsize):
+        self.wordsize = wordsize
+        # 16, 24 or 32 bit signed containers, the words are MSB aligned.
+        self.container = 16 if wordsize <= 16 else 24 if wordsize <= 24 else 32
+        self.buf = array('i', bytes(4 * BLOCK))
+        self.fill = 0
+        self.file = tempfile.SpooledTemporaryFile(SPOOL)
+        self.count = 0
+        self.frames = 0
+        self.first_frame = None
+        self.last_frame = None
+
+    def frame(self, samplenum):
+        if self.first_frame is None:
+            self.first_frame = samplenum
+        self.last_frame = samplenum
+        self.frames += 1
+
+    def add(self, value):
+        '''Add a word (two's complement, 'wordsize' bits).'''
+        if self.wordsize <= 32:
+            v = (value << (32 - self.wordsize)) & 0xffffffff
+        else:
+            v = (value >> (self.wordsize - 32)) & 0xffffffff
+        self.buf[self.fill] = v - (1 << 32) if v & 0x80000000 else v
+        self.fill += 1
+        self.count += 1
+        if self.fill == BLOCK:
+            self.flush()
+
+    def flush(self):
+        if not self.fill:
+            return
+        a = self.buf[:self.fill]
+        if sys.byteorder == 'big':
+            a.byteswap()
+        b = a.tobytes()
+        if self.container == 32:
+            self.file.write(b)
+        else:
+            # Keep the upper bytes of each little endian 32 bit word.
+            n = self.container // 8
+            out = bytearray(n * self.fill)
+            for i in range(n):
+                out[i::n] = b[4 - n + i::4]
+            self.file.write(out)
+        self.fill = 0
+
+    def rate(self, samplerate):
+        '''Frames per second, None if it can't be measured.'''
+        if not samplerate or self.frames < 2 or self.last_frame <= self.first_frame:
+            return None
+        return int(round((self.frames - 1) * samplerate /
+                         (self.last_frame - self.first_frame)))
+
+    def header(self, channels, rate, data_size):
+        align = channels * self.container // 8
+        # An odd sized chunk is followed by a pad byte.
+        return b'RIFF' + struct.pack('<I', 36 + data_size + (data_size & 1)) + \
+            b'WAVE' + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, rate,
+                                            rate * align, align, self.container) + \
+            b'data' + struct.pack('<I', data_size)
+
+    def output(self, channels, samplerate, default_rate=48000):
+        '''Generate the header and the data of the WAV file, in chunks. An
+        incomplete last frame is padded with silence.'''
+        while self.count % channels:
+            self.add(0)
+        self.flush()
+        rate = self.rate(samplerate) or default_rate
+        size = self.file.tell()
+        yield self.header(channels, rate, size)
+        self.file.seek(0)
+        while True:
+            data = self.file.read(CHUNK)
+            if not data:
+                break
+            yield data
+        if size & 1:
+            yield b'\0'
+        self.file.close()
@@ -74,72 +74,85 @@ class Decoder(srd.Decoder):
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
 
-    def putc(self, cls, ss, annlist):
-        self.put(ss, self.samplenum, self.out_ann, [cls, annlist])
+    def putc(self, cls, ss, es, annlist):
+        self.put(ss, es, self.out_ann, [cls, annlist])
 
     def decode(self):
-        opt_edge_map = {'rising': 'r', 'falling': 'f', 'any': 'e'}
+        opt_edge_map = {'rising': 1, 'falling': 0, 'any': None}
 
         data_edge = self.options['data_edge']
         divider = self.options['divider']
         if divider < 0:
             divider = 0
         reset_edge = self.options['reset_edge']
+        edge_off = int(self.options['edge_off'])
+        word_off = int(self.options['word_off'])
+        dead_cycles = int(self.options['dead_cycles'])
 
-        condition = [{PIN_DATA: opt_edge_map[data_edge]}]
+        # Edges on all channels come in batches, the pin values tell
+        # which channel changed and in which direction.
+        channels = [PIN_DATA]
         have_reset = self.has_channel(PIN_RESET)
         if have_reset:
-            cond_reset = len(condition)
-            condition.append({PIN_RESET: opt_edge_map[reset_edge]})
+            channels.append(PIN_RESET)
+        data_level = opt_edge_map[data_edge]
+        reset_level = opt_edge_map[reset_edge]
 
-        edge_count = int(self.options['edge_off'])
+        edge_count = edge_off
         edge_start = None
-        word_count = int(self.options['word_off'])
+        word_count = word_off
         word_start = None
 
         if self.options['start_with_reset'] == 'yes':
-            dead_count = int(self.options['dead_cycles'])
+            dead_count = dead_cycles
         else:
             dead_count = 0
 
+        pins = self.wait()
         while True:
-            self.wait(condition)
-            now = self.samplenum
-
-            if have_reset and (self.matched & (0b1 <<cond_reset)):
-                edge_count = int(self.options['edge_off'])
-                edge_start = now
-                word_count = int(self.options['word_off'])
-                word_start = now
-                self.putc(ROW_RESET, now, ['Word reset', 'Reset', 'Rst', 'R'])
-                dead_count = int(self.options['dead_cycles'])
-                continue
-
-            if dead_count:
-                dead_count -= 1
+            for now, new_pins in self.wait_edges(channels):
+                old_pins, pins = pins, new_pins
+
+                if have_reset and pins[PIN_RESET] != old_pins[PIN_RESET] \
+                        and pins[PIN_RESET] == reset_level:
+                    edge_count = edge_off
+                    edge_start = now
+                    word_count = word_off
+                    word_start = now
+                    self.putc(ROW_RESET, now, now, ['Word reset', 'Reset', 'Rst', 'R'])
+                    dead_count = dead_cycles
+                    continue
+
+                if pins[PIN_DATA] == old_pins[PIN_DATA]:
+                    continue
+                if data_level is not None and pins[PIN_DATA] != data_level:
+                    continue
+
+                if dead_count:
+                    dead_count -= 1
+                    edge_start = now
+                    word_start = now
+                    continue
+
+                # Implementation note: In the absence of a RESET condition
+                # before the first data edge, any arbitrary choice of where
+                # to start the annotation is valid. One may choose to emit a
+                # narrow annotation (where ss=es), or assume that the cycle
+                # which corresponds to the counter value started at sample
+                # number 0. We decided to go with the latter here, to avoid
+                # narrow annotations (see bug #1210). None of this matters in
+                # the presence of a RESET condition in the input stream.
+                if edge_start is None:
+                    edge_start = 0
+                if word_start is None:
+                    word_start = 0
+
+                edge_count += 1
+                self.putc(ROW_EDGE, edge_start, now, ["{:d}".format(edge_count)])
                 edge_start = now
-                word_start = now
-                continue
-
-            # Implementation note: In the absence of a RESET condition
-            # before the first data edge, any arbitrary choice of where
-            # to start the annotation is valid. One may choose to emit a
-            # narrow annotation (where ss=es), or assume that the cycle
-            # which corresponds to the counter value started at sample
-            # number 0. We decided to go with the latter here, to avoid
-            # narrow annotations (see bug #1210). None of this matters in
-            # the presence of a RESET condition in the input stream.
-            if edge_start is None:
-                edge_start = 0
-            if word_start is None:
-                word_start = 0
-
-            edge_count += 1
-            self.putc(ROW_EDGE, edge_start, ["{:d}".format(edge_count)])
-            edge_start = now
-
-            word_edge_count = edge_count - int(self.options['edge_off'])
-            if divider and (word_edge_count % divider) == 0:
-                word_count += 1
-                self.putc(ROW_WORD, word_start, ["{:d}".format(word_count)])
-                word_start = now
+
+                word_edge_count = edge_count - edge_off
+                if divider and (word_edge_count % divider) == 0:
+                    word_count += 1
+                    self.putc(ROW_WORD, word_start, now, ["{:d}".format(word_count)])
+                    word_start = now
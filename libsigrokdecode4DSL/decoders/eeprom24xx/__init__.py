@@ -20,6 +20,10 @@
 '''
 This decoder stacks on top of the 'i2c' PD and decodes the
 industry standard 24xx series serial EEPROM protocol.
+
+The 'Memory image' binary output holds the EEPROM contents seen in the
+capture (data written or read, page writes wrap around like on the chip),
+from address 0 to the highest known address. Unknown bytes are 0xFF.
 '''
 
 from .pd import Decoder
@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+from common.srdhelper.memimage import MemoryImage
 from .lists import *
 
 class Decoder(srd.Decoder):
@@ -71,6 +72,7 @@ class Decoder(srd.Decoder):
     )
     binary = (
         ('binary', 'Binary'),
+        ('image', 'Memory image'),
     )
 
     def __init__(self):
@@ -84,6 +86,14 @@ class Decoder(srd.Decoder):
         self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.chip = chips[self.options['chip']]
         self.addr_counter = self.options['addr_counter']
+        self.image = MemoryImage(size=self.chip['size'])
+        self.image_ss = None
+
+    def end(self):
+        # Dump the memory contents seen in the capture.
+        data = self.image.dump()
+        if data:
+            self.put(self.image_ss, self.es, self.out_binary, [1, data])
 
     def putb(self, data):
         self.put(self.ss_block, self.es_block, self.out_ann, data)
@@ -158,7 +168,18 @@ class Decoder(srd.Decoder):
             (s, p[3]), 'Data byte: %02X' % p[3], \
             'Byte: %02X' % p[3], 'DB: %02X' % p[3], '%02X' % p[3]]])
 
+    def update_image(self, idx, write):
+        data = bytes(p[3] for p in self.packets[idx:])
+        if write:
+            wrap = self.chip['page_size'] if self.chip['page_wraparound'] else 0
+            self.image.write(self.addr_counter, data, self.ss_block, wrap)
+        else:
+            self.image.read(self.addr_counter, data, self.ss_block)
+        if self.image_ss is None:
+            self.image_ss = self.ss_block
+
     def put_data_bytes(self, idx, cls, s):
+        self.update_image(idx, cls in (9, 10))
         for p in self.packets[idx:]:
             self.put_data_byte(p)
             self.addr_counter += 1
@@ -213,6 +234,7 @@ class Decoder(srd.Decoder):
                                'from page %d to %d!' % (page1, page2)]])
         elif self.is_cur_addr_read:
             # Current address read: no word address, one data byte.
+            self.update_image(1, False)
             self.put_data_byte(self.packets[1])
             self.put(self.packets[1][0], self.packets[-1][1], self.out_ann,
                 [8, ['Data', 'D']])
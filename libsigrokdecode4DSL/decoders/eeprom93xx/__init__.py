@@ -27,6 +27,10 @@ different names.
 
 Warning: Other EEPROMs using Microwire might have different operation codes
 and instructions.
+
+The 'Memory image' binary output holds the EEPROM contents seen in the
+capture (words read, written or erased, MSB first), from address 0 to the
+highest known address. Unknown bytes are 0xFF.
 '''
 
 from .pd import Decoder
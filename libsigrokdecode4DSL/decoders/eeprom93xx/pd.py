@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+from common.srdhelper.memimage import MemoryImage
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -47,6 +48,7 @@ class Decoder(srd.Decoder):
     binary = (
         ('address', 'Address'),
         ('data', 'Data'),
+        ('image', 'Memory image'),
     )
 
     def __init__(self):
@@ -60,6 +62,32 @@ class Decoder(srd.Decoder):
         self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.addresssize = self.options['addresssize']
         self.wordsize = self.options['wordsize']
+        # The image is byte addressed, words are stored MSB first.
+        self.wordbytes = (self.wordsize + 7) // 8
+        self.words = 1 << self.addresssize
+        self.image = MemoryImage(size=self.words * self.wordbytes)
+        self.image_ss = self.image_es = None
+
+    def end(self):
+        # Dump the memory contents seen in the capture.
+        data = self.image.dump()
+        if data:
+            self.put(self.image_ss, self.image_es, self.out_binary, [2, data])
+
+    def update_image(self, ss, es, op, addr, words=()):
+        if self.image_ss is None:
+            self.image_ss = ss
+        self.image_es = es
+        addr *= self.wordbytes
+        data = b''.join(w.to_bytes(self.wordbytes, 'big') for w in words)
+        if op == 'read':
+            self.image.read(addr, data, ss)
+        elif op == 'write':
+            self.image.write(addr, data, ss)
+        elif op == 'erase':
+            self.image.erase(addr, self.wordbytes, ss)
+        elif op == 'erase all':
+            self.image.erase(0, self.words * self.wordbytes, ss)
 
     def put_address(self, data):
         # Get address (MSb first).
@@ -69,6 +97,7 @@ class Decoder(srd.Decoder):
         self.put(data[0].ss, data[-1].es, self.out_ann,
                  [0, ['Address: 0x%04x' % a, 'Addr: 0x%04x' % a, '0x%04x' % a]])
         self.put(data[0].ss, data[-1].es, self.out_binary, [0, bytes([a])])
+        return a
 
     def put_word(self, si, data):
         # Decode word (MSb first).
@@ -93,6 +122,7 @@ class Decoder(srd.Decoder):
                      self.out_ann, [idx, ['Data: 0x%04x' % word, '0x%04x' % word]])
             self.put(data[0].ss, data[-1].es, self.out_binary,
                      [1, bytes([(word & 0xff00) >> 8, word & 0xff])])
+        return word
 
     def decode(self, ss, es, data):
         if len(data) < (2 + self.addresssize):
@@ -105,9 +135,10 @@ class Decoder(srd.Decoder):
             # READ instruction.
             self.put(data[0].ss, data[1].es,
                      self.out_ann, [0, ['Read word', 'READ']])
-            self.put_address(data[2:2 + self.addresssize])
+            addr = self.put_address(data[2:2 + self.addresssize])
 
             # Get all words.
+            words = []
             word_start = 2 + self.addresssize
             while len(data) - word_start > 0:
                 # Check if there are enough bits for a word.
@@ -115,26 +146,29 @@ class Decoder(srd.Decoder):
                     self.put(data[word_start].ss, data[len(data) - 1].es,
                              self.out_ann, [2, ['Not enough word bits']])
                     break
-                self.put_word(False, data[word_start:word_start + self.wordsize])
+                words.append(self.put_word(False, data[word_start:word_start + self.wordsize]))
                 # Go to next word.
                 word_start += self.wordsize
+            self.update_image(ss, es, 'read', addr, words)
         elif opcode == 1:
             # WRITE instruction.
             self.put(data[0].ss, data[1].es,
                      self.out_ann, [0, ['Write word', 'WRITE']])
-            self.put_address(data[2:2 + self.addresssize])
+            addr = self.put_address(data[2:2 + self.addresssize])
             # Get word.
             if len(data) < 2 + self.addresssize + self.wordsize:
                 self.put(data[2 + self.addresssize].ss,
                          data[len(data) - 1].ss,
                          self.out_ann, [2, ['Not enough word bits']])
             else:
-                self.put_word(True, data[2 + self.addresssize:2 + self.addresssize + self.wordsize])
+                word = self.put_word(True, data[2 + self.addresssize:2 + self.addresssize + self.wordsize])
+                self.update_image(ss, es, 'write', addr, [word])
         elif opcode == 3:
             # ERASE instruction.
             self.put(data[0].ss, data[1].es,
                      self.out_ann, [0, ['Erase word', 'ERASE']])
-            self.put_address(data[2:2 + self.addresssize])
+            addr = self.put_address(data[2:2 + self.addresssize])
+            self.update_image(ss, es, 'erase', addr)
         elif opcode == 0:
             if data[2].si == 1 and data[3].si == 1:
                 # WEN instruction.
@@ -149,6 +183,7 @@ class Decoder(srd.Decoder):
                 self.put(data[0].ss, data[2 + self.addresssize - 1].es,
                          self.out_ann, [0, ['Erase all memory',
                                             'Erase all', 'ERAL']])
+                self.update_image(ss, es, 'erase all', 0)
             elif data[2].si == 0 and data[3].si == 1:
                 # WRAL instruction.
                 self.put(data[0].ss, data[2 + self.addresssize - 1].es,
@@ -160,4 +195,5 @@ class Decoder(srd.Decoder):
                              data[len(data) - 1].ss,
                              self.out_ann, [2, ['Not enough word bits']])
                 else:
-                    self.put_word(True, data[2 + self.addresssize:2 + self.addresssize + self.wordsize])
+                    word = self.put_word(True, data[2 + self.addresssize:2 + self.addresssize + self.wordsize])
+                    self.update_image(ss, es, 'write', 0, [word] * self.words)
@@ -34,6 +34,16 @@ samplerate used to sample the respective channel. For good results it is
 recommended to use a logic analyzer samplerate that is much higher than
 the expected bitrate/baudrate that might be used on the channel.
 
+The decoder collects the widths of all pulses in a histogram. Glitches are
+ignored, the other pulses are expected to be (integer) multiples of the bit
+time. The estimate is annotated together with a confidence, which is the
+percentage of pulses that fit the estimated bit time. Estimates close to a
+common bitrate are snapped to it (unless disabled).
+
+Once the estimate is stable, the decoder stops looking at the signal, so
+the result on long captures is available quickly. Disable the 'stop'
+option to have the whole capture looked at.
+
 The last annotation emitted by the decoder will be the best bitrate guess.
 '''
 
@@ -22,6 +22,30 @@ import sigrokdecode as srd
 class SamplerateError(Exception):
     pass
 
+# Common UART/CAN/LIN/... bitrates, estimates close to one of these are
+# snapped to it.
+std_bitrates = (
+    50, 75, 110, 134, 150, 200, 300, 600, 1200, 1800, 2400, 4800, 7200,
+    9600, 10400, 14400, 19200, 20000, 28800, 31250, 33333, 38400, 50000,
+    56000, 57600, 62500, 74880, 76800, 83333, 100000, 115200, 125000,
+    128000, 153600, 230400, 250000, 256000, 400000, 460800, 500000,
+    576000, 921600, 1000000, 1152000, 1500000, 2000000, 2500000, 3000000,
+    3500000, 4000000, 5000000, 6000000, 8000000, 10000000, 12000000,
+)
+
+# Relative deviation of a pulse from a multiple of the bit time that is
+# still accepted, and the one for snapping to a standard bitrate.
+FIT_TOLERANCE = 0.12
+SNAP_TOLERANCE = 0.025
+# Longer pulses are considered idle time, not a number of bits.
+MAX_BITS = 16
+# Pulses seen before the first estimate, and between two estimates.
+MIN_PULSES = 32
+EVAL_PULSES = 32
+# Consecutive equal estimates (with enough confidence) before stopping.
+STABLE_EVALS = 4
+MIN_CONFIDENCE = 90
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'guess_bitrate'
@@ -35,18 +59,31 @@ class Decoder(srd.Decoder):
     channels = (
         {'id': 'data', 'name': 'Data', 'desc': 'Data line', 'idn':'dec_guess_bitrate_chan_data'},
     )
+    options = (
+        {'id': 'snap', 'desc': 'Snap to standard bitrates', 'default': 'yes',
+            'values': ('yes', 'no'), 'idn':'dec_guess_bitrate_opt_snap'},
+        {'id': 'stop', 'desc': 'Stop when the estimate is stable', 'default': 'yes',
+            'values': ('yes', 'no'), 'idn':'dec_guess_bitrate_opt_stop'},
+    )
     annotations = (
         ('bitrate', 'Bitrate / baudrate'),
     )
 
     def putx(self, data):
-        self.put(self.ss_edge, self.samplenum, self.out_ann, data)
+        self.put(self.ss_guess, self.samplenum, self.out_ann, data)
 
     def __init__(self):
         self.reset()
 
     def reset(self):
+        self.samplerate = None
         self.ss_edge = None
+        self.ss_guess = None
+        self.histogram = {}
+        self.pulses = 0
+        self.guess = None
+        self.shown = None
+        self.stable = 0
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
@@ -55,25 +92,116 @@ class Decoder(srd.Decoder):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
 
+    def base_width(self):
+        # Group the pulse widths (in ascending order) into clusters of
+        # similar widths. The first cluster which holds more than just a
+        # few glitches is taken as a first guess of the bit time.
+        hist = self.histogram
+        widths = sorted(hist)
+        minweight = max(2, self.pulses // 100)
+        i = 0
+        while i < len(widths):
+            start, count, total = widths[i], 0, 0
+            while i < len(widths) and widths[i] <= start * (1 + 2 * FIT_TOLERANCE) + 1:
+                count += hist[widths[i]]
+                total += hist[widths[i]] * widths[i]
+                i += 1
+            if count >= minweight:
+                return total / count
+        return None
+
+    def estimate(self):
+        '''Return (bit time in samples, confidence in percent).'''
+        base = self.base_width()
+        if base is None:
+            return None, 0
+        # All pulses are expected to be a multiple of the bit time. Refine
+        # the bit time with all pulses which fit, the fraction of pulses
+        # that fit is the confidence.
+        fit_width = fit_bits = fit_count = count = 0
+        for width, n in self.histogram.items():
+            bits = round(width / base)
+            if bits > MAX_BITS:
+                continue
+            count += n
+            if bits >= 1 and abs(width / bits - base) <= base * FIT_TOLERANCE:
+                fit_width += n * width
+                fit_bits += n * bits
+                fit_count += n
+        if not fit_bits:
+            return None, 0
+        return fit_width / fit_bits, (100 * fit_count) // count
+
+    def bitrate(self, bitwidth):
+        bitrate = float(self.samplerate) / bitwidth
+        if self.options['snap'] == 'yes':
+            std = min(std_bitrates, key=lambda r: abs(r - bitrate))
+            if abs(std - bitrate) <= std * SNAP_TOLERANCE:
+                return std
+        return int(round(bitrate))
+
+    def update_guess(self):
+        bitwidth, confidence = self.estimate()
+        if bitwidth is None:
+            return
+        guess = (self.bitrate(bitwidth), confidence)
+        # Consider the estimate stable when the bitrate doesn't change
+        # (by more than the width of a sample) and the confidence is good.
+        old = self.guess
+        if old and confidence >= MIN_CONFIDENCE and \
+                abs(guess[0] - old[0]) <= guess[0] / bitwidth:
+            self.stable += 1
+        else:
+            self.stable = 0
+        self.guess = guess
+        self.show_guess()
+
+    def show_guess(self):
+        if self.guess is None or self.guess == self.shown:
+            return
+        bitrate, confidence = self.guess
+        self.putx([0, ['%d (confidence %d%%)' % (bitrate, confidence),
+                       '%d (%d%%)' % (bitrate, confidence), '%d' % bitrate]])
+        self.shown = self.guess
+        self.ss_guess = self.samplenum
+
+    def end(self):
+        # Show the last estimate if the capture ended before it was stable.
+        if self.ss_edge is None:
+            return
+        self.samplenum = self.ss_edge
+        if self.pulses and self.pulses % EVAL_PULSES:
+            self.update_guess()
+        self.show_guess()
+
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
 
         # Get the first edge on the data line.
         self.wait({0: 'e'})
-        self.ss_edge = self.samplenum
+        self.ss_edge = self.ss_guess = self.samplenum
 
-        # Get any subsequent edge on the data line. Get the smallest
-        # distance between any two transitions, assuming it corresponds
-        # to one bit time of the respective bitrate of the input stream.
-        # This heuristics keeps getting better for longer captures.
-        bitwidth = None
+        # Collect the distances between subsequent edges in a histogram.
+        # Every few pulses estimate the bit time from the histogram, which
+        # is robust against glitches and gets better for longer captures.
+        # Stop looking at the signal once the estimate is stable.
+        hist = self.histogram
+        stop = self.options['stop'] == 'yes'
         while True:
             self.wait({0: 'e'})
 
             b = self.samplenum - self.ss_edge
-            if bitwidth is None or b < bitwidth:
-                bitwidth = b
-                bitrate = int(float(self.samplerate) / float(b))
-                self.putx([0, ['%d' % bitrate]])
+            hist[b] = hist.get(b, 0) + 1
+            self.pulses += 1
             self.ss_edge = self.samplenum
+
+            if self.pulses < MIN_PULSES or self.pulses % EVAL_PULSES:
+                continue
+            self.update_guess()
+            if stop and self.stable >= STABLE_EVALS:
+                break
+
+        # Done, let the remaining samples pass without looking at them.
+        while True:
+            self.wait({'skip': 1 << 40})
@@ -22,6 +22,10 @@ This is a generic I²C demultiplexing protocol decoder.
 
 It takes an I²C stream as input and outputs multiple I²C streams, each
 stream containing only I²C packets for one specific I²C slave.
+
+When the stacked decoders take whole I²C transactions (START to STOP)
+only, the I²C decoder sends those, and each one is routed in a single packet to the stream of its (last) slave
+address.
 '''
 
 from .pd import Decoder
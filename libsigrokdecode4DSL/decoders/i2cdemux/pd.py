@@ -41,6 +41,43 @@ class Decoder(srd.Decoder):
 
     def start(self):
         self.out_python = []
+        # The streams are only registered when their slave shows up, this
+        # one is there to ask the stacked decoders for their packet types
+        # before that. Nothing is sent on it.
+        self.out_query = self.register(srd.OUTPUT_PYTHON, proto_id='i2c')
+
+    @property
+    def input_packets(self):
+        # Whole transactions when the stacked decoders take nothing else,
+        # all the packets otherwise.
+        if not hasattr(self, 'out_query'):
+            return None
+        for out in [self.out_query] + self.out_python:
+            if self.output_packets(out) != {'TRANSACTION'}:
+                return None
+        return ('TRANSACTION',)
+
+    def get_stream(self, slave):
+        if slave in self.slaves:
+            return self.slaves.index(slave)
+
+        # We're never seen this slave, add a new stream.
+        self.slaves.append(slave)
+        out = self.register(srd.OUTPUT_PYTHON, proto_id='i2c-%s' % hex(slave))
+        self.out_python.append(out)
+        self.streamcount += 1
+        return self.streamcount - 1
+
+    # Whole transactions (when the I²C decoder sends them) go to the stream
+    # of the last slave address in the transaction, in one packet. The
+    # streams are the same as for the single packets.
+    def decode_transaction(self, ss, es, t):
+        for m in reversed(range(len(t))):
+            slave = t.address_packet(m)
+            if slave is not None:
+                self.put(ss, es, self.out_python[self.get_stream(slave)],
+                         ['TRANSACTION', t])
+                return
 
     # Grab I²C packets into a local cache, until an I²C STOP condition
     # packet comes along. At some point before that STOP condition, there
@@ -52,20 +89,15 @@ class Decoder(srd.Decoder):
 
         cmd, databyte = data
 
+        if cmd == 'TRANSACTION':
+            self.decode_transaction(ss, es, databyte)
+            return
+
         # Add the I²C packet to our local cache.
         self.packets.append([ss, es, data])
 
         if cmd in ('ADDRESS READ', 'ADDRESS WRITE'):
-            if databyte in self.slaves:
-                self.stream = self.slaves.index(databyte)
-                return
-
-            # We're never seen this slave, add a new stream.
-            self.slaves.append(databyte)
-            self.out_python.append(self.register(srd.OUTPUT_PYTHON,
-                                   proto_id='i2c-%s' % hex(databyte)))
-            self.stream = self.streamcount
-            self.streamcount += 1
+            self.stream = self.get_stream(databyte)
         elif cmd == 'STOP':
             if self.stream == -1:
                 raise Exception('Invalid stream!') # FIXME?
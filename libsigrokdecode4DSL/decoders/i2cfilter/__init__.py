@@ -27,11 +27,17 @@ It then outputs the filtered data again as OUTPUT_PROTO of type/format 'i2c'
 (up the protocol decoder stack). No annotations are output.
 
 The I²C slave address to filter out should be passed in as an option
-'address', as an integer. A specific read or write operation can be selected
+'address', as an integer (the 7-bit address, whatever the address format
+of the I²C decoder). A specific read or write operation can be selected
 with the 'direction' option, which should be 'read', 'write', or 'both'.
 
 Both of these are optional; if no options are specified the entire payload
 of the I²C session will be output.
+
+When the stacked decoder takes whole I²C transactions, they're filtered as
+a whole: a transaction is output when one of its messages (START or START
+REPEAT, slave address, data) matches the 7-bit slave address and the
+direction.
 '''
 
 from .pd import Decoder
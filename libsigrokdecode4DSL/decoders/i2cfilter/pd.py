@@ -21,6 +21,7 @@
 # TODO: Support for filtering out multiple slave/direction pairs?
 
 import sigrokdecode as srd
+from common.srdhelper.i2c import address_from_bits
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -45,6 +46,7 @@ class Decoder(srd.Decoder):
     def reset(self):
         self.curslave = -1
         self.curdirection = None
+        self.bits = None
         self.packets = [] # Local cache of I²C packets
 
     def start(self):
@@ -52,6 +54,30 @@ class Decoder(srd.Decoder):
         if self.options['address'] not in range(0, 127 + 1):
             raise Exception('Invalid slave (must be 0..127).')
 
+    @property
+    def input_packets(self):
+        # Whole transactions when the stacked decoders take nothing else,
+        # all the packets otherwise.
+        if not hasattr(self, 'out_python'):
+            return None
+        if self.output_packets(self.out_python) == {'TRANSACTION'}:
+            return ('TRANSACTION',)
+        return None
+
+    def wanted(self, t):
+        # A transaction passes when one of its messages is for the slave
+        # and in the direction, e.g. a random read passes as 'read'.
+        address, direction = self.options['address'], self.options['direction']
+        for m in range(len(t)):
+            if t.address(m) is None:
+                continue
+            if address and t.address(m) != address:
+                continue
+            if direction != 'both' and t.is_read(m) != (direction == 'read'):
+                continue
+            return True
+        return False
+
     # Grab I²C packets into a local cache, until an I²C STOP condition
     # packet comes along. At some point before that STOP condition, there
     # will have been an ADDRESS READ or ADDRESS WRITE which contains the
@@ -62,11 +88,24 @@ class Decoder(srd.Decoder):
 
         cmd, databyte = data
 
+        if cmd == 'TRANSACTION':
+            if self.wanted(databyte):
+                self.put(ss, es, self.out_python, data)
+            return
+
         # Add the I²C packet to our local cache.
         self.packets.append([ss, es, data])
 
-        if cmd in ('ADDRESS READ', 'ADDRESS WRITE'):
-            self.curslave = databyte
+        if cmd == 'BITS':
+            self.bits = databyte
+        elif cmd in ('ADDRESS READ', 'ADDRESS WRITE'):
+            # The 7-bit address, like for transactions, whatever the i2c
+            # decoder's address format.
+            if self.bits is not None:
+                self.curslave = address_from_bits(self.bits)
+            else:
+                self.curslave = databyte
+            self.bits = None
             self.curdirection = cmd[8:].lower()
         elif cmd in ('STOP', 'START REPEAT'):
             # If this chunk was not for the correct slave, drop it.
@@ -21,6 +21,11 @@
 I²S (Integrated Interchip Sound) is a serial bus for connecting digital
 audio devices (usually on the same device/board).
 
+The 'WAV file' binary output is a stereo PCM file of the decoded words,
+written at the end of the capture. The container is 16, 24 or 32 bits
+wide depending on the word size, the audio sample rate is measured from
+the WS periods. Words with the wrong length are written as silence.
+
 Details:
 http://www.nxp.com/acrobat_download/various/I2SBUS.pdf
 http://en.wikipedia.org/wiki/I2s
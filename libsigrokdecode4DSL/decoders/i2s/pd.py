@@ -19,7 +19,7 @@
 ##
 
 import sigrokdecode as srd
-import struct
+from common.srdhelper.wav import WavWriter
 
 '''
 OUTPUT_PYTHON format:
@@ -34,6 +34,9 @@ Packet:
 <value>: integer
 '''
 
+# Bits (0 or 1) to '0' and '1' characters.
+BITS = bytes.maketrans(b'\x00\x01', b'01')
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'i2s'
@@ -78,13 +81,12 @@ class Decoder(srd.Decoder):
     def reset(self):
         self.samplerate = None
         self.oldws = 1
-        self.bitcount = 0
-        self.data = 0
         self.samplesreceived = 0
         self.first_sample = None
         self.ss_block = None
         self.wordlength = -1
-        self.wrote_wav_header = False
+        self.wav = None
+        self.wav_ss = self.wav_es = None
 
     def start(self):
         self.out_python = self.register(srd.OUTPUT_PYTHON)
@@ -95,15 +97,6 @@ class Decoder(srd.Decoder):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
 
-    def putpb(self, data):
-        self.put(self.ss_block, self.samplenum, self.out_python, data)
-
-    def putbin(self, data):
-        self.put(self.ss_block, self.samplenum, self.out_binary, data)
-
-    def putb(self, data):
-        self.put(self.ss_block, self.samplenum, self.out_ann, data)
-
     def report(self):
         # Calculate the sample rate.
         samplerate = '?'
@@ -118,35 +111,57 @@ class Decoder(srd.Decoder):
         return 'I²S: %d %d-bit samples received at %sHz' % \
             (self.samplesreceived, self.wordlength, samplerate)
 
-    def wav_header(self):
-        # Chunk descriptor
-        h  = b'RIFF'
-        h += b'\x24\x80\x00\x00' # Chunk size (2084)
-        h += b'WAVE'
-        # Fmt subchunk
-        h += b'fmt '
-        h += b'\x10\x00\x00\x00' # Subchunk size (16 bytes)
-        h += b'\x01\x00'         # Audio format (0x0001 == PCM)
-        h += b'\x02\x00'         # Number of channels (2)
-        h += b'\x80\x3e\x00\x00' # Samplerate (16000)
-        h += b'\x00\xfa\x00\x00' # Byterate (64000)
-        h += b'\x04\x00'         # Blockalign (4)
-        h += b'\x20\x00'         # Bits per sample (32)
-        # Data subchunk
-        h += b'data'
-        h += b'\xff\xff\xff\xff' # Subchunk size (4G bytes) TODO
-        return h
-
-    def wav_sample(self, sample):
-        return struct.pack('<I', self.data)
+    def end(self):
+        # The WAV header needs the size and the sample rate, write the
+        # file once all samples are known.
+        if self.wav is None or not self.wav.count:
+            return
+        for data in self.wav.output(2, self.samplerate):
+            self.put(self.wav_ss, self.wav_es, self.out_binary, [0, data])
+
+    def put_word(self, bits, left, es):
+        self.samplesreceived += 1
+        bitcount = len(bits)
+        # Check that the data word was the correct length.
+        if self.wordlength > bitcount:
+            self.put(self.ss_block, es, self.out_ann,
+                     [2, ['Received %d-bit word, expected %d-bit '
+                          'word' % (bitcount, self.wordlength)]])
+            data = None
+        else:
+            # Assemble the whole word at once.
+            data = int(bytes(bits if self.msb else bits[::-1]).translate(BITS), 2)
+            if self.left_aligned == self.msb:
+                data >>= bitcount - self.wordlength
+            else:
+                data &= (1 << self.wordlength) - 1
+            c1 = 'Left channel' if left else 'Right channel'
+            c2 = 'Left' if left else 'Right'
+            c3 = 'L' if left else 'R'
+            v = '%08x' % data
+            self.put(self.ss_block, es, self.out_python, ['DATA', [c3, data]])
+            self.put(self.ss_block, es, self.out_ann,
+                     [0 if left else 1, ['%s: %s' % (c1, v), '%s: %s' % (c2, v),
+                                         '%s: %s' % (c3, v), c3]])
+
+        # WAV frames start with the left channel, a bad word is silence.
+        if left:
+            if self.wav_ss is None:
+                self.wav_ss = self.ss_block
+            self.wav.frame(self.ss_block)
+        if self.wav_ss is not None:
+            self.wav.add(data or 0)
+            self.wav_es = es
 
     def decode(self):
         left_high = (self.options['ws_polarity'] == 'left-high')
         active_rising = (self.options['clk_edge'] == 'rising-edge')
         right_shifted = (self.options['bit_shift'] == 'right-shifted by one')
-        left_algined = (self.options['bit_align'] == 'left-aligned')
-        msb = (self.options['bitorder'] == 'msb-first')
+        self.left_aligned = (self.options['bit_align'] == 'left-aligned')
+        self.msb = (self.options['bitorder'] == 'msb-first')
         self.wordlength = self.options['wordsize']
+        self.wav = WavWriter(self.wordlength)
+        active = 1 if active_rising else 0
 
         (sck, ws, sd) = self.wait({1: 'e'})
         self.ss_block = self.samplenum
@@ -154,61 +169,40 @@ class Decoder(srd.Decoder):
         if right_shifted:
             self.wait({0: 'r' if active_rising else 'f'})
 
-        while True:
-            # Wait for a rising edge on the SCK pin.
-            (sck, ws, sd) = self.wait({0: 'r' if active_rising else 'f'})
-
-            if not right_shifted and ws != self.oldws:
-                self.last = sd
-            else:
-                if msb:
-                    self.data = (self.data << 1) | sd
-                else:
-                    self.data = self.data | (sd << self.bitcount)
+        # The bits of the current word, MSB (or LSB) first.
+        bits = bytearray()
+        # With right-shifted data the word ends at the SCK edge after the
+        # WS change, that's the next edge of SCK.
+        pending = None
+        put_word = self.put_word
 
-                self.bitcount += 1
-
-            # This was not the LSB unless WS has flipped.
-            if ws == self.oldws:
-                continue
-
-            if not self.wrote_wav_header:
-                self.put(0, 0, self.out_binary, [0, self.wav_header()])
-                self.wrote_wav_header = True
-
-            self.samplesreceived += 1
-
-            if right_shifted:
-                self.wait({0: 'f' if active_rising else 'r'})
-
-            # Check that the data word was the correct length.
-            if self.wordlength > self.bitcount:
-                self.putb([2, ['Received %d-bit word, expected %d-bit '
-                               'word' % (self.bitcount, self.wordlength)]])
-            else:
-                if (left_algined and msb) or (not left_algined and not msb):
-                    self.data >>= self.bitcount - self.wordlength
-                else:
-                    self.data &= int("1"*self.wordlength, 2)
-                self.oldws = self.oldws if left_high else not self.oldws
-                idx = 0 if self.oldws else 1
-                c1 = 'Left channel' if self.oldws else 'Right channel'
-                c2 = 'Left' if self.oldws else 'Right'
-                c3 = 'L' if self.oldws else 'R'
-                v = '%08x' % self.data
-                self.putpb(['DATA', [c3, self.data]])
-                self.putb([idx, ['%s: %s' % (c1, v), '%s: %s' % (c2, v),
-                                 '%s: %s' % (c3, v), c3]])
-                self.putbin([0, self.wav_sample(self.data)])
-
-
-            # Reset decoder state.
-            self.data = 0 if right_shifted else self.last
-            self.bitcount = 0 if right_shifted else 1
-            self.ss_block = self.samplenum
-
-            # Save the first sample position.
-            if self.first_sample is None:
-                self.first_sample = self.samplenum
-
-            self.oldws = ws
+        while True:
+            for samplenum, (sck, ws, sd) in self.wait_edges([0]):
+                if pending is not None:
+                    put_word(pending[0], pending[1], samplenum)
+                    self.ss_block = samplenum
+                    if self.first_sample is None:
+                        self.first_sample = samplenum
+                    pending = None
+                if sck != active:
+                    continue
+
+                # This was not the LSB unless WS has flipped.
+                if ws == self.oldws:
+                    bits.append(sd)
+                    continue
+
+                left = bool(self.oldws) == left_high
+                self.oldws = ws
+                if right_shifted:
+                    bits.append(sd)
+                    pending = (bits, left)
+                    bits = bytearray()
+                    continue
+
+                put_word(bits, left, samplenum)
+                bits = bytearray((sd,))
+                self.ss_block = samplenum
+                # Save the first sample position.
+                if self.first_sample is None:
+                    self.first_sample = samplenum
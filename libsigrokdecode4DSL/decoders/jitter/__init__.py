@@ -24,6 +24,13 @@ It allows to define a clock source channel and a resulting signal channel.
 
 Each time a significant edge is detected in the clock source, we calculate the
 elapsed time before the resulting signal answers and report the timing jitter.
+
+The statistics of all jitter values (count, mean, standard deviation,
+minimum, maximum, median and 99th percentile) are kept as well and shown
+at the end of the capture, or every N values if the 'summary' option is
+set. The binary output has a histogram of the values. On long captures,
+disable the 'values' option to get the statistics only, it also turns off
+the per value ASCII float binary output.
 '''
 
 from .pd import Decoder
@@ -18,6 +18,7 @@
 ##
 
 import sigrokdecode as srd
+from common.srdhelper.stats import RunningStats, P2Quantile, Histogram
 
 # Helper dictionary for edge detection.
 edge_detector = {
@@ -29,6 +30,21 @@ edge_detector = {
 class SamplerateError(Exception):
     pass
 
+def format_time(delta):
+    # Adjust granularity.
+    if delta == 0 or delta >= 1:
+        return '%.1fs' % (delta)
+    elif delta <= 1e-12:
+        return '%.1ffs' % (delta * 1e15)
+    elif delta <= 1e-9:
+        return '%.1fps' % (delta * 1e12)
+    elif delta <= 1e-6:
+        return '%.1fns' % (delta * 1e9)
+    elif delta <= 1e-3:
+        return '%.1fμs' % (delta * 1e6)
+    else:
+        return '%.1fms' % (delta * 1e3)
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'jitter'
@@ -48,19 +64,26 @@ class Decoder(srd.Decoder):
             'default': 'rising', 'values': ('rising', 'falling', 'both'), 'idn':'dec_jitter_opt_clk_polarity'},
         {'id': 'sig_polarity', 'desc': 'Resulting signal edge polarity',
             'default': 'rising', 'values': ('rising', 'falling', 'both'), 'idn':'dec_jitter_opt_sig_polarity'},
+        {'id': 'values', 'desc': 'Annotate each jitter value',
+            'default': 'yes', 'values': ('yes', 'no'), 'idn':'dec_jitter_opt_values'},
+        {'id': 'summary', 'desc': 'Summary every N values (0: at the end)',
+            'default': 0, 'idn':'dec_jitter_opt_summary'},
     )
     annotations = (
         ('jitter', 'Jitter value'),
         ('clk_missed', 'Clock missed'),
         ('sig_missed', 'Signal missed'),
+        ('summary', 'Jitter statistics'),
     )
     annotation_rows = (
         ('jitter', 'Jitter values', (0,)),
         ('clk_missed', 'Clock missed', (1,)),
         ('sig_missed', 'Signal missed', (2,)),
+        ('summary', 'Statistics', (3,)),
     )
     binary = (
         ('ascii-float', 'Jitter values as newline-separated ASCII floats'),
+        ('histogram', 'Jitter histogram as CSV (bin start, count)'),
     )
 
     def __init__(self):
@@ -74,10 +97,17 @@ class Decoder(srd.Decoder):
         self.sig_start = None
         self.clk_missed = 0
         self.sig_missed = 0
+        self.stats = RunningStats()
+        self.median = P2Quantile(0.5)
+        self.p99 = P2Quantile(0.99)
+        self.histogram = Histogram(64)
+        self.ss_summary = None
 
     def start(self):
         self.clk_edge = edge_detector[self.options['clk_polarity']]
         self.sig_edge = edge_detector[self.options['sig_polarity']]
+        self.put_values = self.options['values'] == 'yes'
+        self.summary_every = max(int(self.options['summary']), 0)
         self.out_ann = self.register(srd.OUTPUT_ANN)
         self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.out_clk_missed = self.register(srd.OUTPUT_META,
@@ -91,21 +121,8 @@ class Decoder(srd.Decoder):
 
     # Helper function for jitter time annotations.
     def putx(self, delta):
-        # Adjust granularity.
-        if delta == 0 or delta >= 1:
-            delta_s = '%.1fs' % (delta)
-        elif delta <= 1e-12:
-            delta_s = '%.1ffs' % (delta * 1e15)
-        elif delta <= 1e-9:
-            delta_s = '%.1fps' % (delta * 1e12)
-        elif delta <= 1e-6:
-            delta_s = '%.1fns' % (delta * 1e9)
-        elif delta <= 1e-3:
-            delta_s = '%.1fμs' % (delta * 1e6)
-        else:
-            delta_s = '%.1fms' % (delta * 1e3)
-
-        self.put(self.clk_start, self.sig_start, self.out_ann, [0, [delta_s]])
+        self.put(self.clk_start, self.sig_start, self.out_ann,
+                 [0, [format_time(delta)]])
 
     # Helper function for ASCII float jitter values (one value per line).
     def putb(self, delta):
@@ -120,6 +137,41 @@ class Decoder(srd.Decoder):
     def putm(self, data):
         self.put(self.samplenum, self.samplenum, self.out_ann, data)
 
+    # Helper function for the statistics of all jitter values so far.
+    def putsummary(self):
+        stats = self.stats
+        if not stats.count:
+            return
+        t = lambda samples: format_time(samples / self.samplerate)
+        texts = [
+            'N: %d, mean: %s, stddev: %s, min: %s, max: %s, median: %s, 99%%: %s' %
+                (stats.count, t(stats.mean), t(stats.stddev), t(stats.min),
+                 t(stats.max), t(self.median.value), t(self.p99.value)),
+            'N: %d, mean: %s, stddev: %s' % (stats.count, t(stats.mean), t(stats.stddev)),
+            'Mean: %s' % t(stats.mean),
+        ]
+        self.put(self.ss_summary, self.sig_start, self.out_ann, [3, texts])
+
+        csv = ''.join('%s,%d\n' % (str(lo / self.samplerate), count)
+                      for lo, count in self.histogram.items())
+        self.put(self.ss_summary, self.sig_start, self.out_binary,
+                 [1, csv.encode('UTF-8')])
+        self.ss_summary = self.sig_start
+
+    def add_value(self, samples):
+        if self.ss_summary is None:
+            self.ss_summary = self.clk_start
+        self.stats.add(samples)
+        self.median.add(samples)
+        self.p99.add(samples)
+        self.histogram.add(samples)
+        if self.summary_every and self.stats.count % self.summary_every == 0:
+            self.putsummary()
+
+    def end(self):
+        if self.ss_summary != self.sig_start:
+            self.putsummary()
+
     def handle_clk(self, clk, sig):
         if self.clk_start == self.samplenum:
             # Clock transition already treated.
@@ -160,8 +212,10 @@ class Decoder(srd.Decoder):
             self.state = 'CLK'
             # Calculate and report the timing jitter.
             delta = (self.sig_start - self.clk_start) / self.samplerate
-            self.putx(delta)
-            self.putb(delta)
+            if self.put_values:
+                self.putx(delta)
+                self.putb(delta)
+            self.add_value(self.sig_start - self.clk_start)
             return False
         else:
             if self.clk_start != self.samplenum \
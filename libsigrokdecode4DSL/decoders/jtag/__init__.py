@@ -22,6 +22,12 @@ JTAG (Joint Test Action Group), a.k.a. "IEEE 1149.1: Standard Test Access Port
 and Boundary-Scan Architecture", is a protocol used for testing, debugging,
 and flashing various digital ICs.
 
+Scans longer than 'Summarize scans longer than (bits)' (0 for never)
+only get bit annotations for their first bits. Their bitstring annotation
+shows the length, the CRC32 and the first and last bytes (first shifted
+bit in the LSB of the first byte) instead of the whole value, so long
+boundary scan chains and bitstream loads decode in linear time.
+
 Details:
 https://en.wikipedia.org/wiki/Joint_Test_Action_Group
 http://focus.ti.com/lit/an/ssya002c/ssya002c.pdf
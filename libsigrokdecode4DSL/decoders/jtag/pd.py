@@ -27,6 +27,8 @@
 ##
 
 import sigrokdecode as srd
+from array import array
+import zlib
 
 '''
 OUTPUT_PYTHON format:
@@ -49,8 +51,18 @@ All bitstrings are a list consisting of two items. The first is a sequence
 of '1' and '0' characters (the right-most character is the LSB. Example:
 '01110001', where 1 is the LSB). The second item is a list of ss/es values
 for each bit that is in the bitstring.
+
+Packets are only sent when a stacked decoder uses their <ptype> (see the
+'input_packets' decoder attribute).
 '''
 
+# Pin values to bit texts.
+BIT_TEXTS = (['0'], ['1'])
+BIT_CHARS = bytes.maketrans(b'\x00\x01', b'01')
+
+# Bytes at the start and the end of a scan summary.
+SUMMARY_BYTES = 8
+
 jtag_states = [
         # Intro "tree"
         'TEST-LOGIC-RESET', 'RUN-TEST/IDLE',
@@ -97,6 +109,11 @@ class Decoder(srd.Decoder):
         ('states', 'States', tuple(range(15 + 1))),
     )
 
+    options = (
+        {'id': 'summary_bits', 'desc': 'Summarize scans longer than (bits)',
+            'default': 4096, 'idn':'dec_jtag_opt_summary_bits'},
+    )
+
     def __init__(self):
         self.reset()
 
@@ -104,27 +121,31 @@ class Decoder(srd.Decoder):
         # self.state = 'TEST-LOGIC-RESET'
         self.state = 'RUN-TEST/IDLE'
         self.oldstate = None
-        self.bits_tdi = []
-        self.bits_tdo = []
-        self.bits_samplenums_tdi = []
-        self.bits_samplenums_tdo = []
+        # The shifted bits in shift order (first bit first), and the
+        # rising TCK edges of the scan: the edge which entered SHIFT-*,
+        # then the edge of every bit.
+        self.bits_tdi = bytearray()
+        self.bits_tdo = bytearray()
+        self.edges = array('Q')
         self.ss_item = self.es_item = None
         self.ss_bitstring = self.es_bitstring = None
         self.saved_item = None
         self.first = True
-        self.first_bit = True
         self.bits_cnt = 0
         self.data_ready = False
 
     def start(self):
         self.out_python = self.register(srd.OUTPUT_PYTHON)
         self.out_ann = self.register(srd.OUTPUT_ANN)
+        self.packets = self.output_packets(self.out_python)
+        self.summary_bits = self.options['summary_bits']
 
     def putx(self, data):
         self.put(self.ss_item, self.es_item, self.out_ann, data)
 
     def putp(self, data):
-        self.put(self.ss_item, self.es_item, self.out_python, data)
+        if self.packets is None or data[0] in self.packets:
+            self.put(self.ss_item, self.es_item, self.out_python, data)
 
     def putx_bs(self, data):
         self.put(self.ss_bitstring, self.es_bitstring, self.out_ann, data)
@@ -173,117 +194,88 @@ class Decoder(srd.Decoder):
         elif self.state == 'UPDATE-IR':
             self.state = 'SELECT-DR-SCAN' if (tms) else 'RUN-TEST/IDLE'
 
-    def handle_rising_tck_edge(self, tdi, tdo, tck, tms, trst, srst, rtck):
+    def put_bit(self, bits, ann):
+        # Annotation of the last shifted bit, only the first
+        # 'summary_bits' bits of a scan get one.
+        if not self.summary_bits or len(bits) <= self.summary_bits:
+            self.putx([ann, BIT_TEXTS[bits[-1]]])
+
+    def put_bitstring(self, name, bits, ann):
+        t = self.state[-2:] + ' ' + name
+        n = len(bits)
+        # MSB (last shifted bit) first.
+        b = bytes(reversed(bits)).translate(BIT_CHARS).decode()
+        value = int(b, 2)
+        if self.summary_bits and n > self.summary_bits:
+            data = value.to_bytes((n + 7) // 8, 'little')
+            s = '%s: %d bits, CRC32 %08X, first %s, last %s' % (t, n,
+                zlib.crc32(data), data[:SUMMARY_BYTES].hex(' ').upper(),
+                data[-SUMMARY_BYTES:].hex(' ').upper())
+        else:
+            s = '%s:  (0x%X), %d bits' % (t, value, n)
+        self.putx_bs([ann, [s]])
+        if self.packets is None or t in self.packets:
+            # [ss, es] of every bit, last bit first, and the edge which
+            # entered SHIFT-* at the end.
+            e = self.edges
+            samplenums = [[e[i], e[i + 1]] for i in range(len(e) - 2, 0, -1)]
+            samplenums.insert(0, [e[-1], self.es_bitstring])
+            samplenums.append([e[0], -1])
+            self.putp_bs([t, [b, samplenums]])
+
+    def handle_rising_tck_edge(self, samplenum, tms, tdi, tdo):
         # Rising TCK edges always advance the state machine.
         self.advance_state_machine(tms)
 
         if self.first:
             # Save the start sample and item for later (no output yet).
-            self.ss_item = self.samplenum
+            self.ss_item = samplenum
             self.first = False
         else:
             # Output the saved item (from the last CLK edge to the current).
-            self.es_item = self.samplenum
+            self.es_item = samplenum
             # Output the old state (from last rising TCK edge to current one).
             self.putx([jtag_states.index(self.oldstate), [self.oldstate]])
             self.putp(['NEW STATE', self.state])
 
-        # Upon SHIFT-IR/SHIFT-DR collect the current TDI/TDO values.
-        if self.state.startswith('SHIFT-'):
-            #if self.first_bit:
-                #self.ss_bitstring = self.samplenum
-            #    self.first_bit = False
-                
-            #else:
+        # Upon SHIFT-IR/SHIFT-DR collect the current TDI/TDO values. The
+        # edge which entered SHIFT-* has no valid bit. The bits get their
+        # annotation at the next edge.
+        shift = self.state.startswith('SHIFT-')
+        if shift or (self.oldstate.startswith('SHIFT-') and \
+                     self.state.startswith('EXIT1-')):
             if self.bits_cnt > 0:
                 if self.bits_cnt == 1:
-                    self.ss_bitstring = self.samplenum
-
-                if self.bits_cnt > 1:
-                    self.putx([16, [str(self.bits_tdi[0])]])
-                    self.putx([17, [str(self.bits_tdo[0])]])
-                    # Use self.samplenum as ES of the previous bit.
-                    self.bits_samplenums_tdi[0][1] = self.samplenum
-                    self.bits_samplenums_tdo[0][1] = self.samplenum
-                    
-                self.bits_tdi.insert(0, tdi)
-                self.bits_tdo.insert(0, tdo)
-                  
-            # Use self.samplenum as SS of the current bit.
-            self.bits_samplenums_tdi.insert(0, [self.samplenum, -1])
-            self.bits_samplenums_tdo.insert(0, [self.samplenum, -1])
-                    
+                    self.ss_bitstring = samplenum
+                else:
+                    self.put_bit(self.bits_tdi, 16)
+                    self.put_bit(self.bits_tdo, 17)
+                self.bits_tdi.append(tdi)
+                self.bits_tdo.append(tdo)
+            self.edges.append(samplenum)
             self.bits_cnt = self.bits_cnt + 1
 
-        # Output all TDI/TDO bits if we just switched from SHIFT-* to EXIT1-*.
-        if self.oldstate.startswith('SHIFT-') and \
-           self.state.startswith('EXIT1-'):
-			
-            #self.es_bitstring = self.samplenum
-            if self.bits_cnt > 0:
-                if self.bits_cnt == 1:  # Only shift one bit
-                    self.ss_bitstring = self.samplenum
-                    self.bits_tdi.insert(0, tdi)
-                    self.bits_tdo.insert(0, tdo)
-                    ## Use self.samplenum as SS of the current bit.
-                    self.bits_samplenums_tdi.insert(0, [self.samplenum, -1])
-                    self.bits_samplenums_tdo.insert(0, [self.samplenum, -1])
-                else:
-                    ### ----------------------------------------------------------------
-                    self.putx([16, [str(self.bits_tdi[0])]])
-                    self.putx([17, [str(self.bits_tdo[0])]])
-                    ### Use self.samplenum as ES of the previous bit.
-                    self.bits_samplenums_tdi[0][1] = self.samplenum
-                    self.bits_samplenums_tdo[0][1] = self.samplenum	
-                    
-                    self.bits_tdi.insert(0, tdi)
-                    self.bits_tdo.insert(0, tdo)
-                    
-                    ## Use self.samplenum as SS of the current bit.
-                    self.bits_samplenums_tdi.insert(0, [self.samplenum, -1])
-                    self.bits_samplenums_tdo.insert(0, [self.samplenum, -1])
-                    ## ----------------------------------------------------------------
-                
+            # Output all TDI/TDO bits if we just switched from SHIFT-* to EXIT1-*.
+            if not shift:
                 self.data_ready = True
+                self.bits_cnt = 0
 
-            self.first_bit = True
-            self.bits_cnt = 0
-        if self.oldstate.startswith('EXIT'):# and \
-           #self.state.startswith('PAUSE-'):
-            if self.data_ready:
-                self.data_ready = False
-                self.es_bitstring = self.samplenum
-                t = self.state[-2:] + ' TDI'
-                b = ''.join(map(str, self.bits_tdi))
-                h = ' (0x%X' % int('0b' + b, 2) + ')'
-                s = t + ': ' + h + ', ' + str(len(self.bits_tdi)) + ' bits' #b +
-                self.putx_bs([18, [s]])
-                self.bits_samplenums_tdi[0][1] = self.samplenum # ES of last bit.
-                self.putp_bs([t, [b, self.bits_samplenums_tdi]])
-                self.putx([16, [str(self.bits_tdi[0])]]) # Last bit.
-                self.bits_tdi = []
-                self.bits_samplenums_tdi = []
-
-                t = self.state[-2:] + ' TDO'
-                b = ''.join(map(str, self.bits_tdo))
-                h = ' (0x%X' % int('0b' + b, 2) + ')'
-                s = t + ': ' + h + ', ' + str(len(self.bits_tdo)) + ' bits' #+ b 
-                self.putx_bs([19, [s]])
-                self.bits_samplenums_tdo[0][1] = self.samplenum # ES of last bit.
-                self.putp_bs([t, [b, self.bits_samplenums_tdo]])
-                self.putx([17, [str(self.bits_tdo[0])]]) # Last bit.
-                self.bits_tdo = []
-                self.bits_samplenums_tdo = []
-
-            #self.first_bit = True
-            #self.bits_cnt = 0
+        if self.oldstate.startswith('EXIT') and self.data_ready:
+            self.data_ready = False
+            self.es_bitstring = samplenum
+            self.put_bitstring('TDI', self.bits_tdi, 18)
+            self.put_bit(self.bits_tdi, 16) # Last bit.
+            self.put_bitstring('TDO', self.bits_tdo, 19)
+            self.put_bit(self.bits_tdo, 17) # Last bit.
+            self.bits_tdi = bytearray()
+            self.bits_tdo = bytearray()
+            self.edges = array('Q')
 
-            #self.ss_bitstring = self.samplenum
-        
-        self.ss_item = self.samplenum
+        self.ss_item = samplenum
 
     def decode(self):
         while True:
-            # Wait for a rising edge on TCK.
-            (tdi, tdo, tck, tms, trst, srst, rtck) = self.wait({2: 'r'})
-            self.handle_rising_tck_edge(tdi, tdo, tck, tms, trst, srst, rtck)
+            # Rising edges on TCK.
+            for samplenum, pins in self.wait_edges([2]):
+                if pins[2] == 1:
+                    self.handle_rising_tck_edge(samplenum, pins[3], pins[0], pins[1])
@@ -20,6 +20,10 @@
 '''
 This decoder stacks on top of the 'i2c' PD and decodes the National LM75
 (and compatibles) temperature sensor protocol.
+
+It takes whole I²C transactions, or the single packets when the I²C
+decoder sends all of them (e.g. to a frontend). The slave address is
+checked as a 7-bit address whatever the I²C decoder's address format.
 '''
 
 from .pd import Decoder
@@ -20,6 +20,7 @@
 # TODO: Better support for various LM75 compatible devices.
 
 import sigrokdecode as srd
+from common.srdhelper.i2c import address_from_bits
 
 # LM75 only supports 9 bit resolution, compatible devices usually 9-12 bits.
 resolution = {
@@ -48,6 +49,7 @@ class Decoder(srd.Decoder):
     inputs = ['i2c']
     outputs = []
     tags = ['Sensor']
+    input_packets = ('TRANSACTION',)
     options = (
         {'id': 'sensor', 'desc': 'Sensor type', 'default': 'lm75',
             'values': ('lm75',), 'idn':'dec_lm75_opt_sensor'},
@@ -69,6 +71,7 @@ class Decoder(srd.Decoder):
         self.state = 'IDLE'
         self.reg = 0x00 # Currently selected register
         self.databytes = []
+        self.bits = None
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
@@ -158,13 +161,21 @@ class Decoder(srd.Decoder):
         self.handle_temperature_reg(b, 'T_OS trip temperature', rw)
 
     def decode(self, ss, es, data):
+        if data[0] == 'TRANSACTION':
+            self.decode_transaction(data[1])
+            return
+
+        # The single packets come along when a frontend or another stacked
+        # decoder takes all of the I²C decoder's packets.
         cmd, databyte = data
 
         # Store the start/end samples of this I²C packet.
         self.ss, self.es = ss, es
 
         # State machine.
-        if self.state == 'IDLE':
+        if cmd == 'BITS':
+            self.bits = databyte
+        elif self.state == 'IDLE':
             # Wait for an I²C START condition.
             if cmd != 'START':
                 return
@@ -172,6 +183,9 @@ class Decoder(srd.Decoder):
         elif self.state == 'GET SLAVE ADDR':
             # Wait for an address read/write operation.
             if cmd in ('ADDRESS READ', 'ADDRESS WRITE'):
+                # Check the 7-bit address, like for transactions.
+                if self.bits is not None:
+                    databyte = address_from_bits(self.bits)
                 self.warn_upon_invalid_slave(databyte)
                 self.state = cmd[8:] + ' REGS' # READ REGS / WRITE REGS
         elif self.state in ('READ REGS', 'WRITE REGS'):
@@ -184,3 +198,19 @@ class Decoder(srd.Decoder):
             else:
                 # self.putx([0, ['Ignoring: %s (data=%s)' % (cmd, databyte)]])
                 pass
+
+    def decode_transaction(self, t):
+        handle_reg = getattr(self, 'handle_reg_0x%02x' % self.reg)
+
+        for m in range(len(t)):
+            first, end = t.span(m)
+            rw = 'READ' if t.is_read(m) else 'WRITE'
+            for i in range(first, end):
+                # Store the start/end samples of this byte.
+                self.ss, self.es = t.byte_ss[i], t.byte_es[i]
+                if i == first:
+                    # Only the first slave address is checked.
+                    if i == 0:
+                        self.warn_upon_invalid_slave(t.address(0))
+                    continue
+                handle_reg(t.data[i], rw)
@@ -54,6 +54,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['spi']
     outputs = []
+    input_packets = ('CS-CHANGE', 'DATA')
     tags = ['Display']
     annotations = (
         ('register', 'Registers written to the device'),
@@ -19,17 +19,14 @@
 ##
 
 import sigrokdecode as srd
+from array import array
 from math import ceil
+from common.srdhelper.crc import Crc, CRC16_MODBUS
 
 RX = 0
 TX = 1
 rxtx_channels = ('RX', 'TX')
 
-class No_more_data(Exception):
-    '''This exception is a signal that we should stop parsing an ADU as there
-    is no more data to parse.'''
-    pass
-
 class Data:
     '''The Data class is used to hold the bytes from the serial decode.'''
     def __init__(self, start, end, data):
@@ -43,6 +40,10 @@ class Modbus_ADU:
     decoded data to the backend as it reads it. In Modbus' case, the state is
     the ADU up to that point. This class represents the state and writes the
     messages to the backend.
+    The parser of an ADU is a generator which is resumed for every byte that
+    comes in. It yields when it needs a byte that hasn't been received yet,
+    and after every annotation it puts, so each byte continues where the
+    previous one stopped.
     This class is for the common infrastructure between CS and SC. It should
     not be used directly, only inhereted from.'''
 
@@ -54,10 +55,17 @@ class Modbus_ADU:
         self.write_channel = write_channel
         self.last_byte_put = -1
         self.annotation_prefix = annotation_prefix
+        # Annotation name (without prefix) -> annotation index.
+        self.anns = parent.ann_prefixes[annotation_prefix]
         # Any Modbus message needs to be at least 4 bytes long. The Modbus
         # function may make this longer.
         self.minimum_length = 4
 
+        # The CRC is updated as the bytes come in, crcs[i] is the CRC of
+        # data[0] up to and including data[i].
+        self.crc = Crc(*CRC16_MODBUS)
+        self.crcs = array('H')
+
         # This variable is used by an external function to determine when the
         # next frame should be started.
         self.startNewFrame = False
@@ -66,6 +74,9 @@ class Modbus_ADU:
         # track of errors.
         self.hasError = False
 
+        # parse() is defined in the specific type of ADU.
+        self.parser = self.parse()
+
     def add_data(self, start, end, data):
         '''Let the frame handle another piece of data.
         start: start of this data
@@ -75,41 +86,57 @@ class Modbus_ADU:
         self.last_read = end
         if ptype == 'DATA':
             self.data.append(Data(start, end, pdata[0]))
-            self.parse() # parse() is defined in the specific type of ADU.
-
-    def puti(self, byte_to_put, annotation, message):
+            self.crc.update((pdata[0],))
+            self.crcs.append(self.crc.value)
+            if self.parser is not None:
+                try:
+                    next(self.parser)
+                except StopIteration:
+                    self.parser = None
+
+    def put(self, byte_to_put, annotation, message):
         '''This class keeps track of how much of the data has already been
         annotated. This function tells the parent class to write message, but
-        only if it hasn't written about this bit before.
+        only if it hasn't written about this bit before. Returns whether the
+        message was written.
         byte_to_put: Only write if it hasn't yet written byte_to_put. It will
                      write from the start of self.last_byte_put+1 to the end
                      of byte_to_put.
         annotation: Annotation to write to, without annotation_prefix.
         message: Message to write.'''
-        if byte_to_put > len(self.data) - 1:
-            # If the byte_to_put hasn't been read yet.
-            raise No_more_data
-
         if annotation == 'error':
             self.hasError = True
 
         if byte_to_put > self.last_byte_put:
-            self.parent.puta(
+            self.parent.put(
                 self.data[self.last_byte_put + 1].start,
                 self.data[byte_to_put].end,
-                self.annotation_prefix + annotation,
-                message)
+                self.parent.out_ann,
+                [self.anns[annotation], [message]])
             self.last_byte_put = byte_to_put
-            raise No_more_data
+            return True
+        return False
+
+    def wait(self, byte):
+        '''Wait until data[byte] has been received.'''
+        while byte > len(self.data) - 1:
+            yield
+
+    def puti(self, byte_to_put, annotation, message):
+        '''Wait for byte_to_put, put message, and continue with the next
+        byte if something was written.'''
+        yield from self.wait(byte_to_put)
+        if self.put(byte_to_put, annotation, message):
+            yield
 
     def putl(self, annotation, message, maximum=None):
-        '''Puts the last byte on the stack with message. The contents of the
-        last byte will be applied to message using format.'''
-        last_byte_address = len(self.data) - 1
-        if maximum is not None and last_byte_address > maximum:
-            return
-        self.puti(last_byte_address, annotation,
-                  message.format(self.data[-1].data))
+        '''Puts every following byte with message, up to and including
+        data[maximum]. The contents of the byte will be applied to message
+        using format.'''
+        while maximum is None or len(self.data) - 1 <= maximum:
+            self.put(len(self.data) - 1, annotation,
+                     message.format(self.data[-1].data))
+            yield
 
     def close(self, message_overflow):
         '''Function to be called when next message is started. As there is
@@ -136,47 +163,35 @@ class Modbus_ADU:
             self.parent.puta(data[0].start, data[-1].end,
                              'error-indication', 'Frame contains error')
         if len(data) > 256:
-            try:
-                self.puti(len(data) - 1, 'error',
-                    'Modbus data frames are limited to 256 bytes')
-            except No_more_data:
-                pass
+            self.put(len(data) - 1, 'error',
+                'Modbus data frames are limited to 256 bytes')
 
     def check_crc(self, byte_to_put):
         '''Check the CRC code, data[byte_to_put] is the 2nd byte of the CRC.'''
+        yield from self.wait(byte_to_put)
         crc_byte1, crc_byte2 = self.calc_crc(byte_to_put)
         data = self.data
         if data[-2].data == crc_byte1 and data[-1].data == crc_byte2:
-            self.puti(byte_to_put, 'crc', 'CRC correct')
+            yield from self.puti(byte_to_put, 'crc', 'CRC correct')
         else:
-            self.puti(byte_to_put, 'error',
+            yield from self.puti(byte_to_put, 'error',
                 'CRC should be {} {}'.format(crc_byte1, crc_byte2))
 
     def half_word(self, start):
-        '''Return the half word (16 bit) value starting at start bytes in. If
-        it goes out of range it raises the usual errors.'''
-        if (start + 1) > (len(self.data) - 1):
-            # If there isn't enough length to access data[start + 1].
-            raise No_more_data
+        '''Return the half word (16 bit) value starting at start bytes in,
+        after waiting for it to be received.'''
+        yield from self.wait(start + 1)
         return self.data[start].data * 0x100 + self.data[start + 1].data
 
     def calc_crc(self, last_byte):
-        '''Calculate the CRC, as described in the spec.
+        '''Return the CRC, as described in the spec.
         The last byte of the CRC should be data[last_byte].'''
         if last_byte < 3:
             # Every Modbus ADU should be as least 4 long, so we should never
             # have to calculate a CRC on something shorter.
             raise Exception('Could not calculate CRC: message too short')
 
-        result = 0xFFFF
-        magic_number = 0xA001 # As defined in the modbus specification.
-        for byte in self.data[:last_byte - 1]:
-            result = result ^ byte.data
-            for i in range(8):
-                LSB = result & 1
-                result = result >> 1
-                if (LSB): # If the LSB is true.
-                    result = result ^ magic_number
+        result = self.crcs[last_byte - 2]
         byte1 = result & 0xFF
         byte2 = (result & 0xFF00) >> 8
         return (byte1, byte2)
@@ -185,44 +200,44 @@ class Modbus_ADU:
         '''Parse function 5, write single coil.'''
         self.minimum_length = 8
 
-        self.puti(1, 'function', 'Function 5: Write Single Coil')
+        yield from self.puti(1, 'function', 'Function 5: Write Single Coil')
 
-        address = self.half_word(2)
-        self.puti(3, 'address',
+        address = yield from self.half_word(2)
+        yield from self.puti(3, 'address',
             'Address 0x{:X} / {:d}'.format(address, address + 10000))
 
-        raw_value = self.half_word(4)
+        raw_value = yield from self.half_word(4)
         value = 'Invalid Coil Value'
         if raw_value == 0x0000:
             value = 'Coil Value OFF'
         elif raw_value == 0xFF00:
             value = 'Coil Value ON'
-        self.puti(5, 'data', value)
+        yield from self.puti(5, 'data', value)
 
-        self.check_crc(7)
+        yield from self.check_crc(7)
 
     def parse_write_single_register(self):
         '''Parse function 6, write single register.'''
         self.minimum_length = 8
 
-        self.puti(1, 'function', 'Function 6: Write Single Register')
+        yield from self.puti(1, 'function', 'Function 6: Write Single Register')
 
-        address = self.half_word(2)
-        self.puti(3, 'address',
+        address = yield from self.half_word(2)
+        yield from self.puti(3, 'address',
             'Address 0x{:X} / {:d}'.format(address, address + 30000))
 
-        value = self.half_word(4)
+        value = yield from self.half_word(4)
         value_formatted = 'Register Value 0x{0:X} / {0:d}'.format(value)
-        self.puti(5, 'data', value_formatted)
+        yield from self.puti(5, 'data', value_formatted)
 
-        self.check_crc(7)
+        yield from self.check_crc(7)
 
     def parse_diagnostics(self):
         '''Parse function 8, diagnostics. This function has many subfunctions,
         but they are all more or less the same.'''
         self.minimum_length = 8
 
-        self.puti(1, 'function', 'Function 8: Diagnostics')
+        yield from self.puti(1, 'function', 'Function 8: Diagnostics')
 
         diag_subfunction = {
             0: 'Return Query data',
@@ -241,42 +256,42 @@ class Modbus_ADU:
             18: 'Return Bus Character Overrun Count',
             20: 'Return Overrun Counter and Flag',
         }
-        subfunction = self.half_word(2)
+        subfunction = yield from self.half_word(2)
         subfunction_name = diag_subfunction.get(subfunction,
                                                 'Reserved subfunction')
-        self.puti(3, 'data',
+        yield from self.puti(3, 'data',
             'Subfunction {}: {}'.format(subfunction, subfunction_name))
 
-        diagnostic_data = self.half_word(4)
-        self.puti(5, 'data',
+        diagnostic_data = yield from self.half_word(4)
+        yield from self.puti(5, 'data',
             'Data Field: {0} / 0x{0:04X}'.format(diagnostic_data))
 
-        self.check_crc(7)
+        yield from self.check_crc(7)
 
     def parse_mask_write_register(self):
         '''Parse function 22, Mask Write Register.'''
         self.minimum_length = 10
         data = self.data
 
-        self.puti(1, 'function', 'Function 22: Mask Write Register')
+        yield from self.puti(1, 'function', 'Function 22: Mask Write Register')
 
-        address = self.half_word(2)
-        self.puti(3, 'address',
+        address = yield from self.half_word(2)
+        yield from self.puti(3, 'address',
             'Address 0x{:X} / {:d}'.format(address, address + 30001))
 
-        self.half_word(4) # To make sure we don't oveflow data.
+        yield from self.wait(5)
         and_mask_1 = data[4].data
         and_mask_2 = data[5].data
-        self.puti(5, 'data',
+        yield from self.puti(5, 'data',
             'AND mask: {:08b} {:08b}'.format(and_mask_1, and_mask_2))
 
-        self.half_word(6) # To make sure we don't oveflow data.
+        yield from self.wait(7)
         or_mask_1 = data[6].data
         or_mask_2 = data[7].data
-        self.puti(7, 'data',
+        yield from self.puti(7, 'data',
             'OR mask: {:08b} {:08b}'.format(or_mask_1, or_mask_2))
 
-        self.check_crc(9)
+        yield from self.check_crc(9)
 
     def parse_not_implemented(self):
         '''Explicitly mark certain functions as legal functions, but not
@@ -292,11 +307,11 @@ class Modbus_ADU:
             24: 'Read FIFO Queue',
             43: 'Read Device Identification/Encapsulated Interface Transport',
         }[function]
-        self.puti(1, 'function',
+        yield from self.puti(1, 'function',
             'Function {}: {} (not supported)'.format(function, functionname))
 
         # From there on out we can keep marking it unsupported.
-        self.putl('data', 'This function is not currently supported')
+        yield from self.putl('data', 'This function is not currently supported')
 
 class Modbus_ADU_SC(Modbus_ADU):
     '''SC stands for Server -> Client.'''
@@ -304,54 +319,47 @@ class Modbus_ADU_SC(Modbus_ADU):
         '''Select which specific Modbus function we should parse.'''
         data = self.data
 
-        # This try-catch is being used as flow control.
-        try:
-            server_id = data[0].data
-            if 1 <= server_id <= 247:
-                message = 'Slave ID: {}'.format(server_id)
-            else:
-                message = 'Slave ID {} is invalid'
-            self.puti(0, 'server-id', message)
-
-            function = data[1].data
-            if function == 1 or function == 2:
-                self.parse_read_bits()
-            elif function == 3 or function == 4 or function == 23:
-                self.parse_read_registers()
-            elif function == 5:
-                self.parse_write_single_coil()
-            elif function == 6:
-                self.parse_write_single_register()
-            elif function == 7:
-                self.parse_read_exception_status()
-            elif function == 8:
-                self.parse_diagnostics()
-            elif function == 11:
-                self.parse_get_comm_event_counter()
-            elif function == 12:
-                self.parse_get_comm_event_log()
-            elif function == 15 or function == 16:
-                self.parse_write_multiple()
-            elif function == 17:
-                self.parse_report_server_id()
-            elif function == 22:
-                self.parse_mask_write_register()
-            elif function in {21, 21, 24, 43}:
-                self.parse_not_implemented()
-            elif function > 0x80:
-                self.parse_error()
-            else:
-                self.puti(1, 'error',
-                          'Unknown function: {}'.format(data[1].data))
-                self.putl('error', 'Unknown function')
+        server_id = data[0].data
+        if 1 <= server_id <= 247:
+            message = 'Slave ID: {}'.format(server_id)
+        else:
+            message = 'Slave ID {} is invalid'
+        yield from self.puti(0, 'server-id', message)
 
-            # If the message gets here without raising an exception, the
-            # message goes on longer than it should.
-            self.putl('error', 'Message too long')
+        function = data[1].data
+        if function == 1 or function == 2:
+            yield from self.parse_read_bits()
+        elif function == 3 or function == 4 or function == 23:
+            yield from self.parse_read_registers()
+        elif function == 5:
+            yield from self.parse_write_single_coil()
+        elif function == 6:
+            yield from self.parse_write_single_register()
+        elif function == 7:
+            yield from self.parse_read_exception_status()
+        elif function == 8:
+            yield from self.parse_diagnostics()
+        elif function == 11:
+            yield from self.parse_get_comm_event_counter()
+        elif function == 12:
+            yield from self.parse_get_comm_event_log()
+        elif function == 15 or function == 16:
+            yield from self.parse_write_multiple()
+        elif function == 17:
+            yield from self.parse_report_server_id()
+        elif function == 22:
+            yield from self.parse_mask_write_register()
+        elif function in {21, 21, 24, 43}:
+            yield from self.parse_not_implemented()
+        elif function > 0x80:
+            yield from self.parse_error()
+        else:
+            yield from self.puti(1, 'error',
+                                 'Unknown function: {}'.format(data[1].data))
+            yield from self.putl('error', 'Unknown function')
 
-        except No_more_data:
-            # Just a message saying we don't need to parse anymore this round.
-            pass
+        # If the parser gets here, the message goes on longer than it should.
+        yield from self.putl('error', 'Message too long')
 
     def parse_read_bits(self):
         self.mimumum_length = 5
@@ -360,18 +368,17 @@ class Modbus_ADU_SC(Modbus_ADU):
         function = data[1].data
 
         if function == 1:
-            self.puti(1, 'function', 'Function 1: Read Coils')
+            yield from self.puti(1, 'function', 'Function 1: Read Coils')
         else:
-            self.puti(1, 'function', 'Function 2: Read Discrete Inputs')
+            yield from self.puti(1, 'function', 'Function 2: Read Discrete Inputs')
 
+        yield from self.wait(2)
         bytecount = self.data[2].data
         self.minimum_length = 5 + bytecount # 3 before data, 2 CRC.
-        self.puti(2, 'length', 'Byte count: {}'.format(bytecount))
+        yield from self.puti(2, 'length', 'Byte count: {}'.format(bytecount))
 
-        # From here on out, we expect registers on 3 and 4, 5 and 6 etc.
-        # So registers never start when the length is even.
-        self.putl('data', '{:08b}', bytecount + 2)
-        self.check_crc(bytecount + 4)
+        yield from self.putl('data', '{:08b}', bytecount + 2)
+        yield from self.check_crc(bytecount + 4)
 
     def parse_read_registers(self):
         self.mimumum_length = 5
@@ -380,87 +387,99 @@ class Modbus_ADU_SC(Modbus_ADU):
 
         function = data[1].data
         if function == 3:
-            self.puti(1, 'function', 'Function 3: Read Holding Registers')
+            yield from self.puti(1, 'function', 'Function 3: Read Holding Registers')
         elif function == 4:
-            self.puti(1, 'function', 'Function 4: Read Input Registers')
+            yield from self.puti(1, 'function', 'Function 4: Read Input Registers')
         elif function == 23:
-            self.puti(1, 'function', 'Function 23: Read/Write Multiple Registers')
+            yield from self.puti(1, 'function', 'Function 23: Read/Write Multiple Registers')
 
+        yield from self.wait(2)
         bytecount = self.data[2].data
         self.minimum_length = 5 + bytecount # 3 before data, 2 CRC.
         if bytecount % 2 == 0:
-            self.puti(2, 'length', 'Byte count: {}'.format(bytecount))
+            yield from self.puti(2, 'length', 'Byte count: {}'.format(bytecount))
         else:
-            self.puti(2, 'error',
+            yield from self.puti(2, 'error',
                 'Error: Odd byte count ({})'.format(bytecount))
 
         # From here on out, we expect registers on 3 and 4, 5 and 6 etc.
-        # So registers never start when the length is even.
-        if len(data) % 2 == 1:
-            register_value = self.half_word(-2)
-            self.putl('data', '0x{0:04X} / {0}'.format(register_value),
-                      bytecount + 2)
-        else:
-            raise No_more_data
-
-        self.check_crc(bytecount + 4)
+        # So registers never start when the length is even, and nothing
+        # (not even the CRC or the end of the message) is annotated then.
+        crc_byte = bytecount + 4
+        while True:
+            last = len(data) - 1
+            if last % 2 == 1:
+                yield
+            elif last <= bytecount + 2:
+                register_value = data[-2].data * 0x100 + data[-1].data
+                self.put(last, 'data',
+                         '0x{0:04X} / {0}'.format(register_value))
+                yield
+            elif crc_byte > last:
+                yield
+            elif crc_byte > self.last_byte_put:
+                yield from self.check_crc(crc_byte)
+            else:
+                self.put(last, 'error', 'Message too long')
+                yield
 
     def parse_read_exception_status(self):
         self.mimumum_length = 5
 
-        self.puti(1, 'function', 'Function 7: Read Exception Status')
+        yield from self.puti(1, 'function', 'Function 7: Read Exception Status')
+        yield from self.wait(2)
         exception_status = self.data[2].data
-        self.puti(2, 'data',
-                  'Exception status: {:08b}'.format(exception_status))
-        self.check_crc(4)
+        yield from self.puti(2, 'data',
+                             'Exception status: {:08b}'.format(exception_status))
+        yield from self.check_crc(4)
 
     def parse_get_comm_event_counter(self):
         self.mimumum_length = 8
 
-        self.puti(1, 'function', 'Function 11: Get Comm Event Counter')
+        yield from self.puti(1, 'function', 'Function 11: Get Comm Event Counter')
 
-        status = self.half_word(2)
+        status = yield from self.half_word(2)
         if status == 0x0000:
-            self.puti(3, 'data', 'Status: not busy')
+            yield from self.puti(3, 'data', 'Status: not busy')
         elif status == 0xFFFF:
-            self.puti(3, 'data', 'Status: busy')
+            yield from self.puti(3, 'data', 'Status: busy')
         else:
-            self.puti(3, 'error', 'Bad status: 0x{:04X}'.format(status))
+            yield from self.puti(3, 'error', 'Bad status: 0x{:04X}'.format(status))
 
-        count = self.half_word(4)
-        self.puti(5, 'data', 'Event Count: {}'.format(count))
-        self.check_crc(7)
+        count = yield from self.half_word(4)
+        yield from self.puti(5, 'data', 'Event Count: {}'.format(count))
+        yield from self.check_crc(7)
 
     def parse_get_comm_event_log(self):
         self.mimumum_length = 11
-        self.puti(1, 'function', 'Function 12: Get Comm Event Log')
+        yield from self.puti(1, 'function', 'Function 12: Get Comm Event Log')
 
         data = self.data
 
+        yield from self.wait(2)
         bytecount = data[2].data
-        self.puti(2, 'length', 'Bytecount: {}'.format(bytecount))
+        yield from self.puti(2, 'length', 'Bytecount: {}'.format(bytecount))
         # The bytecount is the length of everything except the slaveID,
         # function code, bytecount and CRC.
         self.mimumum_length = 5 + bytecount
 
-        status = self.half_word(3)
+        status = yield from self.half_word(3)
         if status == 0x0000:
-            self.puti(4, 'data', 'Status: not busy')
+            yield from self.puti(4, 'data', 'Status: not busy')
         elif status == 0xFFFF:
-            self.puti(4, 'data', 'Status: busy')
+            yield from self.puti(4, 'data', 'Status: busy')
         else:
-            self.puti(4, 'error', 'Bad status: 0x{:04X}'.format(status))
+            yield from self.puti(4, 'error', 'Bad status: 0x{:04X}'.format(status))
 
-        event_count = self.half_word(5)
-        self.puti(6, 'data', 'Event Count: {}'.format(event_count))
+        event_count = yield from self.half_word(5)
+        yield from self.puti(6, 'data', 'Event Count: {}'.format(event_count))
 
-        message_count = self.half_word(7)
-        self.puti(8, 'data', 'Message Count: {}'.format(message_count))
+        message_count = yield from self.half_word(7)
+        yield from self.puti(8, 'data', 'Message Count: {}'.format(message_count))
 
-        self.putl('data', 'Event: 0x{:02X}'.format(data[-1].data),
-                  bytecount + 2)
+        yield from self.putl('data', 'Event: 0x{:02X}', bytecount + 2)
 
-        self.check_crc(bytecount + 4)
+        yield from self.check_crc(bytecount + 4)
 
     def parse_write_multiple(self):
         '''Function 15 and 16 are almost the same, so we can parse them both
@@ -477,27 +496,27 @@ class Modbus_ADU_SC(Modbus_ADU):
             max_outputs = 0x007B
             long_address_offset = 30001
 
-        self.puti(1, 'function',
+        yield from self.puti(1, 'function',
             'Function {}: Write Multiple {}'.format(function, data_unit))
 
-        starting_address = self.half_word(2)
+        starting_address = yield from self.half_word(2)
         # Some instruction manuals use a long form name for addresses, this is
         # listed here for convienience.
         address_name = long_address_offset + starting_address
-        self.puti(3, 'address',
+        yield from self.puti(3, 'address',
             'Start at address 0x{:X} / {:d}'.format(starting_address,
                                                     address_name))
 
-        quantity_of_outputs = self.half_word(4)
+        quantity_of_outputs = yield from self.half_word(4)
         if quantity_of_outputs <= max_outputs:
-            self.puti(5, 'data',
+            yield from self.puti(5, 'data',
                 'Write {} {}'.format(quantity_of_outputs, data_unit))
         else:
-            self.puti(5, 'error',
+            yield from self.puti(5, 'error',
                 'Bad value: {} {}. Max is {}'.format(quantity_of_outputs,
                                                      data_unit, max_outputs))
 
-        self.check_crc(7)
+        yield from self.check_crc(7)
 
     def parse_report_server_id(self):
         # Buildup of this function:
@@ -510,26 +529,32 @@ class Modbus_ADU_SC(Modbus_ADU):
         # 2 bytes of CRC
         self.mimumum_length = 7
         data = self.data
-        self.puti(1, 'function', 'Function 17: Report Server ID')
+        yield from self.puti(1, 'function', 'Function 17: Report Server ID')
 
+        yield from self.wait(2)
         bytecount = data[2].data
-        self.puti(2, 'length', 'Data is {} bytes long'.format(bytecount))
+        yield from self.puti(2, 'length', 'Data is {} bytes long'.format(bytecount))
 
-        self.puti(3, 'data', 'serverID: {}'.format(data[3].data))
+        yield from self.wait(3)
+        yield from self.puti(3, 'data', 'serverID: {}'.format(data[3].data))
 
+        yield from self.wait(4)
         run_indicator_status = data[4].data
         if run_indicator_status == 0x00:
-            self.puti(4, 'data', 'Run Indicator status: Off')
+            yield from self.puti(4, 'data', 'Run Indicator status: Off')
         elif run_indicator_status == 0xFF:
-            self.puti(4, 'data', 'Run Indicator status: On')
+            yield from self.puti(4, 'data', 'Run Indicator status: On')
         else:
-            self.puti(4, 'error',
+            yield from self.puti(4, 'error',
                 'Bad Run Indicator status: 0x{:X}'.format(run_indicator_status))
 
-        self.putl('data', 'Device specific data: {}, "{}"'.format(data[-1].data,
-                  chr(data[-1].data)), 2 + bytecount)
+        while len(data) - 1 <= 2 + bytecount:
+            value = data[-1].data
+            self.put(len(data) - 1, 'data',
+                     'Device specific data: {}, "{}"'.format(value, chr(value)))
+            yield
 
-        self.check_crc(4 + bytecount)
+        yield from self.check_crc(4 + bytecount)
 
     def parse_error(self):
         '''Parse a Modbus error message.'''
@@ -561,9 +586,10 @@ class Modbus_ADU_SC(Modbus_ADU):
         }
         functionname = '{}: {}'.format(functioncode,
             functions.get(functioncode, 'Unknown function'))
-        self.puti(1, 'function',
-                  'Error for function {}'.format(functionname))
+        yield from self.puti(1, 'function',
+                             'Error for function {}'.format(functionname))
 
+        yield from self.wait(2)
         error = self.data[2].data
         errorcodes = {
             1: 'Illegal Function',
@@ -577,8 +603,8 @@ class Modbus_ADU_SC(Modbus_ADU):
             11: 'Gateway Target Device failed to respond',
         }
         errorname = '{}: {}'.format(error, errorcodes.get(error, 'Unknown'))
-        self.puti(2, 'data', 'Error {}'.format(errorname))
-        self.check_crc(4)
+        yield from self.puti(2, 'data', 'Error {}'.format(errorname))
+        yield from self.check_crc(4)
 
 class Modbus_ADU_CS(Modbus_ADU):
     '''CS stands for Client -> Server.'''
@@ -586,49 +612,42 @@ class Modbus_ADU_CS(Modbus_ADU):
         '''Select which specific Modbus function we should parse.'''
         data = self.data
 
-        # This try-catch is being used as flow control.
-        try:
-            server_id = data[0].data
-            message = ''
-            if server_id == 0:
-                message = 'Broadcast message'
-            elif 1 <= server_id <= 247:
-                message = 'Slave ID: {}'.format(server_id)
-            elif 248 <= server_id <= 255:
-                message = 'Slave ID: {} (reserved address)'.format(server_id)
-            self.puti(0, 'server-id', message)
-
-            function = data[1].data
-            if function >= 1 and function <= 4:
-                self.parse_read_data_command()
-            if function == 5:
-                self.parse_write_single_coil()
-            if function == 6:
-                self.parse_write_single_register()
-            if function in {7, 11, 12, 17}:
-                self.parse_single_byte_request()
-            elif function == 8:
-                self.parse_diagnostics()
-            if function in {15, 16}:
-                self.parse_write_multiple()
-            elif function == 22:
-                self.parse_mask_write_register()
-            elif function == 23:
-                self.parse_read_write_registers()
-            elif function in {21, 21, 24, 43}:
-                self.parse_not_implemented()
-            else:
-                self.puti(1, 'error',
-                          'Unknown function: {}'.format(data[1].data))
-                self.putl('error', 'Unknown function')
+        server_id = data[0].data
+        message = ''
+        if server_id == 0:
+            message = 'Broadcast message'
+        elif 1 <= server_id <= 247:
+            message = 'Slave ID: {}'.format(server_id)
+        elif 248 <= server_id <= 255:
+            message = 'Slave ID: {} (reserved address)'.format(server_id)
+        yield from self.puti(0, 'server-id', message)
 
-            # If the message gets here without raising an exception, the
-            # message goes on longer than it should.
-            self.putl('error', 'Message too long')
+        function = data[1].data
+        if function >= 1 and function <= 4:
+            yield from self.parse_read_data_command()
+        if function == 5:
+            yield from self.parse_write_single_coil()
+        if function == 6:
+            yield from self.parse_write_single_register()
+        if function in {7, 11, 12, 17}:
+            yield from self.parse_single_byte_request()
+        elif function == 8:
+            yield from self.parse_diagnostics()
+        if function in {15, 16}:
+            yield from self.parse_write_multiple()
+        elif function == 22:
+            yield from self.parse_mask_write_register()
+        elif function == 23:
+            yield from self.parse_read_write_registers()
+        elif function in {21, 21, 24, 43}:
+            yield from self.parse_not_implemented()
+        else:
+            yield from self.puti(1, 'error',
+                                 'Unknown function: {}'.format(data[1].data))
+            yield from self.putl('error', 'Unknown function')
 
-        except No_more_data:
-            # Just a message saying we don't need to parse anymore this round.
-            pass
+        # If the parser gets here, the message goes on longer than it should.
+        yield from self.putl('error', 'Message too long')
 
     def parse_read_data_command(self):
         '''Interpret a command to read x units of data starting at address, ie
@@ -643,21 +662,22 @@ class Modbus_ADU_CS(Modbus_ADU):
                         4: 'Read Input Registers',
                         }[function]
 
-        self.puti(1, 'function',
-                  'Function {}: {}'.format(function, functionname))
+        yield from self.puti(1, 'function',
+                             'Function {}: {}'.format(function, functionname))
 
-        starting_address = self.half_word(2)
+        starting_address = yield from self.half_word(2)
         # Some instruction manuals use a long form name for addresses, this is
         # listed here for convienience.
         # Example: holding register 60 becomes 30061.
         address_name = 10000 * function + 1 + starting_address
-        self.puti(3, 'address',
+        yield from self.puti(3, 'address',
             'Start at address 0x{:X} / {:d}'.format(starting_address,
                                                     address_name))
 
-        self.puti(5, 'length',
-                  'Read {:d} units of data'.format(self.half_word(4)))
-        self.check_crc(7)
+        quantity = yield from self.half_word(4)
+        yield from self.puti(5, 'length',
+                             'Read {:d} units of data'.format(quantity))
+        yield from self.check_crc(7)
 
     def parse_single_byte_request(self):
         '''Some Modbus functions have no arguments, this parses those.'''
@@ -667,10 +687,10 @@ class Modbus_ADU_CS(Modbus_ADU):
                          12: 'Get Comm Event Log',
                          17: 'Report Slave ID',
                          }[function]
-        self.puti(1, 'function',
-                  'Function {}: {}'.format(function, function_name))
+        yield from self.puti(1, 'function',
+                             'Function {}: {}'.format(function, function_name))
 
-        self.check_crc(3)
+        yield from self.check_crc(3)
 
     def parse_write_multiple(self):
         '''Function 15 and 16 are almost the same, so we can parse them both
@@ -689,128 +709,127 @@ class Modbus_ADU_CS(Modbus_ADU):
             ratio_bytes_data = 2
             long_address_offset = 30001
 
-        self.puti(1, 'function',
+        yield from self.puti(1, 'function',
             'Function {}: Write Multiple {}'.format(function, data_unit))
 
-        starting_address = self.half_word(2)
+        starting_address = yield from self.half_word(2)
         # Some instruction manuals use a long form name for addresses, this is
         # listed here for convienience.
         address_name = long_address_offset + starting_address
-        self.puti(3, 'address',
+        yield from self.puti(3, 'address',
             'Start at address 0x{:X} / {:d}'.format(starting_address,
                                                     address_name))
 
-        quantity_of_outputs = self.half_word(4)
+        quantity_of_outputs = yield from self.half_word(4)
         if quantity_of_outputs <= max_outputs:
-            self.puti(5, 'length',
+            yield from self.puti(5, 'length',
                 'Write {} {}'.format(quantity_of_outputs, data_unit))
         else:
-            self.puti(5, 'error',
+            yield from self.puti(5, 'error',
                 'Bad value: {} {}. Max is {}'.format(quantity_of_outputs,
                                                      data_unit, max_outputs))
         proper_bytecount = ceil(quantity_of_outputs * ratio_bytes_data)
 
+        yield from self.wait(6)
         bytecount = self.data[6].data
         if bytecount == proper_bytecount:
-            self.puti(6, 'length', 'Byte count: {}'.format(bytecount))
+            yield from self.puti(6, 'length', 'Byte count: {}'.format(bytecount))
         else:
-            self.puti(6, 'error',
+            yield from self.puti(6, 'error',
                 'Bad byte count, is {}, should be {}'.format(bytecount,
                                                              proper_bytecount))
         self.mimumum_length = bytecount + 9
 
-        self.putl('data', 'Value 0x{:X}', 6 + bytecount)
+        yield from self.putl('data', 'Value 0x{:X}', 6 + bytecount)
 
-        self.check_crc(bytecount + 8)
+        yield from self.check_crc(bytecount + 8)
 
     def parse_read_file_record(self):
-        self.puti(1, 'function', 'Function 20: Read file records')
+        yield from self.puti(1, 'function', 'Function 20: Read file records')
 
         data = self.data
 
+        yield from self.wait(2)
         bytecount = data[2].data
 
         self.minimum_length = 5 + bytecount
         # 1 for serverID, 1 for function, 1 for bytecount, 2 for CRC.
 
         if 0x07 <= bytecount <= 0xF5:
-            self.puti(2, 'length', 'Request is {} bytes long'.format(bytecount))
+            yield from self.puti(2, 'length', 'Request is {} bytes long'.format(bytecount))
         else:
-            self.puti(2, 'error',
+            yield from self.puti(2, 'error',
                 'Request claims to be {} bytes long, legal values are between'
                 ' 7 and 247'.format(bytecount))
 
-        current_byte = len(data) - 1
         # Function 20 is a number of sub-requests, the first starting at 3,
         # the total length of the sub-requests is bytecount.
-        if current_byte <= bytecount + 2:
+        while len(data) - 1 <= bytecount + 2:
+            current_byte = len(data) - 1
             step = (current_byte - 3) % 7
             if step == 0:
                 if data[current_byte].data == 6:
-                    self.puti(current_byte, 'data', 'Start sub-request')
+                    self.put(current_byte, 'data', 'Start sub-request')
                 else:
-                    self.puti(current_byte, 'error',
+                    self.put(current_byte, 'error',
                         'First byte of subrequest should be 0x06')
-            elif step == 1:
-                raise No_more_data
             elif step == 2:
-                file_number = self.half_word(current_byte - 1)
-                self.puti(current_byte, 'data',
-                          'Read File number {}'.format(file_number))
-            elif step == 3:
-                raise No_more_data
+                file_number = data[-2].data * 0x100 + data[-1].data
+                self.put(current_byte, 'data',
+                         'Read File number {}'.format(file_number))
             elif step == 4:
-                record_number = self.half_word(current_byte - 1)
-                self.puti(current_byte, 'address',
+                record_number = data[-2].data * 0x100 + data[-1].data
+                self.put(current_byte, 'address',
                     'Read from record number {}'.format(record_number))
                 # TODO: Check if within range.
-            elif step == 5:
-                raise No_more_data
             elif step == 6:
-                records_to_read = self.half_word(current_byte - 1)
-                self.puti(current_byte, 'length',
+                records_to_read = data[-2].data * 0x100 + data[-1].data
+                self.put(current_byte, 'length',
                     'Read {} records'.format(records_to_read))
-        self.check_crc(4 + bytecount)
+            yield
+        yield from self.check_crc(4 + bytecount)
 
     def parse_read_write_registers(self):
         '''Parse function 23: Read/Write multiple registers.'''
         self.minimum_length = 13
 
-        self.puti(1, 'function', 'Function 23: Read/Write Multiple Registers')
+        yield from self.puti(1, 'function', 'Function 23: Read/Write Multiple Registers')
 
-        starting_address = self.half_word(2)
+        starting_address = yield from self.half_word(2)
         # Some instruction manuals use a long form name for addresses, this is
         # listed here for convienience.
         # Example: holding register 60 becomes 30061.
         address_name = 30001 + starting_address
-        self.puti(3, 'address',
+        yield from self.puti(3, 'address',
             'Read starting at address 0x{:X} / {:d}'.format(starting_address,
                                                             address_name))
 
-        self.puti(5, 'length', 'Read {:d} units of data'.format(self.half_word(4)))
+        quantity = yield from self.half_word(4)
+        yield from self.puti(5, 'length', 'Read {:d} units of data'.format(quantity))
 
-        starting_address = self.half_word(6)
-        self.puti(7, 'address',
+        starting_address = yield from self.half_word(6)
+        yield from self.puti(7, 'address',
             'Write starting at address 0x{:X} / {:d}'.format(starting_address,
                                                              address_name))
 
-        quantity_of_outputs = self.half_word(8)
-        self.puti(9, 'length',
-                           'Write {} registers'.format(quantity_of_outputs))
+        quantity_of_outputs = yield from self.half_word(8)
+        yield from self.puti(9, 'length',
+                             'Write {} registers'.format(quantity_of_outputs))
         proper_bytecount = quantity_of_outputs * 2
 
+        yield from self.wait(10)
         bytecount = self.data[10].data
         if bytecount == proper_bytecount:
-            self.puti(10, 'length', 'Byte count: {}'.format(bytecount))
+            yield from self.puti(10, 'length', 'Byte count: {}'.format(bytecount))
         else:
-            self.puti(10, 'error',
+            yield from self.puti(10, 'error',
                 'Bad byte count, is {}, should be {}'.format(bytecount,
                                                              proper_bytecount))
         self.mimumum_length = bytecount + 13
 
-        self.putl('data', 'Data, value 0x{:02X}', 10 + bytecount)
+        yield from self.putl('data', 'Data, value 0x{:02X}', 10 + bytecount)
 
-        self.check_crc(bytecount + 12)
+        yield from self.check_crc(bytecount + 12)
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -821,6 +840,7 @@ class Decoder(srd.Decoder):
     license = 'gplv3+'
     inputs = ['uart']
     outputs = ['modbus']
+    input_packets = ('STARTBIT', 'DATA', 'STOPBIT')
     tags = ['Embedded/industrial']
     annotations = (
         ('sc-server-id', 'SC server ID'),
@@ -839,6 +859,7 @@ class Decoder(srd.Decoder):
         ('cs-error', 'CS error'),
         ('error-indication', 'Error indication'),
     )
+    ann_index = dict((a[0], i) for i, a in enumerate(annotations))
     annotation_rows = (
         ('sc', 'Server->client', (0, 1, 2, 3, 4, 5, 6)),
         ('cs', 'Client->server', (7, 8, 9, 10, 11, 12, 13)),
@@ -868,13 +889,17 @@ class Decoder(srd.Decoder):
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
+        # Annotation names without prefix -> index, for the ADUs.
+        self.ann_prefixes = {}
+        for prefix in ('sc-', 'cs-'):
+            self.ann_prefixes[prefix] = dict((name[len(prefix):], i)
+                for name, i in self.ann_index.items() if name.startswith(prefix))
 
     def puta(self, start, end, ann_str, message):
         '''Put an annotation from start to end, with ann as a
         string. This means you don't have to know the ann's
         number to write annotations to it.'''
-        ann = [s[0] for s in self.annotations].index(ann_str)
-        self.put(start, end, self.out_ann, [ann, [message]])
+        self.put(start, end, self.out_ann, [self.ann_index[ann_str], [message]])
 
     def decode_adu(self, ss, es, data, direction):
         '''Decode the next byte or bit (depending on type) in the ADU.
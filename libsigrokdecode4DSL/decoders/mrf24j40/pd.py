@@ -36,6 +36,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['spi']
     outputs = []
+    input_packets = ('CS-CHANGE', 'DATA')
     tags = ['IC', 'Wireless/RF']
     annotations = (
         ('sread', 'Short register read'),
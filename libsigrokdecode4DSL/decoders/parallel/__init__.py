@@ -29,6 +29,11 @@ It is required to use the lowest data channels, and use consecutive ones.
 For example, for a 4-bit sync parallel bus, channels D0/D1/D2/D3 (and CLK)
 should be used. Using combinations like D7/D12/D3/D15 is not supported.
 For an 8-bit bus you should use D0-D7, for a 16-bit bus use D0-D15 and so on.
+
+With 'Merge repeated items' enabled, consecutive equal items are shown as
+one annotation that spans all of them. This keeps the number of annotations
+low on long captures of a mostly idle bus. The Python output still carries
+one 'ITEM' per clock edge.
 '''
 
 from .pd import Decoder
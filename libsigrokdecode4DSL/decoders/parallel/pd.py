@@ -66,6 +66,10 @@ class ChannelError(Exception):
 
 NUM_CHANNELS = 32
 
+# Upper limit for the number of cached bus states, random data on a wide
+# bus must not grow the cache without bounds.
+MAX_CACHED_ITEMS = 0x10000
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'parallel'
@@ -84,6 +88,8 @@ class Decoder(srd.Decoder):
             'default': 0, 'idn':'dec_parallel_opt_wordsize'},
         {'id': 'endianness', 'desc': 'Data endianness',
             'default': 'little', 'values': ('little', 'big'), 'idn':'dec_parallel_opt_endianness'},
+        {'id': 'item_runs', 'desc': 'Merge repeated items',
+            'default': 'no', 'values': ('yes', 'no'), 'idn':'dec_parallel_opt_item_runs'},
     )
     annotations = (
         ('items', 'Items'),
@@ -106,6 +112,8 @@ class Decoder(srd.Decoder):
         self.have_clock = True
         self.prv_dex = 0
         self.num_item_bits = None
+        self.run_item = None
+        self.run_ss = self.run_es = None
 
     def start(self):
         self.out_python = self.register(srd.OUTPUT_PYTHON)
@@ -123,27 +131,38 @@ class Decoder(srd.Decoder):
     def put_py(self, s, e, data):
         self.put(s, e, self.out_python, data)
 
-    def handle_bits(self, item):
-        # If a word was previously accumulated, then emit its annotation
-        # now after its end samplenumber became available.
-        cur_dex = self.samplenum
+    def put_item(self, ss, es, item):
+        self.put_py(ss, es, ['ITEM', item])
+        if not self.merge_items:
+            self.put_ann(ss, es, [0, [self.fmt_item.format(item)]])
+            return
+        # Show a sequence of equal items as one annotation.
+        if item == self.run_item and ss == self.run_es:
+            self.run_es = es
+            return
+        self.flush_items()
+        self.run_item = item
+        self.run_ss, self.run_es = ss, es
+
+    def flush_items(self):
+        if self.run_item is None:
+            return
+        self.put_ann(self.run_ss, self.run_es, [0, [self.fmt_item.format(self.run_item)]])
+        self.run_item = None
 
+    def handle_bits(self, item, cur_dex):
         # Defer annotations for individual items until the next sample
         # is taken, and the previous sample's end samplenumber has
         # become available. 
         if self.first:
             # Save the start sample and item for later (no output yet).
             if not self.have_clock:
-                self.put_py(self.prv_dex, cur_dex, ['ITEM', self.saved_item])
-                self.put_ann(self.prv_dex, cur_dex, [0, [self.fmt_item.format(self.saved_item)]])
-             
+                self.put_item(self.prv_dex, cur_dex, self.saved_item)
             self.first = False
-            self.saved_item = item
         else:            
             # Output the saved item (from the last CLK edge to the current).
-            self.put_py(self.prv_dex, cur_dex, ['ITEM', self.saved_item])
-            self.put_ann(self.prv_dex, cur_dex, [0, [self.fmt_item.format(self.saved_item)]])        
-            self.saved_item = item
+            self.put_item(self.prv_dex, cur_dex, self.saved_item)
+        self.saved_item = item
 
         self.prv_dex = cur_dex
         self.handel_word(item, cur_dex)
@@ -185,8 +204,8 @@ class Decoder(srd.Decoder):
         cur_dex = self.last_samplenum
         #the last annotation
         if self.saved_item != None:
-            self.put_py(self.prv_dex, cur_dex, ['ITEM', self.saved_item])
-            self.put_ann(self.prv_dex, cur_dex, [0, [self.fmt_item.format(self.saved_item)]])
+            self.put_item(self.prv_dex, cur_dex, self.saved_item)
+            self.flush_items()
             self.handel_word(None, cur_dex)
 
     def decode(self):
@@ -209,15 +228,15 @@ class Decoder(srd.Decoder):
         self.prv_dex = self.samplenum
         have_clock = self.have_clock
     
-        # Determine .wait() conditions, depending on the presence of a
-        # clock signal. Either inspect samples on the configured edge of
-        # the clock, or inspect samples upon ANY edge of ANY of the pins
+        # Determine the channels to wait for, depending on the presence
+        # of a clock signal. Either inspect samples on the configured edge
+        # of the clock, or inspect samples upon ANY edge of ANY of the pins
         # which provide input data.
         if have_clock:
-            edge = self.options['clock_edge'][0]
-            conds = {0: edge} #'f' or 'r'
+            clock_level = 1 if self.options['clock_edge'] == 'rising' else 0
+            channels = [0]
         else:
-            conds = [{idx: 'e'} for idx in has_channels]
+            channels = has_channels
         
         # Pre-determine which input data to strip off, the width of
         # individual items and multiplexed words, as well as format
@@ -232,29 +251,32 @@ class Decoder(srd.Decoder):
         num_digits = (num_word_bits + 3) // 4
         self.fmt_word = "@{{:0{}X}}".format(num_digits)
         self.num_item_bits = num_item_bits
-
-        # Keep processing the input stream. Assume "always zero" for
-        # not-connected input lines. Pass data bits (all inputs except
-        # clock) to the handle_bits() method.
-
-        is_first = True
-        the_conds = conds
-
+        self.merge_items = self.options['item_runs'] == 'yes'
+
+        # Assume "always zero" for not-connected input lines (their pin
+        # value is 0xff). A bus usually takes few distinct states, keep
+        # the item values of the data pins' states in a cache.
+        items = {}
+        def get_item(pins):
+            state = pins[1:idx_strip]
+            item = items.get(state)
+            if item is None:
+                if len(items) >= MAX_CACHED_ITEMS:
+                    items.clear()
+                item = bitpack([0 if b == 0xff else b for b in state])
+                items[state] = item
+            return item
+
+        # Without a clock the first item is the value at sample 0.
+        if not have_clock:
+            self.saved_item = get_item(self.wait())
+
+        # Keep processing the input stream, the edges come in batches.
+        # Pass data bits (all inputs except clock) to the handle_bits()
+        # method.
+        handle_bits = self.handle_bits
         while True:
-            if not have_clock and is_first:
-                #get the value at sample 0
-                conds = None
-            else:
-                conds = the_conds
-
-            (clk, d0, d1, d2, d3, d4, d5, d6, d7,d8, d9,d10 ,d11 ,d12 ,d13 ,d14 ,d15 ,d16 ,d17 ,d18 ,d19 ,d20 ,d21 ,d22 ,d23 ,d24 ,d25 ,d26 ,d27 ,d28 ,d29 ,d30 ,d31 ) = self.wait(conds)
-            pins = (clk, d0, d1, d2, d3, d4, d5, d6, d7,d8, d9, d10, d11, d12,d13 ,d14 ,d15 ,d16 ,d17 ,d18 ,d19 ,d20 ,d21 ,d22 ,d23 ,d24 ,d25 ,d26 ,d27 ,d28 ,d29 ,d30 ,d31 )
-            bits = [0 if idx is None else pins[idx] for idx in idx_channels]
-            item = bitpack(bits[1:idx_strip])
-
-            if not have_clock and is_first:
-                is_first = False 
-                self.saved_item = item
-                continue
-
-            self.handle_bits(item)
+            for samplenum, pins in self.wait_edges(channels):
+                if have_clock and pins[0] != clock_level:
+                    continue
+                handle_bits(get_item(pins), samplenum)
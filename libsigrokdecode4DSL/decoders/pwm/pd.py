@@ -105,37 +105,42 @@ class Decoder(srd.Decoder):
         self.wait({0: 'f' if self.options['polarity'] == 'active-low' else 'r'})
         self.first_samplenum = self.samplenum
 
-        # Keep getting samples for the period's middle and terminal edges.
-        # At the same time that last sample starts the next period.
+        # Take the period's middle and terminal edges from batches of
+        # edges. At the same time that last edge starts the next period.
+        start_samplenum = self.samplenum
+        end_samplenum = None
         while True:
-
-            # Get the next two edges. Setup some variables that get
-            # referenced in the calculation and in put() routines.
-            start_samplenum = self.samplenum
-            self.wait({0: 'e'})
-            end_samplenum = self.samplenum
-            self.wait({0: 'e'})
-            self.ss_block = start_samplenum
-            self.es_block = self.samplenum
-
-            # Calculate the period, the duty cycle, and its ratio.
-            period = self.samplenum - start_samplenum
-            duty = end_samplenum - start_samplenum
-            ratio = float(duty / period)
-
-            # Report the duty cycle in percent.
-            percent = float(ratio * 100)
-            self.putx([0, ['%f%%' % percent]])
-
-            # Report the duty cycle in the binary output.
-            self.putb([0, bytes([int(ratio * 256)])])
-
-            # Report the period in units of time.
-            period_t = float(period / self.samplerate)
-            self.putp(period_t)
-
-            # Update and report the new duty cycle average.
-            num_cycles += 1
-            average += percent
-            self.put(self.first_samplenum, self.es_block, self.out_average,
-                     float(average / num_cycles))
+            for samplenum, pins in self.wait_edges([0]):
+                if end_samplenum is None:
+                    end_samplenum = samplenum
+                    continue
+
+                # Setup some variables that get referenced in the
+                # calculation and in put() routines.
+                self.ss_block = start_samplenum
+                self.es_block = samplenum
+
+                # Calculate the period, the duty cycle, and its ratio.
+                period = samplenum - start_samplenum
+                duty = end_samplenum - start_samplenum
+                ratio = float(duty / period)
+
+                # Report the duty cycle in percent.
+                percent = float(ratio * 100)
+                self.putx([0, ['%f%%' % percent]])
+
+                # Report the duty cycle in the binary output.
+                self.putb([0, bytes([int(ratio * 256)])])
+
+                # Report the period in units of time.
+                period_t = float(period / self.samplerate)
+                self.putp(period_t)
+
+                # Update and report the new duty cycle average.
+                num_cycles += 1
+                average += percent
+                self.put(self.first_samplenum, self.es_block, self.out_average,
+                         float(average / num_cycles))
+
+                start_samplenum = samplenum
+                end_samplenum = None
@@ -20,6 +20,13 @@
 '''
 WS281x RGB LED protocol decoder.
 
+In 'pixels' mode every bit and every LED color is annotated. In 'frames'
+mode the LED colors between two RESETs make up a frame, which gets one
+annotation: the frame number, the number of LEDs, the number of LEDs
+which changed since the frame before and the CRC32 of the colors. Frames
+which are the same as the one before are skipped. The binary output has
+the colors of the frames, one byte per color in the view color order.
+
 Details:
 https://cpldcpu.wordpress.com/2014/01/14/light_ws2812-library-v2-0-part-i-understanding-the-ws2812/
 '''
@@ -25,11 +25,13 @@
 ##
 
 import sigrokdecode as srd
-from functools import reduce
+import zlib
 
 class SamplerateError(Exception):
     pass
 
+BIT_TEXTS = (['0'], ['1'])
+
 class Decoder(srd.Decoder):
     api_version = 3
     id = 'rgb_led_ws281x'
@@ -52,15 +54,22 @@ class Decoder(srd.Decoder):
             , 'idn':'dec_rgb_led_ws281x_opt_view_color_order'},
         {'id': 'polarity', 'desc': 'Polarity', 'default': 'normal',
             'values': ('normal', 'inverted'), 'idn':'dec_rgb_led_ws281x_opt_polarity'},
+        {'id': 'mode', 'desc': 'Mode', 'default': 'pixels',
+            'values': ('pixels', 'frames'), 'idn':'dec_rgb_led_ws281x_opt_mode'},
     )
     annotations = (
         ('bit', 'Bit'),
         ('reset', 'RESET'),
         ('rgb', 'RGB'),
+        ('frame', 'Frame'),
     )
     annotation_rows = (
         ('bit', 'Bits', (0, 1)),
         ('rgb', 'RGB', (2,)),
+        ('frames', 'Frames', (3,)),
+    )
+    binary = (
+        ('frames', 'Frames (LED colors in view color order)'),
     )
 
     def __init__(self):
@@ -72,104 +81,121 @@ class Decoder(srd.Decoder):
         self.ss_packet = None
         self.ss = None
         self.es = None
-        self.bits = []
+        self.value = 0 # Bits of the current LED, MSB first
+        self.bitcount = 0
         self.bit_ = None
         self.colorsize = None
+        self.frame = bytearray()
+        self.prev_frame = None
+        self.framecount = 0
+        self.ss_frame = self.es_frame = None
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
-
+        self.out_binary = self.register(srd.OUTPUT_BINARY)
 
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
 
-    def handle_bits(self, samplenum):
-         if len(self.bits) == self.colorsize:
-
-            elems = reduce(lambda a, b: (a << 1) | b, self.bits)
-
-            default_val = 0
+    def handle_bit(self, ss, es):
+        if self.pixels:
+            self.put(ss, es, self.out_ann, [0, BIT_TEXTS[self.bit_]])
+        self.value = (self.value << 1) | self.bit_
+        self.bitcount += 1
+        if self.bitcount == self.colorsize:
+            self.handle_led(es)
+
+    def handle_led(self, samplenum):
+        value = self.value
+        if self.pixels:
+            # The color so far after each component, like 'GRB#ab0000',
+            # 'GRB#abcd00', 'GRB#abcdef'.
             view_val = 0
-
-            if self.colorsize == 24:
-                for i in range(3):
-                    default_index = self.options['default_color_order'].find(self.options['view_color_order'][i])
-
-                    if default_index == 0:
-                        default_val = (elems & 0xff0000) >> 16
-                    elif default_index == 1:
-                        default_val = (elems & 0x00ff00) >> 8
-                    elif default_index == 2:
-                        default_val = (elems & 0x0000ff) 
-
-                    if i == 0:
-                        view_val = (default_val << 16) | view_val
-                    elif i == 1:
-                        view_val = (default_val << 8) | view_val
-                    elif i == 2:
-                        view_val = default_val | view_val
-                        
-                    self.put(self.ss_packet, samplenum, self.out_ann,[2, ['%s#%06x' % (self.options['view_color_order'] , view_val)]])
-
-            else:
-                for i in range(4):
-                    default_index = self.options['default_color_order'].find(self.options['view_color_order'][i])
-
-                    if default_index == 0:
-                        default_val = (elems & 0xff000000) >> 24
-                    elif default_index == 1:
-                        default_val = (elems & 0x00ff0000) >> 16
-                    elif default_index == 2:
-                        default_val = (elems & 0x0000ff00) >> 8
-                    elif default_index == 3:
-                        default_val = (elems & 0x000000ff) 
-
-                    if i == 0:
-                        view_val = (default_val << 24) | view_val
-                    elif i == 1:
-                        view_val = (default_val << 16) | view_val
-                    elif i == 2:
-                        view_val = (default_val << 8) | view_val
-                    elif i == 3:
-                        view_val = default_val | view_val
-                        
-                    self.put(self.ss_packet, samplenum, self.out_ann,[2, ['%s#%08x' % (self.options['view_color_order'] , view_val)]])
-
-
-
-            self.bits = []
-            self.ss_packet = samplenum
+            for i, shift in enumerate(self.shifts):
+                view_val |= ((value >> shift) & 0xff) << (self.colorsize - 8 - 8 * i)
+                self.put(self.ss_packet, samplenum, self.out_ann,
+                         [2, [self.rgb_format % view_val]])
+        else:
+            if not self.frame:
+                self.ss_frame = self.ss_packet
+            self.frame.extend([(value >> shift) & 0xff for shift in self.shifts])
+            self.es_frame = samplenum
+
+        self.value = self.bitcount = 0
+        self.ss_packet = samplenum
+
+    def handle_frame(self):
+        # One annotation and the LED colors of a frame, unless it's the
+        # same as the one before.
+        if not self.frame:
+            return
+        frame, self.frame = bytes(self.frame), bytearray()
+        self.framecount += 1
+        prev, self.prev_frame = self.prev_frame, frame
+        if frame == prev:
+            return
+
+        size = self.colorsize // 8
+        leds = len(frame) // size
+        if prev is None:
+            changed = leds
+        else:
+            changed = sum(1 for i in range(0, len(frame), size)
+                          if frame[i:i + size] != prev[i:i + size])
+        n, crc = self.framecount, zlib.crc32(frame)
+        self.put(self.ss_frame, self.es_frame, self.out_ann, [3, [
+            'Frame %d: %d LEDs, %d changed, CRC32 %08X' % (n, leds, changed, crc),
+            'Frame %d: %d LEDs, %d changed' % (n, leds, changed),
+            'F%d: %d changed' % (n, changed), 'F%d' % n]])
+        self.put(self.ss_frame, self.es_frame, self.out_binary, [0, frame])
 
     def check_bit_(self, samplenum):
         period = samplenum - self.ss
         tH_samples = self.es - self.ss
-        tH = tH_samples / self.samplerate
-        if tH >= 625e-9:
-            self.bit_ = True
+        if tH_samples >= self.t1h_samples:
+            self.bit_ = 1
         else:
             # Ideal duty for T0H: 33%, T1H: 66%.
-            self.bit_ = (tH_samples / period) > 0.5
+            self.bit_ = 1 if 2 * tH_samples > period else 0
 
     def end(self):
         if self.state == 'BIT FALLING':
             self.check_bit_(self.last_samplenum)
-            self.put(self.ss, self.es, self.out_ann,
-                        [0, ['%d' % self.bit_]])
-            self.bits.append(self.bit_)
-            self.handle_bits(self.es)
-
+            self.handle_bit(self.ss, self.es)
+        self.handle_frame()
 
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
-        if len(self.options['default_color_order']) != len(self.options['view_color_order']):
+        default_order = self.options['default_color_order']
+        view_order = self.options['view_color_order']
+        if len(default_order) != len(view_order):
             raise Exception('default color order len must equal to view color order len')
-        
-        if len(self.options['default_color_order']) == 4:
+
+        if len(default_order) == 4:
             self.colorsize = 32
         else:
             self.colorsize = 24
+        self.pixels = self.options['mode'] == 'pixels'
+        self.rgb_format = '%s#%%0%dx' % (view_order, self.colorsize // 4)
+
+        # Shift of each view color component in the LED's bits. A color
+        # the default order doesn't have repeats the one before it (0 for
+        # the first one), shifting by 'colorsize' gives that 0.
+        self.shifts = []
+        shift = self.colorsize
+        for c in view_order:
+            i = default_order.find(c)
+            if i >= 0:
+                shift = self.colorsize - 8 - 8 * i
+            self.shifts.append(shift)
+
+        # Timing limits in samples: RESET (> 50us), start of the data
+        # after a shorter low time (> 3us), T1H (>= 625ns).
+        self.reset_samples = 50 * self.samplerate // 1000000
+        self.start_samples = 3 * self.samplerate // 1000000
+        self.t1h_samples = -(-625 * self.samplerate // 1000000000)
 
         while True:
             if self.state == 'FIND RESET':
@@ -177,36 +203,34 @@ class Decoder(srd.Decoder):
                 self.ss = self.samplenum
                 self.wait({0: 'e'})
                 self.es = self.samplenum
-                if ((self.es - self.ss) / self.samplerate > 50e-6):
+                if self.es - self.ss > self.reset_samples:
                     self.state = 'RESET'
-                elif ((self.es - self.ss) / self.samplerate > 3e-6):
-                    self.bits = []
+                elif self.es - self.ss > self.start_samples:
+                    self.value = self.bitcount = 0
                     self.ss = self.samplenum
                     self.ss_packet = self.samplenum
                     self.wait({0: 'e'})
-                    
+
                     self.state = 'BIT FALLING'
 
             elif self.state == 'RESET':
-                self.put(self.ss, self.es, self.out_ann, [1, ['RESET', 'RST', 'R']])
-                self.bits = []
+                if self.pixels:
+                    self.put(self.ss, self.es, self.out_ann, [1, ['RESET', 'RST', 'R']])
+                self.value = self.bitcount = 0
                 self.ss = self.samplenum
                 self.ss_packet = self.samplenum
                 self.wait({0: 'e'})
                 self.state = 'BIT FALLING'
-            
+
             elif self.state == 'BIT FALLING':
                 self.es = self.samplenum
                 self.wait({0: 'e'})
 
-                if ((self.samplenum - self.es) / self.samplerate > 50e-6):
+                if self.samplenum - self.es > self.reset_samples:
+                    # Last bit of a frame.
                     self.check_bit_(self.samplenum)
-                    
-                    self.put(self.ss, self.es, self.out_ann,
-                         [0, ['%d' % self.bit_]])
-                    
-                    self.bits.append(self.bit_)
-                    self.handle_bits(self.es)
+                    self.handle_bit(self.ss, self.es)
+                    self.handle_frame()
 
                     self.ss = self.es
                     self.es = self.samplenum
@@ -216,10 +240,7 @@ class Decoder(srd.Decoder):
 
             elif self.state == 'BIT RISING':
                 self.check_bit_(self.samplenum)
-                self.put(self.ss, self.samplenum, self.out_ann,
-                         [0, ['%d' % self.bit_]])
-                self.bits.append(self.bit_)
-                self.handle_bits(self.samplenum)
+                self.handle_bit(self.ss, self.samplenum)
 
                 self.ss = self.samplenum
                 self.wait({0: 'e'})
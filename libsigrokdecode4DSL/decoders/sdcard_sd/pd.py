@@ -19,6 +19,7 @@
 
 import sigrokdecode as srd
 from common.srdhelper import SrdIntEnum, SrdStrEnum
+from common.srdhelper.crc import crc_bits, CRC7_MMC
 from common.sdcard import (cmd_names, acmd_names, accepted_voltages, sd_status)
 
 responses = '1 1b 2 3 6 7'.split()
@@ -181,7 +182,12 @@ class Decoder(srd.Decoder):
 
         # CMD[07:01]: CRC7
         self.crc = int('0b' + ''.join([str(s[i].bit) for i in range(40, 47)]), 2)
-        self.putf(40, 46, [Ann.F_CRC, ['CRC: 0x%x' % self.crc, 'CRC', 'C']])
+        crc_calc = crc_bits(CRC7_MMC, [s[i].bit for i in range(40)])
+        if self.crc == crc_calc:
+            self.putf(40, 46, [Ann.F_CRC, ['CRC: 0x%x' % self.crc, 'CRC', 'C']])
+        else:
+            self.putf(40, 46, [Ann.F_CRC, ['CRC: 0x%x (expected 0x%x)' %
+                (self.crc, crc_calc), 'CRC error', 'CRC', 'C']])
 
         # CMD[00:00]: End bit (always 1)
         self.putf(47, 47, [Ann.F_END, ['End bit', 'End', 'E']])
@@ -20,6 +20,12 @@
 '''
 S/PDIF (Sony/Philips Digital Interface Format) is a serial bus for
 transmitting audio data.
+
+Pulse widths are classified through a table built from the first pulses
+of the capture. The 'Blocks' row has one annotation per 192 frame block
+(from a B preamble to the next one) with the channel status of the
+first channel: consumer or professional, PCM, sample frequency and the
+first status bytes.
 '''
 
 from .pd import Decoder
@@ -24,6 +24,54 @@
 
 import sigrokdecode as srd
 
+# Annotation templates, put as [class, template, value...], the frontend
+# formats the values (in hex, whatever the display format). S, C and P
+# have a template per bit value.
+class Tpl:
+    AUX, SAMPLE, AUDIO, S, C, P = 0, 1, 2, 3, 5, 7
+
+templates = (
+    ('Aux 0x{$0:x}', '0x{$0:x}'),
+    ('Sample 0x{$0:x}', '0x{$0:x}'),
+    ('Audio 0x{$0:x}', '0x{$0:x}'),
+    ('S: 0',), ('S: 1',),
+    ('C: 0',), ('C: 1',),
+    ('P: 0',), ('P: 1',),
+)
+
+# Preambles, as pulse types (see pulse_table()).
+preambles = {
+    (2, 0, 1, 0): ['Preamble W', 'W'],
+    (2, 2, 1, 1): ['Preamble M', 'M'],
+    (2, 1, 1, 2): ['Preamble B', 'B'],
+}
+UNKNOWN_PREAMBLE = ['Unknown Preamble', 'Unknown Prea.', 'U']
+
+# Consumer channel status sample frequency (byte 3, bits 0-3).
+sample_freqs = {
+    0: '44.1 kHz', 1: 'rate not indicated', 2: '48 kHz', 3: '32 kHz',
+    4: '22.05 kHz', 6: '24 kHz', 8: '88.2 kHz', 10: '96 kHz',
+    12: '176.4 kHz', 14: '192 kHz',
+}
+
+# Frames per channel status block.
+BLOCK_FRAMES = 192
+
+def channel_status_texts(status):
+    '''Annotation texts of a channel status block (192 bits, the first
+    bit in the LSB).'''
+    b = status.to_bytes(BLOCK_FRAMES // 8, 'little')
+    hexdump = ' '.join('%02X' % c for c in b[:5])
+    if b[0] & 1:
+        fields = ['professional']
+    else:
+        fields = ['consumer', 'non-PCM' if b[0] & 2 else 'PCM',
+                  sample_freqs.get(b[3] & 0x0f, 'rate code %d' % (b[3] & 0x0f))]
+        if b[0] & 4:
+            fields.append('copy permitted')
+    return ['Block: %s, status %s' % (', '.join(fields), hexdump),
+            'Block: %s' % ', '.join(fields), 'Block']
+
 class SamplerateError(Exception):
     pass
 
@@ -50,45 +98,55 @@ class Decoder(srd.Decoder):
         ('subcode', 'Subcode data'),
         ('chan_stat', 'Channnel Status'),
         ('parity', 'Parity Bit'),
+        ('block', 'Block / channel status'),
     )
     annotation_rows = (
         ('info', 'Info', (0, 1, 3, 5, 6, 7, 8)),
         ('bits', 'Bits', (2,)),
         ('samples', 'Samples', (4,)),
+        ('blocks', 'Blocks', (9,)),
     )
+    annotation_templates = templates
 
     def putx(self, ss, es, data):
         self.put(ss, es, self.out_ann, data)
 
-    def puty(self, data):
-        self.put(self.ss_edge, self.samplenum, self.out_ann, data)
-
     def __init__(self):
         self.reset()
 
     def reset(self):
+        self.samplerate = None
         self.state = 'GET FIRST PULSE WIDTH'
         self.ss_edge = None
-        self.first_edge = True
         self.samplenum_prev_edge = 0
-        self.pulse_width = 0
 
         self.clocks = []
-        self.range1 = 0
-        self.range2 = 0
+        self.pulse_types = None
 
-        self.preamble_state = 0
         self.preamble = []
         self.seen_preamble = False
-        self.last_preamble = 0
 
+        # The subframe bits, in the order received (LSB first) and
+        # reversed, with the start and end sample of every bit.
         self.first_one = True
-        self.subframe = []
-        
+        self.bitcount = 0
+        self.bits = 0
+        self.rbits = 0
+        self.bit_ss = [0] * 28
+        self.bit_es = [0] * 28
+
+        # Pulses seen before the pulse widths are known.
         self.temp_pulse_width = []
         self.temp_samplenum = []
-        self.firstpramble = True
 
+        # Channel status block: the C and U bits of the first subframe of
+        # the frames since the last B preamble.
+        self.channel_a = False
+        self.block_ss = None
+        self.block_es = None
+        self.block_frames = 0
+        self.block_status = 0
+        self.block_user = 0
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
@@ -97,315 +155,136 @@ class Decoder(srd.Decoder):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
 
-    def get_pulse_type(self):
-        if self.range1 == 0 or self.range2 == 0:
-            return -1
-        if self.pulse_width >= self.range2:
-            return 2
-        elif self.pulse_width >= self.range1:
-            return 0
-        else:
-            return 1
-
-    def find_first_pulse_width(self):
-        self.temp_pulse_width.append(self.pulse_width)
-        self.temp_samplenum.append(self.samplenum)
-        if self.pulse_width != 0:
-            self.clocks.append(self.pulse_width)
+    def end(self):
+        if self.block_frames == BLOCK_FRAMES:
+            self.put_block(self.block_es)
+
+    def pulse_table(self, range1, range2):
+        '''Pulse width (in samples) to pulse type table: 1 for one UI,
+        0 for two (a 0 bit) and 2 for three (preambles). Wider pulses
+        than the table covers are of type 2.'''
+        size = int(range2) + 1
+        self.pulse_types = bytes(2 if w >= range2 else 0 if w >= range1 else 1
+                                 for w in range(size))
+
+    def find_first_pulse_width(self, width):
+        if width != 0:
+            self.clocks.append(width)
             self.state = 'GET SECOND PULSE WIDTH'
-            
-    def find_second_pulse_width(self):
-        self.temp_pulse_width.append(self.pulse_width)
-        self.temp_samplenum.append(self.samplenum)
-        if self.pulse_width > (self.clocks[0] * 1.3) or \
-                self.pulse_width < (self.clocks[0] * 0.7):
-            self.clocks.append(self.pulse_width)
-            self.state = 'GET THIRD PULSE WIDTH'
 
-    def find_third_pulse_width(self):
-        self.temp_pulse_width.append(self.pulse_width)
-        self.temp_samplenum.append(self.samplenum)
+    def find_second_pulse_width(self, width):
+        if width > (self.clocks[0] * 1.3) or \
+                width < (self.clocks[0] * 0.7):
+            self.clocks.append(width)
+            self.state = 'GET THIRD PULSE WIDTH'
 
-        if ((self.pulse_width <= (self.clocks[0] * 1.3) and self.pulse_width >= (self.clocks[0] * 0.7)) or \
-        (self.pulse_width <= (self.clocks[1] * 1.3) and self.pulse_width >= (self.clocks[1] * 0.7))):
+    def find_third_pulse_width(self, width):
+        if ((width <= (self.clocks[0] * 1.3) and width >= (self.clocks[0] * 0.7)) or \
+        (width <= (self.clocks[1] * 1.3) and width >= (self.clocks[1] * 0.7))):
             return
 
-        self.clocks.append(self.pulse_width)
+        self.clocks.append(width)
         self.clocks.sort()
-        self.range1 = (self.clocks[0] + self.clocks[1]) / 2
-        self.range2 = (self.clocks[1] + self.clocks[2]) / 2
+        self.pulse_table((self.clocks[0] + self.clocks[1]) / 2,
+                         (self.clocks[1] + self.clocks[2]) / 2)
 
         spdif_bitrate = int(self.samplerate / (self.clocks[2] / 1.5))
-        self.ss_edge = 0
 
         self.putx(0,self.temp_samplenum[0]-24,[0, ['Signal Bitrate: %d Mbit/s (=> %d kHz)' % \
                   (spdif_bitrate, (spdif_bitrate/ (2 * 32)))]])
-        clock_period_nsec = 1000000000 / spdif_bitrate
-
-        self.last_preamble = self.samplenum
-
-        is_preamble_status = True
-        while len(self.decode_re_get_pulse_type())>0:
-             if is_preamble_status == True:
-                if self.decode_recheck_preablm() == 0:
-                    return
-                else:
-                    is_preamble_status = False
-             else:
-                if self.decode_recheck_stream() == 0:
-                    return
-                else:
-                    is_preamble_status = True
-        self.state = 'DECODE STREAM'
-
 
-    def decode_re_get_pulse_type(self):
-        pulse_type =[]
-        for temp_pulse in self.temp_pulse_width:
-            if self.range1 == 0 or self.range2 == 0:
-                 return pulse_type
-            if temp_pulse >= self.range2:
-                 pulse_type.append(2)
-            elif temp_pulse >= self.range1:
-                 pulse_type.append(0)
-            else :
-                 pulse_type.append(1)
-        return pulse_type
-
-    def decode_recheck_preablm(self):
-        if self.decode_re_get_pulse_type() == -1:
-            return -1
-
-        pulse_type = self.decode_re_get_pulse_type()
-        temp_preamble = []
-        preamble_is_ok = 0
-        preamble_state = -1
-
-        while len(pulse_type)>0:
-            temp_samnum = self.temp_samplenum.pop(0)
-            temp_pul_type = pulse_type.pop(0)
-            temp_pul_width = self.temp_pulse_width.pop(0)
-            if preamble_state == -1 and temp_pul_type == 2:
-                temp_preamble.append(temp_pul_type)
-                preamble_state = 0
-                self.ss_edge = temp_samnum - temp_pul_width - 1
-            elif preamble_state == 0:
-                temp_preamble.append(temp_pul_type)
-                preamble_state = 1
-            elif preamble_state == 1:
-                temp_preamble.append(temp_pul_type)
-                preamble_state = 2
-            elif preamble_state == 2:
-                temp_preamble.append(temp_pul_type)
-                if temp_preamble == [2, 0, 1, 0]:
-                    self.putx(self.ss_edge,temp_samnum,[1, ['Preamble W', 'W']])
-                    self.seen_preamble = True
-                elif temp_preamble == [2, 2, 1, 1]:
-                    self.putx(self.ss_edge,temp_samnum,[1, ['Preamble M', 'M']])
-                    self.seen_preamble = True
-                elif temp_preamble == [2, 1, 1, 2]:
-                    self.putx(self.ss_edge,temp_samnum,[1, ['Preamble B', 'B']])
-                    self.seen_preamble = True
-                else:
-                    self.putx(self.ss_edge,temp_samnum,[1, ['Unknown Preamble', 'Unknown Prea.', 'U']])
-                preamble_state = -1
-                preamble_is_ok = 1
-                temp_preamble = []
-     
-                self.bitcount = 0
-                self.first_one = True
-                self.last_preamble = temp_samnum
-                break
-
-        if preamble_is_ok == 1:
-            if len(pulse_type) == 0:
-                self.state = 'DECODE STREAM'
-                return 0
-            else:
-                return 1
-        else:
-            self.state = 'DECODE PREAMBLE'
-            self.preamble = temp_preamble.copy()
-            if preamble_state == -1:
-                self.preamble_state = 0
-            else:
-                self.preamble_state = preamble_state
-            return 0
-    
-    def decode_recheck_stream(self):
-        if self.decode_re_get_pulse_type() == -1:
-            return -1
-
-        pulse_type = self.decode_re_get_pulse_type()
-        subframe = []
-        first_one = True
-        subframe_is_ok = 0
-        bitcount = 0
-
-        while len(pulse_type)>0:
-            samnum = self.temp_samplenum.pop(0)
-            pul_type = pulse_type.pop(0)
-            pul_width = self.temp_pulse_width.pop(0)
-            if pul_type == 1 and first_one:
-               first_one = False
-               subframe.append([pul_type,samnum - \
-                    pul_width -1,samnum])
-            elif pul_type == 1 and not first_one:
-                subframe[-1][2] = samnum
-                self.putx(subframe[-1][1],samnum, [2, ['1']])
-                bitcount += 1
-                first_one = True
-            else:
-                subframe.append([pul_type,samnum - \
-                    pul_width -1,samnum])
-                self.putx(samnum - pul_width - 1,
-                    samnum,[2,['0']])
-                bitcount += 1
-            
-            if bitcount == 28:
-                aux_audio_data = subframe[0:4]
-                sam, sam_rot = '', ''
-                for a in aux_audio_data:
-                    sam = sam + str(a[0])
-                    sam_rot = str(a[0]) + sam_rot
-
-                sample = subframe[4:24]
-                for s in sample:
-                    sam = sam + str(s[0])
-                    sam_rot = str(s[0]) + sam_rot
-                validity = subframe[24:25]
-                subcode_data = subframe[25:26]
-                channel_status = subframe[26:27]
-                parity = subframe[27:28]
-
-                self.putx(aux_audio_data[0][1], aux_audio_data[3][2], \
-                      [3, ['Aux 0x%x' % int(sam[:4], 2), '0x%x' % int(sam[:4], 2)]])
-                self.putx(sample[0][1], sample[19][2], \
-                        [3, ['Sample 0x%x' % int(sam, 2), '0x%x' % int(sam, 2)]])
-                self.putx(aux_audio_data[0][1], sample[19][2], \
-                        [4, ['Audio 0x%x' % int(sam_rot, 2), '0x%x' % int(sam_rot, 2)]])
-                if validity[0][0] == 0:
-                    self.putx(validity[0][1], validity[0][2], [5, ['V']])
-                else:
-                    self.putx(validity[0][1], validity[0][2], [5, ['E']])
-                self.putx(subcode_data[0][1], subcode_data[0][2],
-                    [6, ['S: %d' % subcode_data[0][0]]])
-                self.putx(channel_status[0][1], channel_status[0][2],
-                    [7, ['C: %d' % channel_status[0][0]]])
-                self.putx(parity[0][1], parity[0][2], [8, ['P: %d' % parity[0][0]]])
-
-                subframe = []
-                self.seen_preamble = False
-                bitcount = 0
-                subframe_is_ok = 1
-                break
-        
-        if subframe_is_ok == 1:
-            if len(pulse_type) == 0:
-                self.state = 'DECODE STREAM'
-                return 0
-            else:
-                return 1
+        # Decode the pulses seen so far.
+        self.state = 'DECODE STREAM'
+        for samplenum, width in zip(self.temp_samplenum, self.temp_pulse_width):
+            self.handle_pulse(samplenum, width)
+        self.temp_samplenum = self.temp_pulse_width = None
+
+    def handle_pulse(self, samplenum, width):
+        types = self.pulse_types
+        pulse = types[width] if width < len(types) else 2
+        if self.state == 'DECODE STREAM':
+            self.decode_stream(samplenum, width, pulse)
         else:
-            self.state = 'DECODE STREAM'
-            self.subframe = subframe.copy()
-            self.bitcount = bitcount
-            self.first_one =first_one
-            return 0
-
-
-    def decode_stream(self):
-        pulse = self.get_pulse_type()
-        
-        if not self.seen_preamble:
-            # This is probably the start of a preamble, decode it.
+            self.decode_preamble(samplenum, pulse)
+
+    def decode_stream(self, samplenum, width, pulse):
+        if not self.seen_preamble or pulse == 2:
+            # This is probably the start of a preamble, decode it. A
+            # preamble within a subframe starts over.
             if pulse == 2:
-                self.preamble.append(self.get_pulse_type())
-                self.preamble_state == 0
+                self.preamble = [pulse]
                 self.state = 'DECODE PREAMBLE'
-                self.ss_edge = self.samplenum - self.pulse_width - 1
+                self.ss_edge = samplenum - width - 1
+                self.seen_preamble = False
             return
 
         # We've seen a preamble.
+        n = self.bitcount
         if pulse == 1 and self.first_one:
             self.first_one = False
-            self.subframe.append([pulse, self.samplenum - \
-                self.pulse_width - 1, self.samplenum])
-        elif pulse == 1 and not self.first_one:
-            self.subframe[-1][2] = self.samplenum
-            self.putx(self.subframe[-1][1], self.samplenum, [2, ['1']])
-            self.bitcount += 1
+            self.bit_ss[n] = samplenum - width - 1
+            return
+        if pulse == 1:
+            bit = 1
             self.first_one = True
         else:
-            self.subframe.append([pulse, self.samplenum - \
-                self.pulse_width - 1, self.samplenum])
-            self.putx(self.samplenum - self.pulse_width - 1,
-                      self.samplenum, [2, ['0']])
-            self.bitcount += 1
+            bit = 0
+            self.bit_ss[n] = samplenum - width - 1
+        self.bit_es[n] = samplenum
+        self.putx(self.bit_ss[n], samplenum, [2, ['1' if bit else '0']])
+        self.bits |= bit << n
+        self.rbits = (self.rbits << 1) | bit
+        self.bitcount = n + 1
 
         if self.bitcount == 28:
-            aux_audio_data = self.subframe[0:4]
-            sam, sam_rot = '', ''
-            for a in aux_audio_data:
-                sam = sam + str(a[0])
-                sam_rot = str(a[0]) + sam_rot
-            sample = self.subframe[4:24]
-            for s in sample:
-                sam = sam + str(s[0])
-                sam_rot = str(s[0]) + sam_rot
-            validity = self.subframe[24:25]
-            subcode_data = self.subframe[25:26]
-            channel_status = self.subframe[26:27]
-            parity = self.subframe[27:28]
-
-            self.putx(aux_audio_data[0][1], aux_audio_data[3][2], \
-                      [3, ['Aux 0x%x' % int(sam[:4], 2), '0x%x' % int(sam[:4], 2)]])
-            self.putx(sample[0][1], sample[19][2], \
-                      [3, ['Sample 0x%x' % int(sam, 2), '0x%x' % int(sam, 2)]])
-            self.putx(aux_audio_data[0][1], sample[19][2], \
-                      [4, ['Audio 0x%x' % int(sam_rot, 2), '0x%x' % int(sam_rot, 2)]])
-            if validity[0][0] == 0:
-                self.putx(validity[0][1], validity[0][2], [5, ['V']])
-            else:
-                self.putx(validity[0][1], validity[0][2], [5, ['E']])
-            self.putx(subcode_data[0][1], subcode_data[0][2],
-                [6, ['S: %d' % subcode_data[0][0]]])
-            self.putx(channel_status[0][1], channel_status[0][2],
-                [7, ['C: %d' % channel_status[0][0]]])
-            self.putx(parity[0][1], parity[0][2], [8, ['P: %d' % parity[0][0]]])
-
-            self.subframe = []
-            self.seen_preamble = False
-            self.bitcount = 0
-
-    #Unknown Preamble
-    def decode_preamble(self):
-        if self.preamble_state == 0:
-            self.preamble.append(self.get_pulse_type())
-            self.preamble_state = 1
-        elif self.preamble_state == 1:
-            self.preamble.append(self.get_pulse_type())
-            self.preamble_state = 2
-        elif self.preamble_state == 2:
-            self.preamble.append(self.get_pulse_type())
-            self.preamble_state = 0
-            self.state = 'DECODE STREAM'
-            if self.preamble == [2, 0, 1, 0]:
-                self.puty([1, ['Preamble W', 'W']])
-                self.seen_preamble = True
-            elif self.preamble == [2, 2, 1, 1]:
-                self.puty([1, ['Preamble M', 'M']])
-                self.seen_preamble = True
-            elif self.preamble == [2, 1, 1, 2]:
-                self.puty([1, ['Preamble B', 'B']])
-                self.seen_preamble = True
-            else:
-                self.puty([1, ['Unknown Preamble', 'Unknown Prea.', 'U']])
-            self.preamble = []
-            self.bitcount = 0
-            self.first_one = True
+            self.put_subframe()
+
+    def put_subframe(self):
+        ss, es, bits, rbits = self.bit_ss, self.bit_es, self.bits, self.rbits
+        # rbits has the first received bit in the MSB.
+        self.putx(ss[0], es[3], [3, Tpl.AUX, rbits >> 24])
+        self.putx(ss[4], es[23], [3, Tpl.SAMPLE, (rbits >> 4) & 0xffffff])
+        self.putx(ss[0], es[23], [4, Tpl.AUDIO, bits & 0xffffff])
+        v, u, c, p = (bits >> 24) & 1, (bits >> 25) & 1, (bits >> 26) & 1, bits >> 27
+        self.putx(ss[24], es[24], [5, ['E' if v else 'V']])
+        self.putx(ss[25], es[25], [6, Tpl.S + u])
+        self.putx(ss[26], es[26], [7, Tpl.C + c])
+        self.putx(ss[27], es[27], [8, Tpl.P + p])
+
+        if self.channel_a and self.block_ss is not None and \
+                self.block_frames < BLOCK_FRAMES:
+            self.block_status |= c << self.block_frames
+            self.block_user |= u << self.block_frames
+            self.block_frames += 1
+        self.block_es = es[27]
+
+        self.seen_preamble = False
+        self.bitcount = 0
+        self.bits = self.rbits = 0
 
-        self.last_preamble = self.samplenum
+    def put_block(self, es):
+        self.putx(self.block_ss, es, [9, channel_status_texts(self.block_status)])
+
+    def decode_preamble(self, samplenum, pulse):
+        self.preamble.append(pulse)
+        if len(self.preamble) < 4:
+            return
+        self.state = 'DECODE STREAM'
+        texts = preambles.get(tuple(self.preamble))
+        self.putx(self.ss_edge, samplenum, [1, texts or UNKNOWN_PREAMBLE])
+        self.seen_preamble = texts is not None
+        self.channel_a = texts is not None and texts[1] != 'W'
+        if texts is not None and texts[1] == 'B':
+            # A new channel status block.
+            if self.block_frames == BLOCK_FRAMES:
+                self.put_block(self.ss_edge)
+            self.block_ss = self.ss_edge
+            self.block_frames = 0
+            self.block_status = self.block_user = 0
+        self.preamble = []
+        self.bitcount = 0
+        self.bits = self.rbits = 0
+        self.first_one = True
 
     def decode(self):
         if not self.samplerate:
@@ -416,18 +295,20 @@ class Decoder(srd.Decoder):
         self.samplenum_prev_edge = self.samplenum
 
         while True:
-            # Wait for any edge (rising or falling).
-            (data,) = self.wait({0: 'e'})
-            self.pulse_width = self.samplenum - self.samplenum_prev_edge - 1
-            self.samplenum_prev_edge = self.samplenum
-
-            if self.state == 'GET FIRST PULSE WIDTH':
-                self.find_first_pulse_width()
-            elif self.state == 'GET SECOND PULSE WIDTH':
-                self.find_second_pulse_width()
-            elif self.state == 'GET THIRD PULSE WIDTH':
-                self.find_third_pulse_width()
-            elif self.state == 'DECODE STREAM':
-                self.decode_stream()
-            elif self.state == 'DECODE PREAMBLE':
-                self.decode_preamble()
+            # Any edge (rising or falling).
+            for samplenum, pins in self.wait_edges([0]):
+                width = samplenum - self.samplenum_prev_edge - 1
+                self.samplenum_prev_edge = samplenum
+
+                if self.pulse_types is not None:
+                    self.handle_pulse(samplenum, width)
+                    continue
+
+                self.temp_pulse_width.append(width)
+                self.temp_samplenum.append(samplenum)
+                if self.state == 'GET FIRST PULSE WIDTH':
+                    self.find_first_pulse_width(width)
+                elif self.state == 'GET SECOND PULSE WIDTH':
+                    self.find_second_pulse_width(width)
+                elif self.state == 'GET THIRD PULSE WIDTH':
+                    self.find_third_pulse_width(width)
@@ -120,6 +120,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['spi']
     outputs = []
+    input_packets = ('CS-CHANGE', 'DATA')
     tags = ['IC', 'TPM', 'BitLocker']
     annotations = (
         ('Read', 'Read register operation'),
@@ -23,6 +23,11 @@ SPI (NOR) flash chip protocol.
 
 It currently supports the MX25L1605D/MX25L3205D/MX25L6405D.
 
+The 'Memory image' binary output holds the flash contents seen in the
+capture: data read, page programs (which only clear bits of known bytes
+and wrap around at the page end), sector and chip erases. It runs from
+address 0 to the highest known address, unknown bytes are 0xFF.
+
 Details:
 http://www.macronix.com/QuickPlace/hq/PageLibrary4825740B00298A3B.nsf/h_Index/3F21BAC2E121E17848257639003A3146/$File/MX25L1605D-3205D-6405D-1.5.pdf
 '''
@@ -23,6 +23,7 @@
 ##
 
 import sigrokdecode as srd
+from common.srdhelper.memimage import MemoryImage
 from .lists import *
 
 L = len(cmds)
@@ -84,6 +85,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['spi']
     outputs = []
+    input_packets = ('CS-CHANGE', 'DATA')
     tags = ['IC', 'Memory']
     annotations = cmd_annotation_classes() + (
         ('bit', 'Bit'),
@@ -96,6 +98,9 @@ class Decoder(srd.Decoder):
         ('commands', 'Commands', tuple(range(len(cmds)))),
         ('warnings', 'Warnings', (L + 2,)),
     )
+    binary = (
+        ('image', 'Memory image'),
+    )
     options = (
         {'id': 'chip', 'desc': 'Chip', 'default': tuple(chips.keys())[0],
             'values': tuple(chips.keys()), 'idn':'dec_spiflash_opt_chip'},
@@ -131,8 +136,34 @@ class Decoder(srd.Decoder):
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
+        self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.chip = chips[self.options['chip']]
         self.vendor = self.options['chip'].split('_')[0]
+        self.image = MemoryImage()
+        self.image_ss = None
+
+    def end(self):
+        # Dump the flash contents seen in the capture.
+        data = self.image.dump()
+        if data:
+            self.put(self.image_ss, self.es, self.out_binary, [0, data])
+
+    def update_image(self, ann):
+        if self.image_ss is None:
+            self.image_ss = self.ss_cmd
+        if ann == Ann.PP:
+            self.image.program(self.addr, self.data, self.ss_cmd,
+                               self.chip['page_size'])
+        elif ann in (Ann.WRITE1, Ann.WRITE2):
+            # Page program with built-in erase.
+            self.image.write(self.addr, self.data, self.ss_cmd)
+        elif ann == Ann.SE:
+            size = self.chip['sector_size']
+            self.image.erase(self.addr - self.addr % size, size, self.ss_cmd)
+        elif ann in (Ann.CE, Ann.CE2):
+            self.image.erase_all(self.ss_cmd)
+        else:
+            self.image.read(self.addr, self.data, self.ss_cmd)
 
     def putx(self, data):
         # Simplification, most annotations span exactly one SPI byte/packet.
@@ -397,6 +428,7 @@ class Decoder(srd.Decoder):
             if self.addr % 4096 != 0:
                 # Sector addresses must be 4K-aligned (same for all 3 chips).
                 self.putc([Ann.WARN, ['Warning: Invalid sector address!']])
+            self.update_image(Ann.SE)
             self.state = None
         else:
             self.cmdstate += 1
@@ -405,12 +437,16 @@ class Decoder(srd.Decoder):
         pass # TODO
 
     def handle_ce(self, mosi, miso):
+        self.ss_cmd = self.ss
         self.putx([Ann.CE, self.cmd_ann_list()])
+        self.update_image(Ann.CE)
         if self.writestate == 0:
             self.putx([Ann.WARN, ['Warning: WREN might be missing']])
 
     def handle_ce2(self, mosi, miso):
+        self.ss_cmd = self.ss
         self.putx([Ann.CE2, self.cmd_ann_list()])
+        self.update_image(Ann.CE2)
         if self.writestate == 0:
             self.putx([Ann.WARN, ['Warning: WREN might be missing']])
 
@@ -520,6 +556,7 @@ class Decoder(srd.Decoder):
             s = ''.join(map(chr, self.data))
         self.putf([Ann.FIELD, ['%s (%d bytes)' % (label, len(self.data))]])
         self.putc([idx, ['%s (addr {$}, %d bytes): %s' % (cmds[self.state][1], len(self.data), s), '@%06x' % self.addr]])
+        self.update_image(idx)
 
     def decode(self, ss, es, data):
         ptype, mosi, miso = data
@@ -31,6 +31,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['spi']
     outputs = []
+    input_packets = ('CS-CHANGE', 'DATA')
     tags = ['Embedded/industrial']
     options = (
         {'id': 'msgsize', 'desc': 'Message size', 'default': 64, 'idn':'dec_ssi32_opt_msgsize'},
@@ -20,6 +20,10 @@
 '''
 TDM Audio is an audio serial bus for moving audio data between devices
 (usually on the same board) which can carry one or more channels of data.
+
+The 'WAV file' binary output is a PCM file with one channel per slot of
+the first frame, written at the end of the capture. The audio sample
+rate is measured from the frame syncs.
 '''
 
 from .pd import Decoder
@@ -24,6 +24,7 @@
 #
 
 import sigrokdecode as srd
+from common.srdhelper.wav import WavWriter
 
 MAX_CHANNELS = 8
 
@@ -51,6 +52,9 @@ class Decoder(srd.Decoder):
     )
     annotations = tuple(('ch%d' % i, 'Ch%d' % i) for i in range(MAX_CHANNELS))
     annotation_rows = tuple(('ch%d-vals' % i, 'Ch%d' % i, (i,)) for i in range(MAX_CHANNELS))
+    binary = (
+        ('wav', 'WAV file'),
+    )
 
     def __init__(self):
         self.reset()
@@ -66,62 +70,99 @@ class Decoder(srd.Decoder):
         self.lastframe = 0
         self.data = 0
         self.ss_block = None
+        self.frame_words = []
+        self.wav = None
+        self.wav_channels = None
+        self.wav_ss = self.wav_es = None
 
-    def metdatadata(self, key, value):
+    def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
             self.samplerate = value
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
+        self.out_binary = self.register(srd.OUTPUT_BINARY)
         self.bitdepth = self.options['bps']
         self.edge = self.options['edge']
+        self.wav = WavWriter(self.bitdepth)
+
+    def end(self):
+        self.put_frame()
+        if not self.wav.count:
+            return
+        for data in self.wav.output(self.wav_channels, self.samplerate):
+            self.put(self.wav_ss, self.wav_es, self.out_binary, [0, data])
+
+    def put_frame(self):
+        # The WAV file has as many channels as the first frame has slots,
+        # missing slots of later frames are silence.
+        words = self.frame_words
+        if not words:
+            return
+        self.frame_words = []
+        if self.wav_channels is None:
+            self.wav_channels = len(words)
+        n = self.wav_channels
+        for w in words[:n]:
+            self.wav.add(w)
+        for i in range(len(words), n):
+            self.wav.add(0)
 
     def decode(self):
+        active = 1 if self.edge == 'rising' else 0
+        first_edge = self.options['sampling edge'] == 'first edge'
         while True:
-            # Wait for edge of clock (sample on rising/falling edge).
-            clock, frame, data = self.wait({0: self.edge[0]})
-
-            self.data = (self.data << 1) | data
-            self.bitcount += 1
-
-            if self.ss_block is not None:
-                if self.bitcount >= self.bitdepth:
-                    self.bitcount = 0
-
-                    c1 = 'Channel %d' % (self.channel % self.channels)
-                    c2 = 'C%d' % (self.channel % self.channels)
-                    c3 = '%d' % (self.channel % self.channels)
-                    if self.bitdepth <= 8:
-                        v = '%02x' % self.data
-                    elif self.bitdepth <= 16:
-                        v = '%04x' % self.data
+            # Edges of clock (sample on rising/falling edge).
+            for samplenum, (clock, frame, data) in self.wait_edges([0]):
+                if clock != active:
+                    continue
+
+                self.data = (self.data << 1) | data
+                self.bitcount += 1
+
+                if self.ss_block is not None:
+                    if self.bitcount >= self.bitdepth:
+                        self.bitcount = 0
+
+                        c1 = 'Channel %d' % (self.channel % self.channels)
+                        c2 = 'C%d' % (self.channel % self.channels)
+                        c3 = '%d' % (self.channel % self.channels)
+                        if self.bitdepth <= 8:
+                            v = '%02x' % self.data
+                        elif self.bitdepth <= 16:
+                            v = '%04x' % self.data
+                        else:
+                            v = '%08x' % self.data
+
+                        ch = self.channel % self.channels
+
+                        self.put(self.ss_block, samplenum, self.out_ann,
+                                 [ch, ['%s: %s' % (c1, v), '%s: %s' % (c2, v),
+                                       '%s: %s' % (c3, v)]])
+
+                        self.frame_words.append(self.data)
+                        self.wav_es = samplenum
+                        self.data = 0
+                        self.ss_block = samplenum
+                        self.samplecount += 1
+                        self.channel += 1
+
+                # Check for new frame.
+                # Note, frame may be a single clock, or active for the first
+                # sample in the frame.
+
+                if frame != self.lastframe and frame == 1:
+                    self.put_frame()
+                    self.wav.frame(samplenum)
+                    self.channel = 0
+                    if first_edge:
+                        self.bitcount = 1
+                        self.data = data
                     else:
-                        v = '%08x' % self.data
-                    
-                    ch = self.channel % self.channels
-
-                    self.put(self.ss_block, self.samplenum, self.out_ann,
-                             [ch, ['%s: %s' % (c1, v), '%s: %s' % (c2, v),
-                                   '%s: %s' % (c3, v)]])
-
-                    self.data = 0
-                    self.ss_block = self.samplenum
-                    self.samplecount += 1
-                    self.channel += 1
-
-            # Check for new frame.
-            # Note, frame may be a single clock, or active for the first
-            # sample in the frame.
-            
-            if frame != self.lastframe and frame == 1:
-                self.channel = 0
-                if self.options['sampling edge'] == 'first edge':
-                    self.bitcount = 1
-                    self.data = data
-                else:
-                    self.bitcount = 0
-                    self.data = 0
-                if self.ss_block is None:
-                    self.ss_block = self.samplenum
-                    
-            self.lastframe = frame
+                        self.bitcount = 0
+                        self.data = 0
+                    if self.ss_block is None:
+                        self.ss_block = samplenum
+                        self.wav_ss = samplenum
+
+                self.lastframe = frame
@@ -19,6 +19,16 @@
 
 '''
 Timing decoder, find the time between edges.
+
+In 'setup/hold' mode the Data channel is the reference clock (the 'Edges
+to check' option selects the active clock edge) and D0..D15 are checked
+against it in one pass. Setup is the time from the last change of a data
+line to the clock edge, hold (propagation delay) the time from the clock
+edge to the first change after it. Only violations of the minimum setup
+and hold times and of the maximum propagation delay (limits of 0 are not
+checked) are annotated. At the end of the capture the Summary row shows
+the min/max values and the number of violations of every line. A change
+in the same sample as the clock edge counts as a setup time of 0.
 '''
 
 from .pd import Decoder
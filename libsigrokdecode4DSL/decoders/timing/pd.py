@@ -89,11 +89,27 @@ def terse_times(t, fmt):
     # Unspecified format, and nothing auto-detected.
     return ['{:f}'.format(t)]
 
+def short_time(t):
+    if abs(t) >= 1e-3:
+        return '%.3f ms' % (t * 1e3)
+    elif abs(t) >= 1e-6:
+        return '%.3f μs' % (t * 1e6)
+    return '%.1f ns' % (t * 1e9)
+
+class ChannelError(Exception):
+    pass
+
+# Data lines of the setup/hold mode.
+NUM_DATA = 16
+
 class Pin:
     (DATA,) = range(1)
 
 class Ann:
-    (TIME, TERSE, AVG, DELTA,) = range(4)
+    (TIME, TERSE, AVG, DELTA, VIOLATION, SUMMARY,) = range(6)
+
+# Upper limit for the number of cached time texts.
+TEXT_CACHE_SIZE = 4096
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -108,16 +124,23 @@ class Decoder(srd.Decoder):
     channels = (
         {'id': 'data', 'name': 'Data', 'desc': 'Data line', 'idn':'dec_timing_chan_data'},
     )
+    optional_channels = tuple({'id': 'd%d' % i, 'name': 'D%d' % i,
+                               'desc': 'Data line %d (setup/hold mode)' % i}
+                              for i in range(NUM_DATA))
     annotations = (
         ('time', 'Time'),
         ('terse', 'Terse'),
         ('average', 'Average'),
         ('delta', 'Delta'),
+        ('violation', 'Violation'),
+        ('summary', 'Summary'),
     )
     annotation_rows = (
         ('times', 'Times', (Ann.TIME, Ann.TERSE,)),
         ('averages', 'Averages', (Ann.AVG,)),
         ('deltas', 'Deltas', (Ann.DELTA,)),
+        ('violations', 'Violations', (Ann.VIOLATION,)),
+        ('summaries', 'Summary', (Ann.SUMMARY,)),
     )
     options = (
         { 'id': 'avg_period', 'desc': 'Averaging period', 'default': 100  , 'idn':'dec_timing_opt_avg_period'},
@@ -129,6 +152,11 @@ class Decoder(srd.Decoder):
           'default': 'full', 'values': ('full', 'terse-auto',
           'terse-s', 'terse-ms', 'terse-us', 'terse-ns', 'terse-ps',
           'samples') , 'idn':'dec_timing_opt_format'},
+        { 'id': 'mode', 'desc': 'Mode',
+          'default': 'intervals', 'values': ('intervals', 'setup/hold') , 'idn':'dec_timing_opt_mode'},
+        { 'id': 'setup', 'desc': 'Min setup time (ns)', 'default': 0.0 , 'idn':'dec_timing_opt_setup'},
+        { 'id': 'hold', 'desc': 'Min hold time (ns)', 'default': 0.0 , 'idn':'dec_timing_opt_hold'},
+        { 'id': 'max_delay', 'desc': 'Max propagation delay (ns)', 'default': 0.0 , 'idn':'dec_timing_opt_max_delay'},
     )
 
     def __init__(self):
@@ -136,6 +164,9 @@ class Decoder(srd.Decoder):
 
     def reset(self):
         self.samplerate = None
+        self.texts = {}
+        self.stats = None
+        self.first_clock = self.last_edge = None
 
     def metadata(self, key, value):
         if key == srd.SRD_CONF_SAMPLERATE:
@@ -144,51 +175,156 @@ class Decoder(srd.Decoder):
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
 
+    def end(self):
+        if self.stats and self.first_clock is not None:
+            self.put_summary()
+
+    def time_text(self, t):
+        # Periodic signals have few distinct intervals, format each once.
+        txt = self.texts.get(t)
+        if txt is None:
+            if len(self.texts) >= TEXT_CACHE_SIZE:
+                self.texts.clear()
+            txt = self.texts[t] = normalize_time(t)
+        return txt
+
     def decode(self):
         if not self.samplerate:
             raise SamplerateError('Cannot decode without samplerate.')
+        if self.options['mode'] == 'setup/hold':
+            return self.decode_setup_hold()
         edge = self.options['edge']
         avg_period = self.options['avg_period']
         delta = self.options['delta'] == 'yes'
         fmt = self.options['format']
+        time_text = self.time_text
         ss = None
+        # Running sum of the last 'avg_period' intervals, in samples.
         last_n = deque()
+        total = 0
         last_t = None
+        # Edges come in batches, filter the requested direction here.
+        level = {'rising': 1, 'falling': 0}.get(edge)
         while True:
-            if edge == 'rising':
-                self.wait({0: 'r'})
-            elif edge == 'falling':
-                self.wait({0: 'f'})
-            else:
-                self.wait({0: 'e'})
-
-            if not ss:
-                ss = self.samplenum
-                continue
-            es = self.samplenum
-            sa = es - ss
-            t = sa / self.samplerate
-
-            if fmt == 'full':
-                cls, txt = Ann.TIME, [normalize_time(t)]
-            elif fmt == 'samples':
-                cls, txt = Ann.TERSE, terse_times(sa, fmt)
-            else:
-                cls, txt = Ann.TERSE, terse_times(t, fmt)
-            if txt:
-                self.put(ss, es, self.out_ann, [cls, txt])
-
-            if avg_period > 0:
-                if t > 0:
-                    last_n.append(t)
-                if len(last_n) > avg_period:
-                    last_n.popleft()
-                average = sum(last_n) / len(last_n)
-                cls, txt = Ann.AVG, normalize_time(average)
-                self.put(ss, es, self.out_ann, [cls, [txt]])
-            if last_t and delta:
-                cls, txt = Ann.DELTA, normalize_time(t - last_t)
-                self.put(ss, es, self.out_ann, [cls, [txt]])
-
-            last_t = t
-            ss = es
+            for es, pins in self.wait_edges([Pin.DATA]):
+                if level is not None and pins[Pin.DATA] != level:
+                    continue
+
+                if not ss:
+                    ss = es
+                    continue
+                sa = es - ss
+                t = sa / self.samplerate
+
+                if fmt == 'full':
+                    cls, txt = Ann.TIME, [time_text(t)]
+                elif fmt == 'samples':
+                    cls, txt = Ann.TERSE, terse_times(sa, fmt)
+                else:
+                    cls, txt = Ann.TERSE, terse_times(t, fmt)
+                if txt:
+                    self.put(ss, es, self.out_ann, [cls, txt])
+
+                if avg_period > 0:
+                    if sa > 0:
+                        last_n.append(sa)
+                        total += sa
+                    if len(last_n) > avg_period:
+                        total -= last_n.popleft()
+                    average = total / len(last_n) / self.samplerate
+                    self.put(ss, es, self.out_ann, [Ann.AVG, [time_text(average)]])
+                if last_t and delta:
+                    self.put(ss, es, self.out_ann, [Ann.DELTA, [time_text(t - last_t)]])
+
+                last_t = t
+                ss = es
+
+    def decode_setup_hold(self):
+        '''Check the data lines against the reference clock on the Data
+        channel. Setup is the time from the last change of a line to the
+        clock edge, hold (or propagation delay) the time from the clock
+        edge to the first change after it. Only violations of the limits
+        get an annotation, end() adds the min/max values per line.'''
+        lines = [i for i in range(NUM_DATA) if self.has_channel(1 + i)]
+        if not lines:
+            raise ChannelError('At least one data line has to be supplied.')
+        ns = self.samplerate / 1e9
+        setup_min = self.options['setup'] * ns
+        hold_min = self.options['hold'] * ns
+        delay_max = self.options['max_delay'] * ns
+        level = {'rising': 1, 'falling': 0}.get(self.options['edge'])
+
+        # Per line: [setup min, setup max, delay min, delay max, violations],
+        # in samples.
+        self.stats = {i: [None, None, None, None, 0] for i in lines}
+        # Last change of every line, sample of the last clock edge, lines
+        # which didn't change since the last clock edge.
+        changed = {i: None for i in lines}
+        clock = None
+        waiting = set()
+        put = self.put
+
+        pins_prev = self.wait()
+        while True:
+            for s, pins in self.wait_edges([Pin.DATA] + [1 + i for i in lines]):
+                for i in lines:
+                    if pins[1 + i] == pins_prev[1 + i]:
+                        continue
+                    changed[i] = s
+                    if i not in waiting:
+                        continue
+                    # First change after the clock edge.
+                    waiting.discard(i)
+                    d = s - clock
+                    st = self.stats[i]
+                    if st[2] is None or d < st[2]:
+                        st[2] = d
+                    if st[3] is None or d > st[3]:
+                        st[3] = d
+                    if d < hold_min:
+                        st[4] += 1
+                        put(clock, s, self.out_ann, [Ann.VIOLATION,
+                            ['D%d hold %s < %s' % (i, short_time(d / self.samplerate),
+                                                   short_time(hold_min / self.samplerate)),
+                             'D%d hold' % i, 'H']])
+                    elif delay_max and d > delay_max:
+                        st[4] += 1
+                        put(clock, s, self.out_ann, [Ann.VIOLATION,
+                            ['D%d delay %s > %s' % (i, short_time(d / self.samplerate),
+                                                    short_time(delay_max / self.samplerate)),
+                             'D%d delay' % i, 'D']])
+
+                if pins[Pin.DATA] != pins_prev[Pin.DATA] and \
+                        (level is None or pins[Pin.DATA] == level):
+                    # Setup of the lines which changed in this clock cycle.
+                    for i in lines:
+                        c = changed[i]
+                        if c is None or (clock is not None and c <= clock):
+                            continue
+                        d = s - c
+                        st = self.stats[i]
+                        if st[0] is None or d < st[0]:
+                            st[0] = d
+                        if st[1] is None or d > st[1]:
+                            st[1] = d
+                        if d < setup_min:
+                            st[4] += 1
+                            put(c, s, self.out_ann, [Ann.VIOLATION,
+                                ['D%d setup %s < %s' % (i, short_time(d / self.samplerate),
+                                                        short_time(setup_min / self.samplerate)),
+                                 'D%d setup' % i, 'S']])
+                    if self.first_clock is None:
+                        self.first_clock = s
+                    clock = s
+                    waiting = set(lines)
+                self.last_edge = s
+                pins_prev = pins
+
+    def put_summary(self):
+        def fmt(v):
+            return '-' if v is None else short_time(v / self.samplerate)
+        for i, (smin, smax, dmin, dmax, violations) in sorted(self.stats.items()):
+            self.put(self.first_clock, self.last_edge, self.out_ann, [Ann.SUMMARY,
+                ['D%d: setup %s..%s, hold/delay %s..%s, %d violations' %
+                 (i, fmt(smin), fmt(smax), fmt(dmin), fmt(dmax), violations),
+                 'D%d: %d violations' % (i, violations), 'D%d' % i]])
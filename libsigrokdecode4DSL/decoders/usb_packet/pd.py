@@ -19,6 +19,8 @@
 ##
 
 import sigrokdecode as srd
+from common.srdhelper import BitBuffer
+from common.srdhelper.crc import Crc, CRC5_USB, CRC16_USB
 
 '''
 OUTPUT_PYTHON format:
@@ -136,41 +138,16 @@ def ann_index(pidname):
         return 28
     return l.index(pidname) + 11
 
-def bitstr_to_num(bitstr):
-    if not bitstr:
-        return 0
-    l = list(bitstr)
-    l.reverse()
-    return int(''.join(l), 2)
-
-def reverse_number(num, count):
-    out = list(count * '0')
-    for i in range(0, count):
-        if num >> i & 1:
-            out[i] = '1'
-    return int(''.join(out), 2)
-
-def calc_crc5(bitstr):
-    poly5 = 0x25
-    crc5 = 0x1f
-    for bit in bitstr:
-        crc5 <<= 1
-        if int(bit) != (crc5 >> 5):
-            crc5 ^= poly5
-        crc5 &= 0x1f
-    crc5 ^= 0x1f
-    return reverse_number(crc5, 5)
-
-def calc_crc16(bitstr):
-    poly16 = 0x18005
-    crc16 = 0xffff
-    for bit in bitstr:
-        crc16 <<= 1
-        if int(bit) != (crc16 >> 16):
-            crc16 ^= poly16
-        crc16 &= 0xffff
-    crc16 ^= 0xffff
-    return reverse_number(crc16, 16)
+# CRCs over 'count' bits, held in an integer (first bit on the bus is the LSB).
+def calc_crc5(value, count):
+    crc = Crc(*CRC5_USB)
+    crc.update_word(value, count, lsb_first=True)
+    return crc.value
+
+def calc_crc16(value, count):
+    crc = Crc(*CRC16_USB)
+    crc.update_word(value, count, lsb_first=True)
+    return crc.value
 
 class Decoder(srd.Decoder):
     api_version = 3
@@ -226,7 +203,8 @@ class Decoder(srd.Decoder):
         self.reset()
 
     def reset(self):
-        self.bits = []
+        self.bits = BitBuffer()
+        self.have_bits = False
         self.packet = []
         self.packet_summary = ''
         self.ss = self.es = None
@@ -250,17 +228,17 @@ class Decoder(srd.Decoder):
         self.out_ann = self.register(srd.OUTPUT_ANN)
 
     def handle_packet(self):
-        packet = ''
-        for (bit, ss, es) in self.bits:
-            packet += bit
+        bits = self.bits
+        bss, bes = bits.ss, bits.es
+        count = len(bits)
 
-        if len(packet) < 8:
+        if count < 8:
             self.putp([28, ['Invalid packet (shorter than 8 bits)']])
             return
 
         # Bits[0:7]: SYNC
-        sync = packet[:7 + 1]
-        self.ss, self.es = self.bits[0][1], self.bits[7][2]
+        sync = bits.bitstr(0, 8)
+        self.ss, self.es = bss[0], bes[7]
         # The SYNC pattern for low-speed/full-speed is KJKJKJKK (00000001).
         if sync != '00000001':
             self.putpb(['SYNC ERROR', sync])
@@ -271,36 +249,36 @@ class Decoder(srd.Decoder):
             self.putb([0, ['SYNC: %s' % sync, 'SYNC', 'S']])
         self.packet.append(sync)
 
-        if len(packet) < 16:
+        if count < 16:
             self.putp([28, ['Invalid packet (shorter than 16 bits)']])
             return
 
         # Bits[8:15]: PID
-        pid = packet[8:15 + 1]
+        pid = bits.bitstr(8, 8)
         pidname = pids.get(pid, ('UNKNOWN', 'Unknown PID'))[0]
-        self.ss, self.es = self.bits[8][1], self.bits[15][2]
+        self.ss, self.es = bss[8], bes[15]
         self.putpb(['PID', pidname])
         self.putb([2, ['PID: %s' % pidname, pidname, pidname[0]]])
         self.packet.append(pid)
         self.packet_summary += pidname
 
         if pidname in ('OUT', 'IN', 'SOF', 'SETUP', 'PING'):
-            if len(packet) < 32:
+            if count < 32:
                 self.putp([28, ['Invalid packet (shorter than 32 bits)']])
                 return
 
             if pidname == 'SOF':
                 # Bits[16:26]: Framenum
-                framenum = bitstr_to_num(packet[16:26 + 1])
-                self.ss, self.es = self.bits[16][1], self.bits[26][2]
+                framenum = bits.field(16, 11)
+                self.ss, self.es = bss[16], bes[26]
                 self.putpb(['FRAMENUM', framenum])
                 self.putb([3, ['Frame: %d' % framenum, 'Frame', 'Fr', 'F']])
                 self.packet.append(framenum)
                 self.packet_summary += ' %d' % framenum
             else:
                 # Bits[16:22]: Addr
-                addr = bitstr_to_num(packet[16:22 + 1])
-                self.ss, self.es = self.bits[16][1], self.bits[22][2]
+                addr = bits.field(16, 7)
+                self.ss, self.es = bss[16], bes[22]
                 self.putpb(['ADDR', addr])
                 self.putb([4, ['Address: %d' % addr, 'Addr: %d' % addr,
                                'Addr', 'A']])
@@ -308,17 +286,17 @@ class Decoder(srd.Decoder):
                 self.packet_summary += ' ADDR %d' % addr
 
                 # Bits[23:26]: EP
-                ep = bitstr_to_num(packet[23:26 + 1])
-                self.ss, self.es = self.bits[23][1], self.bits[26][2]
+                ep = bits.field(23, 4)
+                self.ss, self.es = bss[23], bes[26]
                 self.putpb(['EP', ep])
                 self.putb([5, ['Endpoint: %d' % ep, 'EP: %d' % ep, 'EP', 'E']])
                 self.packet.append(ep)
                 self.packet_summary += ' EP %d' % ep
 
             # Bits[27:31]: CRC5
-            crc5 = bitstr_to_num(packet[27:31 + 1])
-            crc5_calc = calc_crc5(packet[16:27])
-            self.ss, self.es = self.bits[27][1], self.bits[31][2]
+            crc5 = bits.field(27, 5)
+            crc5_calc = calc_crc5(bits.field(16, 11), 11)
+            self.ss, self.es = bss[27], bes[31]
             if crc5 == crc5_calc:
                 self.putpb(['CRC5', crc5])
                 self.putb([6, ['CRC5: 0x%02X' % crc5, 'CRC5', 'C']])
@@ -328,13 +306,13 @@ class Decoder(srd.Decoder):
             self.packet.append(crc5)
         elif pidname in ('DATA0', 'DATA1', 'DATA2', 'MDATA'):
             # Bits[16:packetlen-16]: Data
-            data = packet[16:-16]
-            # TODO: len(data) must be a multiple of 8.
+            datalen = max(count - 32, 0)
+            # TODO: datalen must be a multiple of 8.
             databytes = []
             self.packet_summary += ' ['
-            for i in range(0, len(data), 8):
-                db = bitstr_to_num(data[i:i + 8])
-                self.ss, self.es = self.bits[16 + i][1], self.bits[23 + i][2]
+            for i in range(0, datalen, 8):
+                db = bits.field(16 + i, min(8, datalen - i))
+                self.ss, self.es = bss[16 + i], bes[23 + i]
                 self.putpb(['DATABYTE', db])
                 self.putb([8, ['Databyte: %02X' % db, 'Data: %02X' % db,
                                'DB: %02X' % db, '%02X' % db]])
@@ -343,14 +321,14 @@ class Decoder(srd.Decoder):
             self.packet_summary += ' ]'
 
             # Convenience Python output (no annotation) for all bytes together.
-            self.ss, self.es = self.bits[16][1], self.bits[-16][2]
+            self.ss, self.es = bss[16], bes[-16]
             self.putpb(['DATABYTES', databytes])
             self.packet.append(databytes)
 
             # Bits[packetlen-16:packetlen]: CRC16
-            crc16 = bitstr_to_num(packet[-16:])
-            crc16_calc = calc_crc16(packet[16:-16])
-            self.ss, self.es = self.bits[-16][1], self.bits[-1][2]
+            crc16 = bits.field(count - 16, 16)
+            crc16_calc = calc_crc16(bits.field(16, datalen), datalen)
+            self.ss, self.es = bss[-16], bes[-1]
             if crc16 == crc16_calc:
                 self.putpb(['CRC16', crc16])
                 self.putb([9, ['CRC16: 0x%04X' % crc16, 'CRC16', 'C']])
@@ -376,7 +354,15 @@ class Decoder(srd.Decoder):
         (ptype, pdata) = data
 
         # We only care about certain packet types for now.
-        if ptype not in ('SOP', 'BIT', 'EOP', 'ERR'):
+        if ptype not in ('SOP', 'BIT', 'BITS', 'EOP', 'ERR'):
+            return
+
+        # Take all bits of a packet in one go if the signalling layer
+        # provides them, else collect the individual bits.
+        if ptype == 'BITS':
+            self.bits, self.have_bits = pdata, True
+            return
+        if ptype == 'BIT' and self.have_bits:
             return
 
         # State machine.
@@ -387,11 +373,11 @@ class Decoder(srd.Decoder):
             self.state = 'GET BIT'
         elif self.state == 'GET BIT':
             if ptype == 'BIT':
-                self.bits.append([pdata, ss, es])
+                self.bits.append(pdata == '1', ss, es)
             elif ptype == 'EOP' or ptype == 'ERR':
                 self.es_packet = es
                 self.handle_packet()
                 self.packet, self.packet_summary = [], ''
-                self.bits, self.state = [], 'WAIT FOR SOP'
+                self.bits, self.state = BitBuffer(), 'WAIT FOR SOP'
             else:
                 pass # TODO: Error
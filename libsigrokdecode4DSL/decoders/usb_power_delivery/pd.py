@@ -25,7 +25,7 @@
 
 import sigrokdecode as srd
 import struct
-import zlib   # for crc32
+from common.srdhelper.crc import crc_bytes, CRC32
 
 # BMC encoding with a 600kHz datarate
 UI_US = 1000000/600000.0
@@ -148,6 +148,9 @@ EOP = 0x16
 SYNC_CODES = [SYNC1, SYNC2, SYNC3]
 HRST_CODES = [RST1, RST1, RST1, RST2]
 
+# Two symbols (10 bits, first bit in bit 0) at once, as nibbles.
+DEC4B5B_PAIR = [DEC4B5B[v & 0x1f] | (DEC4B5B[v >> 5] << 4) for v in range(1 << 10)]
+
 SOP_SEQUENCES = [
     (SYNC1, SYNC1, SYNC1, SYNC2),
     (SYNC1, SYNC1, SYNC3, SYNC3),
@@ -167,6 +170,29 @@ START_OF_PACKETS = {
     SOP_SEQUENCES[6]: 'Hard Reset',
 }
 
+def sop_table():
+    '''Map every 20 bit window (4 symbols, first bit in bit 0) to the start
+    of packet it is, as index + 1 in SOP_SEQUENCES, 0 for none. Start of
+    packets are valid even if they have only 3 correct symbols out of 4,
+    an exact match wins, then the first sequence.'''
+    codes = dict((sym, v) for v, sym in enumerate(DEC4B5B) if sym != SYM_ERR)
+    table = bytearray(1 << 20)
+    seqs = [[codes[sym] for sym in seq] for seq in SOP_SEQUENCES]
+    for n in range(len(seqs), 0, -1):
+        seq = seqs[n - 1]
+        for pos in range(4):
+            base = sum(v << (5 * i) for i, v in enumerate(seq) if i != pos)
+            for v in range(32):
+                table[base | (v << (5 * pos))] = n
+    for n, seq in enumerate(seqs, 1):
+        table[sum(v << (5 * i) for i, v in enumerate(seq))] = n
+    return bytes(table)
+
+SOP_TABLE = sop_table()
+
+# Bits as '0'/'1' characters.
+BIT_CHARS = bytes.maketrans(b'\x00\x01', b'01')
+
 SYM_NAME = [
     ['0x0', '0'],
     ['0x1', '1'],
@@ -550,15 +576,20 @@ class Decoder(srd.Decoder):
     def compute_crc32(self):
         bdata = struct.pack('<H'+'I'*len(self.data), self.head & 0xffff,
                             *tuple([d & 0xffffffff for d in self.data]))
-        return zlib.crc32(bdata)
+        return crc_bytes(CRC32, bdata)
 
     def rec_sym(self, i, sym):
         self.putx(i, i+5, [7, SYM_NAME[sym]])
 
+    def window(self, i, n):
+        '''n bits from bits[i] as an integer, the first one in bit 0.'''
+        if i >= 0:
+            return (self.word >> i) & ((1 << n) - 1)
+        # Negative positions count from the end, like list indices.
+        return sum(self.bits[i + j] << j for j in range(n))
+
     def get_sym(self, i, rec=True):
-        v = (self.bits[i] | (self.bits[i+1] << 1) | (self.bits[i+2] << 2) |
-             (self.bits[i+3] << 3) | (self.bits[i+4] << 4))
-        sym = DEC4B5B[v]
+        sym = DEC4B5B[self.window(i, 5)]
         if rec:
             self.rec_sym(i, sym)
         return sym
@@ -569,10 +600,11 @@ class Decoder(srd.Decoder):
         if len(self.bits) - i <= 20:
             self.putwarn('Truncated', '!')
             return 0x0BAD
-        k = [self.get_sym(i), self.get_sym(i+5),
-             self.get_sym(i+10), self.get_sym(i+15)]
+        w = self.window(i, 20)
+        for j in range(4):
+            self.rec_sym(i + 5 * j, DEC4B5B[(w >> (5 * j)) & 0x1f])
         # TODO: Check bad symbols.
-        val = k[0] | (k[1] << 4) | (k[2] << 8) | (k[3] << 12)
+        val = DEC4B5B_PAIR[w & 0x3ff] | (DEC4B5B_PAIR[w >> 10] << 8)
         self.idx += 20
         return val
 
@@ -581,23 +613,19 @@ class Decoder(srd.Decoder):
         hi = self.get_short()
         return lo | (hi << 16)
 
-    def find_corrupted_sop(self, k):
-        # Start of packet are valid even if they have only 3 correct symbols
-        # out of 4.
-        for seq in SOP_SEQUENCES:
-            if [k[i] == seq[i] for i in range(len(k))].count(True) >= 3:
-                return START_OF_PACKETS[seq]
-        return None
-
     def scan_eop(self):
-        for i in range(len(self.bits) - 19):
-            k = (self.get_sym(i, rec=False), self.get_sym(i+5, rec=False),
-                 self.get_sym(i+10, rec=False), self.get_sym(i+15, rec=False))
-            sym = START_OF_PACKETS.get(k, None)
-            if not sym:
-                sym = self.find_corrupted_sop(k)
+        bits = self.bits
+        # Rolling window of the 20 bits from bits[i].
+        w = 0
+        for j in range(min(19, len(bits))):
+            w |= bits[j] << (j + 1)
+        for i in range(len(bits) - 19):
+            w = (w >> 1) | (bits[i + 19] << 19)
+            n = SOP_TABLE[w]
             # We have an interesting symbol sequence.
-            if sym:
+            if n:
+                sym = START_OF_PACKETS[SOP_SEQUENCES[n - 1]]
+                k = [DEC4B5B[(w >> (5 * j)) & 0x1f] for j in range(4)]
                 # Annotate the preamble.
                 self.putx(0, i, [1, ['Preamble', '...']])
                 # Annotate each symbol.
@@ -628,7 +656,7 @@ class Decoder(srd.Decoder):
         self.packet_seq = 0
         self.previous = 0
         self.startsample = None
-        self.bits = []
+        self.bits = bytearray()
         self.edges = []
         self.bad = []
         self.half_one = False
@@ -665,6 +693,9 @@ class Decoder(srd.Decoder):
         if len(self.edges) < 50:
             return # Not a real PD packet
 
+        # All bits in one integer, the first one in bit 0.
+        self.word = int(self.bits[::-1].translate(BIT_CHARS) or b'0', 2)
+
         self.packet_seq += 1
         tstamp = float(self.startsample) / self.samplerate
         self.text += '#%-4d (%8.6fms): ' % (self.packet_seq, tstamp*1000)
@@ -780,7 +811,7 @@ class Decoder(srd.Decoder):
                 self.decode_packet()
                 # Reset for next packet.
                 self.startsample = self.samplenum
-                self.bits = []
+                self.bits = bytearray()
                 self.edges = []
                 self.bad = []
                 self.half_one = False
@@ -20,6 +20,7 @@
 ##
 
 import sigrokdecode as srd
+from common.srdhelper import BitBuffer
 
 '''
 OUTPUT_PYTHON format:
@@ -36,6 +37,7 @@ Packet:
  - 'ERR', None
  - 'KEEP ALIVE', None
  - 'RESET', None
+ - 'BITS', <bitbuffer>
 
 <sym>:
  - 'J', 'K', 'SE0', or 'SE1'
@@ -43,8 +45,18 @@ Packet:
 <bit>:
  - '0' or '1'
  - Note: Symbols like SE0, SE1, and the J that's part of EOP don't yield 'BIT'.
+
+<bitbuffer>:
+ - A common.srdhelper.BitBuffer with all (unstuffed) bits of the packet,
+   the first bit on the bus is the LSB. It holds the start/end sample
+   numbers of every bit as well. It's sent right before the 'EOP' or 'ERR'
+   which ends the packet, so that consumers don't need to collect the
+   individual 'BIT's.
 '''
 
+# SYNC and low-speed PREamble PID, first bit on the bus is the LSB.
+SYNC_PRE = 0x3c80
+
 # Low-/full-speed symbols.
 # Note: Low-speed J and K are inverted compared to the full-speed J and K!
 symbols = {
@@ -194,6 +206,15 @@ class Decoder(srd.Decoder):
         s, e = self.samplenum_lastedge, self.samplenum_edge
         self.put(s, e, self.out_ann, data)
 
+    def putbits(self):
+        # Pass the packet's bits in one go, ahead of its EOP/ERR.
+        bits = self.bits
+        if bits.count:
+            self.put(bits.ss[0], bits.es[-1], self.out_python, ['BITS', bits])
+        else:
+            s = self.samplenum_edge
+            self.put(s, s, self.out_python, ['BITS', bits])
+
     def set_new_target_samplenum(self):
         self.samplepos += self.bitwidth
         self.samplenum_target = int(self.samplepos)
@@ -205,7 +226,7 @@ class Decoder(srd.Decoder):
         if sym != 'K' or self.oldsym != 'J':
             return
         self.consecutive_ones = 0
-        self.bits = ''
+        self.bits = BitBuffer()
         self.update_bitrate()
         self.samplepos = self.samplenum - (self.bitwidth / 2) + 0.5
         self.set_new_target_samplenum()
@@ -221,6 +242,7 @@ class Decoder(srd.Decoder):
                 self.putb([7, ['Stuff bit: 0', 'SB: 0', '0']])
                 self.consecutive_ones = 0
             else:
+                self.putbits()
                 self.putpb(['ERR', None])
                 self.putb([8, ['Bit stuff error', 'BS ERR', 'B']])
                 self.state = 'IDLE'
@@ -228,6 +250,7 @@ class Decoder(srd.Decoder):
             # Normal bit (not a stuff bit).
             self.putpb(['BIT', b])
             self.putb([6, ['%s' % b]])
+            self.bits.append(b == '1', self.samplenum_lastedge, self.samplenum_edge)
             if b == '1':
                 self.consecutive_ones += 1
             else:
@@ -243,10 +266,12 @@ class Decoder(srd.Decoder):
             pass
         elif sym == 'J':
             # Got an EOP.
+            self.putbits()
             self.putpm(['EOP', None])
             self.putm([5, ['EOP', 'E']])
             self.state = 'WAIT IDLE'
         else:
+            self.putbits()
             self.putpm(['ERR', None])
             self.putm([8, ['EOP Error', 'EErr', 'E']])
             self.state = 'IDLE'
@@ -263,10 +288,9 @@ class Decoder(srd.Decoder):
             self.handle_bit(b)
         self.putpb(['SYM', sym])
         self.putb(sym_annotation[sym])
-        if len(self.bits) <= 16:
-            self.bits += b
-        if len(self.bits) == 16 and self.bits == '0000000100111100':
+        if len(self.bits) == 16 and self.bits.value == SYNC_PRE:
             # Sync and low-speed PREamble seen
+            self.putbits()
             self.putpx(['EOP', None])
             self.state = 'IDLE'
             self.signalling = 'low-speed-rp'
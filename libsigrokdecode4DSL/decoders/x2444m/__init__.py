@@ -20,6 +20,10 @@
 '''
 This decoder stacks on top of the 'spi' PD and decodes the Xicor X2444M/P
 nonvolatile static RAM protocol.
+
+The 'Memory image' binary output holds the 32 bytes of RAM (16 words, MSB
+first) as far as they were read or written in the capture. Unknown bytes
+are 0xFF.
 '''
 
 from .pd import Decoder
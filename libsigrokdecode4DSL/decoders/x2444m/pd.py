@@ -24,6 +24,7 @@
 
 import re
 import sigrokdecode as srd
+from common.srdhelper.memimage import MemoryImage
 
 registers = {
     0x80: ['WRDS',  0, lambda _: ''],
@@ -45,6 +46,7 @@ class Decoder(srd.Decoder):
     license = 'gplv2+'
     inputs = ['spi']
     outputs = []
+    input_packets = ('CS-CHANGE', 'DATA')
     tags = ['IC', 'Memory']
     annotations = (
         ('wrds', 'Write disable'),
@@ -56,6 +58,9 @@ class Decoder(srd.Decoder):
         ('read', 'Data read from RAM'),
         ('read', 'Data read from RAM'),
     )
+    binary = (
+        ('image', 'Memory image'),
+    )
 
     def __init__(self):
         self.reset()
@@ -67,6 +72,26 @@ class Decoder(srd.Decoder):
 
     def start(self):
         self.out_ann = self.register(srd.OUTPUT_ANN)
+        self.out_binary = self.register(srd.OUTPUT_BINARY)
+        # The RAM: 16 words of 16 bits, byte addressed, MSB first.
+        self.image = MemoryImage(size=32)
+        self.image_ss = self.image_es = None
+
+    def end(self):
+        # Dump the RAM contents seen in the capture.
+        data = self.image.dump()
+        if data:
+            self.put(self.image_ss, self.image_es, self.out_binary, [0, data])
+
+    def update_image(self, ss, es, name, addr, value):
+        data = value.to_bytes(self.cmd_digit - 1, 'big')
+        if name == 'READ':
+            self.image.read(addr * 2, data, ss)
+        else:
+            self.image.write(addr * 2, data, ss)
+        if self.image_ss is None:
+            self.image_ss = ss
+        self.image_es = es
 
     def putreadwrite(self, ss, es, reg, idx, addr, value):
         self.put(ss, es, self.out_ann,
@@ -108,6 +133,9 @@ class Decoder(srd.Decoder):
                         value = self.write_value
                     else:
                         value = 0
+                    if name in ('READ', 'WRITE'):
+                        self.update_image(self.addr_start, es, name,
+                                          (self.addr >> 3) & 0x0f, value)
                     self.putreadwrite(self.addr_start, es, name, idx,
                                       decoder((self.addr >> 3) & 0x0f), value)
 
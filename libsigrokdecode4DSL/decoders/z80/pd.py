@@ -135,25 +135,38 @@ class Decoder(srd.Decoder):
         self.op_state   = self.state_IDLE
         self.instr_len  = 0
 
+    def bus_cycle(self, pins):
+        cycle = Cycle.NONE
+        if pins[Pin.MREQ] != 1: # default to asserted
+            if pins[Pin.RD] == 0:
+                cycle = Cycle.FETCH if pins[Pin.M1] == 0 else Cycle.MEMRD
+            elif pins[Pin.WR] == 0:
+                cycle = Cycle.MEMWR
+        elif pins[Pin.IORQ] == 0: # default to not asserted
+            if pins[Pin.M1] == 0:
+                cycle = Cycle.INTACK
+            elif pins[Pin.RD] == 0:
+                cycle = Cycle.IORD
+            elif pins[Pin.WR] == 0:
+                cycle = Cycle.IOWR
+        return cycle
+
     def decode(self):
+        # The bus state only changes on edges of the control strobes. The
+        # address bus is sampled when a cycle begins, the data bus keeps
+        # its last value seen during a cycle. So wait for strobe edges
+        # while the bus is idle, and for strobe or data bus edges within
+        # a cycle, instead of inspecting every single sample.
+        strobes = [Pin.M1, Pin.RD, Pin.WR, Pin.MREQ, Pin.IORQ]
+        strobes = [p for p in strobes if self.has_channel(p)]
+        data = [p for p in range(Pin.D0, Pin.D7 + 1) if self.has_channel(p)]
+        cond_idle = [{p: 'e'} for p in strobes]
+        cond_cycle = cond_idle + [{p: 'e'} for p in data]
+
+        # Initial bus state, at the first sample.
+        pins = self.wait()
         while True:
-            # TODO: Come up with more appropriate self.wait() conditions.
-            (d0, d1, d2, d3, d4, d5, d6, d7, m1, rd, wr, mreq, iorq, a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, a14, a15) = self.wait()
-            pins = (d0, d1, d2, d3, d4, d5, d6, d7, m1, rd, wr, mreq, iorq, a0, a1, a2, a3, a4, a5, a6, a7, a8, a9, a10, a11, a12, a13, a14, a15)
-            cycle = Cycle.NONE
-            if pins[Pin.MREQ] != 1: # default to asserted
-                if pins[Pin.RD] == 0:
-                    cycle = Cycle.FETCH if pins[Pin.M1] == 0 else Cycle.MEMRD
-                elif pins[Pin.WR] == 0:
-                    cycle = Cycle.MEMWR
-            elif pins[Pin.IORQ] == 0: # default to not asserted
-                if pins[Pin.M1] == 0:
-                    cycle = Cycle.INTACK
-                elif pins[Pin.RD] == 0:
-                    cycle = Cycle.IORD
-                elif pins[Pin.WR] == 0:
-                    cycle = Cycle.IOWR
-
+            cycle = self.bus_cycle(pins)
             if cycle != Cycle.NONE:
                 self.bus_data = reduce_bus(pins[Pin.D0:Pin.D7+1])
             if cycle != self.prev_cycle:
@@ -165,6 +178,8 @@ class Decoder(srd.Decoder):
                     self.on_cycle_trans()
             self.prev_cycle = cycle
 
+            pins = self.wait(cond_idle if cycle == Cycle.NONE else cond_cycle)
+
     def on_cycle_begin(self, bus_addr):
         if self.pend_addr is not None:
             self.put_text(self.addr_start, Ann.ADDR,
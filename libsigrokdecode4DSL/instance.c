@@ -433,6 +433,7 @@ SRD_API struct srd_decoder_inst *srd_inst_new(struct srd_session *sess,
 	di->thread_handle = NULL;
 	di->got_new_samples = FALSE;
 	di->handled_all_samples = FALSE;
+	di->chunk_release_pending = FALSE;
 	di->want_wait_terminate = FALSE;
 	di->decoder_state = SRD_OK;
 	di->python_proc_error = NULL;
@@ -516,6 +517,7 @@ static void srd_inst_reset_state(struct srd_decoder_inst *di)
 	oldpins_array_free(di);
 	di->got_new_samples = FALSE;
 	di->handled_all_samples = FALSE;
+	di->chunk_release_pending = FALSE;
 	di->want_wait_terminate = FALSE;
 	di->decoder_state = SRD_OK;
 	/* Conditions and mutex got reset after joining the thread. */
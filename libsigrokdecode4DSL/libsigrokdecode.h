@@ -203,6 +203,14 @@ struct srd_decoder {
 	 */
 	GSList *binary;
 
+	/**
+	 * Array of NULL-terminated char[], containing the text lines of the
+	 * annotation templates, for put() calls of the form
+	 * [class, template, value, ...]. Indexed by the template number,
+	 * NULL if the decoder has no templates.
+	 */
+	GPtrArray *ann_templates;
+
 	/** List of decoder options. */
 	GSList *options;
 
@@ -306,6 +314,14 @@ struct srd_decoder_inst {
 	/** Indicates whether the worker thread has handled all samples. */
 	gboolean handled_all_samples;
 
+	/**
+	 * All samples of the chunk were processed, but wait_edges() handed
+	 * out edges of it, so it's released at the next wait() or
+	 * wait_edges() call. Until then the decoder is still working on
+	 * the chunk.
+	 */
+	gboolean chunk_release_pending;
+
 	/** Requests termination of wait() and decode(). */
 	gboolean want_wait_terminate;
 
@@ -351,6 +367,7 @@ struct srd_proto_data_annotation {
 	char str_number_hex[DECODE_NUM_HEX_MAX_LEN]; //numerical value hex format string
 	long long numberic_value;
 	char **ann_text; //text string lines
+	int ann_text_shared; //ann_text belongs to the decoder's templates
 };
 struct srd_proto_data_binary {
 	int bin_class;
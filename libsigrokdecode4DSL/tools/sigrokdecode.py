@@ -0,0 +1,407 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Pure Python stand-in for the sigrokdecode module of libsigrokdecode4DSL.
+
+It runs the protocol decoders outside of DSView, for benchmarks and for
+regression checks. The input is one Signal per channel, which holds the
+initial level and the sample numbers of all transitions (a run length
+encoded sample buffer), so long captures take little memory and wait()
+can jump from edge to edge like the C implementation does.
+
+The behaviour follows type_decoder.c and instance.c:
+ - The first wait() starts at sample 0, every later one at the sample
+   after the last match. There is no edge at sample 0.
+ - A condition-less wait() returns the next sample. {'skip': N} matches
+   N samples after the current sample (and any sample after that, when
+   combined with other terms).
+ - self.matched has one bit per condition which matched.
+ - Structured annotations [class, template, value, ...] are formatted
+   with annotation_texts().
+ - Unused optional channels read as 0xff and never have edges.
+ - OUTPUT_PYTHON data is passed to the decode() method of the stacked
+   decoders, output_packets() reports their 'input_packets'.
+
+When the input is exhausted wait() raises EndOfData, which the caller
+catches (the C implementation never returns from wait() in this case).
+
+With srd_setup(profile=True) an instance also counts wait() calls per
+matched condition, put() calls per output type and annotation class and
+the bytes of binary output, and it measures the time spent in each value
+of self.state (see srd_profile_report()).
+'''
+
+from bisect import bisect_left, bisect_right
+import re
+from time import perf_counter
+
+OUTPUT_ANN, OUTPUT_PYTHON, OUTPUT_BINARY, OUTPUT_META = range(4)
+OUTPUT_NAMES = ('ann', 'python', 'binary', 'meta')
+SRD_CONF_SAMPLERATE = 10000
+
+_value_field = re.compile(r'\{\$(\d+)(?::((?:0\d+)?[dx]))?\}')
+
+def annotation_texts(decoder, data):
+    '''Return the text lines of the annotation 'data' which 'decoder' put.
+    Structured annotations [class, template, value, ...] are filled in as
+    DSView shows them in the default (hex) display format: "{$}" is
+    replaced by all values, "{$N}" by the N-th one, "{$N:d}" and "{$N:x}"
+    by the N-th one in decimal and lower case hex, whatever the display
+    format, "{$N:04x}" zero padded to four digits. The lines of other
+    annotations are returned as they are.'''
+    if len(data) == 2 and not isinstance(data[1], int):
+        return list(data[1])
+    templates = getattr(decoder, 'annotation_templates', ())
+    if not isinstance(data[1], int) or not 0 <= data[1] < len(templates):
+        raise ValueError('Unregistered annotation template %r.' % (data[1],))
+    values = ['%02X' % v for v in data[2:]]
+    if not values:
+        return list(templates[data[1]])
+    def field(m):
+        i = int(m.group(1))
+        if i >= len(values):
+            return m.group(0)
+        if m.group(2):
+            return ('%' + m.group(2)) % data[2 + i]
+        return values[i]
+    texts = []
+    for line in templates[data[1]]:
+        line = _value_field.sub(field, line)
+        texts.append(line.replace('{$}', ' '.join(values)))
+    return texts
+
+class EndOfData(BaseException):
+    '''Raised by wait() at the end of the input. Derived from BaseException
+    so decoders which catch Exception don't swallow it.'''
+    pass
+
+class Signal:
+    '''The samples of one channel: initial level, the (ascending) sample
+    numbers where the level toggles, and the number of samples.'''
+
+    def __init__(self, init, edges, num_samples):
+        self.init = init
+        self.edges = edges
+        self.num_samples = num_samples
+
+    @classmethod
+    def from_levels(cls, levels):
+        '''Create a Signal from a sequence with one level per sample.'''
+        edges = [i for i in range(1, len(levels)) if levels[i] != levels[i - 1]]
+        return cls(levels[0] if levels else 0, edges, len(levels))
+
+    def value(self, s):
+        return self.init ^ (bisect_right(self.edges, s) & 1)
+
+    def is_edge(self, s):
+        i = bisect_left(self.edges, s)
+        return i < len(self.edges) and self.edges[i] == s
+
+    def next_edge(self, s):
+        '''Return the first edge at or after sample s, or None.'''
+        i = bisect_left(self.edges, s)
+        return self.edges[i] if i < len(self.edges) else None
+
+class Decoder:
+    '''Base class of the protocol decoders. The srd_* methods are used by
+    the harness, the others form the API the decoders see.'''
+
+    samplenum = 0
+    matched = 0
+
+    def srd_setup(self, signals=(), num_samples=0, options=None, stack=(),
+                  record=False, profile=False):
+        '''Set up an instance. 'signals' holds a Signal (or None, for an
+        unused channel) per decoder channel, 'stack' the instances which
+        receive the OUTPUT_PYTHON data.'''
+        self.srd_signals = list(signals)
+        self.srd_num_samples = num_samples
+        self.srd_stack = list(stack)
+        self.srd_record = record
+        self.srd_outputs = []
+        self.srd_cur = 0
+        self.srd_first = True
+        self.srd_wait_calls = 0
+        self.srd_put_calls = 0
+        self.srd_counts = [0, 0, 0, 0]
+        self.srd_data = []
+        self.samplenum = 0
+        self.matched = 0
+        self.srd_profile = profile
+        self.srd_prof_matched = []
+        self.srd_prof_edges = 0
+        self.srd_prof_anns = {}
+        self.srd_prof_bin = {}
+        self.srd_prof_states = {}
+        self.srd_prof_wait_time = 0.0
+        self.srd_prof_child_time = 0.0
+        self.srd_prof_state = None
+        self.srd_prof_t = None
+        opts = {}
+        for o in getattr(self, 'options', ()):
+            if isinstance(o, dict):
+                opts[o['id']] = o['default']
+        opts.update(options or {})
+        self.options = opts
+
+    # Decoder API.
+
+    def register(self, output_type, proto_id=None, meta=None):
+        self.srd_outputs.append(output_type)
+        return len(self.srd_outputs) - 1
+
+    def put(self, ss, es, output_id, data):
+        self.srd_put_calls += 1
+        output_type = self.srd_outputs[output_id]
+        self.srd_counts[output_type] += 1
+        if self.srd_record:
+            self.srd_data.append((output_type, ss, es, data))
+        if self.srd_profile:
+            self.srd_prof_put(output_type, data)
+        if output_type == OUTPUT_PYTHON:
+            for d in self.srd_stack:
+                if d.srd_profile:
+                    d.srd_prof_decode(self, ss, es, data)
+                else:
+                    d.decode(ss, es, data)
+
+    def output_packets(self, output_id):
+        # Recording stands for a frontend callback, which takes everything.
+        if self.srd_record or self.srd_outputs[output_id] != OUTPUT_PYTHON:
+            return None
+        packets = set()
+        for d in self.srd_stack:
+            types = getattr(d, 'input_packets', None)
+            if types is None:
+                return None
+            packets.update(types)
+        return frozenset(packets)
+
+    def has_channel(self, index):
+        return index < len(self.srd_signals) and self.srd_signals[index] is not None
+
+    def printlog(self, s):
+        print(s)
+
+    def wait(self, conds=None):
+        self.srd_wait_calls += 1
+        if self.srd_profile:
+            return self.srd_prof_wait(self.srd_wait, conds)
+        return self.srd_wait(conds)
+
+    def srd_wait(self, conds):
+        if isinstance(conds, dict):
+            conds = [conds]
+        base = self.srd_cur
+        start = base if self.srd_first else base + 1
+        if not conds or not any(conds):
+            conds = [{}]
+        self.srd_first = False
+
+        best, firsts = None, []
+        for cond in conds:
+            s = self.srd_find(cond, base, start, best)
+            firsts.append(s)
+            if s is not None and (best is None or s < best):
+                best = s
+        if best is None:
+            self.srd_cur = self.srd_num_samples
+            raise EndOfData()
+
+        self.matched = sum(1 << i for i, s in enumerate(firsts) if s == best)
+        self.srd_cur = self.samplenum = best
+        return self.srd_pins(best)
+
+    def wait_edges(self, channels, limit=1024):
+        self.srd_wait_calls += 1
+        if self.srd_profile:
+            edges = self.srd_prof_wait(self.srd_wait_edges, channels, limit)
+            self.srd_prof_edges += len(edges)
+            return edges
+        return self.srd_wait_edges(channels, limit)
+
+    def srd_wait_edges(self, channels, limit):
+        start = self.srd_cur if self.srd_first else self.srd_cur + 1
+        self.srd_first = False
+        start = max(start, 1)
+        sigs = [self.srd_signals[c] for c in channels
+                if c < len(self.srd_signals) and self.srd_signals[c] is not None]
+        edges = []
+        while len(edges) < limit:
+            s = None
+            for sig in sigs:
+                e = sig.next_edge(start)
+                if e is not None and (s is None or e < s):
+                    s = e
+            if s is None or s >= self.srd_num_samples:
+                break
+            edges.append((s, self.srd_pins(s)))
+            start = s + 1
+        if not edges:
+            self.srd_cur = self.srd_num_samples
+            raise EndOfData()
+        self.srd_cur = self.samplenum = s = edges[-1][0]
+        # One condition per channel, like libsigrokdecode.
+        self.matched = 0
+        for i, c in enumerate(channels):
+            sig = self.srd_signals[c] if c < len(self.srd_signals) else None
+            if sig is not None and sig.next_edge(s) == s:
+                self.matched |= 1 << i
+        return edges
+
+    # Condition matching.
+
+    def srd_pins(self, s):
+        return tuple(0xff if sig is None else sig.value(s) for sig in self.srd_signals)
+
+    def srd_term(self, channel, term, s):
+        sig = self.srd_signals[channel] if channel < len(self.srd_signals) else None
+        if sig is None:
+            return term == 'n'
+        if term == 'h':
+            return sig.value(s) == 1
+        if term == 'l':
+            return sig.value(s) == 0
+        edge = s > 0 and sig.is_edge(s)
+        if term == 'e':
+            return edge
+        if term == 'n':
+            return not edge
+        if term == 'r':
+            return edge and sig.value(s) == 1
+        if term == 'f':
+            return edge and sig.value(s) == 0
+        raise ValueError('Unknown term type %r.' % term)
+
+    def srd_find(self, cond, base, start, limit):
+        '''Return the first sample at or after 'start' (and not after
+        'limit') which matches all terms of 'cond', or None.'''
+        lo, terms = start, []
+        for key, value in cond.items():
+            if isinstance(key, str):
+                lo = max(lo, base + value)
+            else:
+                terms.append((key, value))
+        s, n = lo, self.srd_num_samples
+        while s < n and (limit is None or s <= limit):
+            for channel, term in terms:
+                if not self.srd_term(channel, term, s):
+                    break
+            else:
+                return s
+            # Levels and edges can only change at the next edge of the
+            # channel which failed, the no-edge term at the next sample.
+            sig = self.srd_signals[channel] if channel < len(self.srd_signals) else None
+            if term == 'n':
+                s += 1
+                continue
+            if sig is None:
+                return None
+            s = sig.next_edge(s + 1)
+            if s is None:
+                return None
+        return None
+
+    # Profiling.
+
+    def srd_prof_enter(self, now):
+        # Charge the time since the last return to the state the decoder
+        # was in then, minus the time spent in stacked decoders.
+        if self.srd_prof_t is not None:
+            key = self.srd_prof_state
+            st = self.srd_prof_states.get(key)
+            if st is None:
+                st = self.srd_prof_states[key] = [0, 0.0]
+            st[0] += 1
+            st[1] += now - self.srd_prof_t - self.srd_prof_child_time
+        self.srd_prof_child_time = 0.0
+
+    def srd_prof_leave(self):
+        state = getattr(self, 'state', None)
+        self.srd_prof_state = None if state is None else str(state)
+        self.srd_prof_t = perf_counter()
+
+    def srd_prof_wait(self, func, *args):
+        t = perf_counter()
+        self.srd_prof_enter(t)
+        try:
+            res = func(*args)
+        finally:
+            self.srd_prof_wait_time += perf_counter() - t
+            self.srd_prof_leave()
+        m, i = self.matched, 0
+        while m:
+            if m & 1:
+                while len(self.srd_prof_matched) <= i:
+                    self.srd_prof_matched.append(0)
+                self.srd_prof_matched[i] += 1
+            m >>= 1
+            i += 1
+        return res
+
+    def srd_prof_decode(self, parent, ss, es, data):
+        t = perf_counter()
+        self.srd_prof_state = getattr(self, 'state', None)
+        if self.srd_prof_state is not None:
+            self.srd_prof_state = str(self.srd_prof_state)
+        self.srd_prof_t, self.srd_prof_child_time = t, 0.0
+        try:
+            self.decode(ss, es, data)
+        finally:
+            self.srd_prof_enter(perf_counter())
+            self.srd_prof_t = None
+            parent.srd_prof_child_time += perf_counter() - t
+
+    def srd_prof_put(self, output_type, data):
+        if output_type == OUTPUT_ANN:
+            cls = data[0]
+            self.srd_prof_anns[cls] = self.srd_prof_anns.get(cls, 0) + 1
+        elif output_type == OUTPUT_BINARY:
+            cls = data[0]
+            self.srd_prof_bin[cls] = self.srd_prof_bin.get(cls, 0) + len(data[1])
+
+    def srd_profile_report(self):
+        '''Return the profile of a profiled instance as a dict which can
+        be serialized to JSON. Annotation and binary classes are listed by
+        their ids, states by str(self.state), None for no state.'''
+        if self.srd_prof_t is not None:
+            # Charge the time after the last wait() (the end of the data).
+            self.srd_prof_enter(perf_counter())
+            self.srd_prof_t = None
+        anns = getattr(self, 'annotations', ())
+        bins = getattr(self, 'binary', ())
+        def name(table, cls):
+            # DSView annotations are (type, id, description) tuples.
+            if not 0 <= cls < len(table):
+                return str(cls)
+            return table[cls][1] if len(table[cls]) > 2 else table[cls][0]
+        states = sorted(self.srd_prof_states.items(), key=lambda kv: -kv[1][1])
+        return {
+            'decoder': getattr(self, 'id', type(self).__module__),
+            'wait_calls': self.srd_wait_calls,
+            'wait_seconds': self.srd_prof_wait_time,
+            'matched': self.srd_prof_matched,
+            'edges': self.srd_prof_edges,
+            'put_calls': self.srd_put_calls,
+            'puts': {OUTPUT_NAMES[t]: c for t, c in enumerate(self.srd_counts) if c},
+            'annotations': {name(anns, c): n for c, n in sorted(self.srd_prof_anns.items())},
+            'binary_bytes': {name(bins, c): n for c, n in sorted(self.srd_prof_bin.items())},
+            'states': [{'state': k, 'calls': v[0], 'seconds': v[1]} for k, v in states],
+        }
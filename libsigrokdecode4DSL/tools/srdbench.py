@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Offline decoder benchmark.
+
+Runs decoder stacks on synthetic captures (see srdgen.py) with the pure
+Python sigrokdecode stand-in, and reports the throughput in samples and
+annotations per second and the peak Python memory of each scenario.
+
+    ./srdbench.py                   # all scenarios
+    ./srdbench.py -l                # list the scenarios
+    ./srdbench.py uart can -n 3     # best of three runs
+    ./srdbench.py --json            # machine readable output
+    ./srdbench.py usb --profile     # wait()/put() counts and time per state
+
+The numbers only compare Python decoder code, the C side of
+libsigrokdecode (sample unpacking, condition matching) is not part of
+the measurement.
+'''
+
+import argparse
+import gc
+import importlib
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+DECODERS_DIR = os.path.join(os.path.dirname(TOOLS_DIR), 'decoders')
+if TOOLS_DIR not in sys.path:
+    sys.path.insert(0, TOOLS_DIR)
+
+import sigrokdecode as srd
+import srdgen
+
+def load_decoder(name, decoders_dir=DECODERS_DIR):
+    '''Return the Decoder class of the decoder in directory 'name'.'''
+    if decoders_dir not in sys.path:
+        sys.path.insert(1, decoders_dir)
+    return importlib.import_module(name).Decoder
+
+def decoder_channels(dec):
+    # Like libsigrokdecode, use the class attributes, some decoders reuse
+    # the names for instance state.
+    cls = dec if isinstance(dec, type) else type(dec)
+    return [c['id'] for c in getattr(cls, 'channels', ()) + getattr(cls, 'optional_channels', ())]
+
+def run_stack(stack, capture=None, channel_map=None, record=False, profile=False):
+    '''Run a decoder stack. 'stack' lists (decoder, options) pairs from the
+    bottom (logic input) decoder to the top one, 'channel_map' maps the
+    bottom decoder's channel ids to capture channel names (ids which are
+    not in the map use the same name). 'record' is True to record the
+    output of all the decoders, 'top' for the top one only (the others
+    then only send the packet types the stacked decoders ask for, as in
+    DSView). Returns the instances, bottom first.'''
+    channel_map = channel_map or {}
+    insts = []
+    for name, options in reversed(stack):
+        inst = load_decoder(name)()
+        rec = bool(record) and (record != 'top' or not insts)
+        if not insts:
+            inst.srd_setup(options=options, record=rec, profile=profile)
+        else:
+            inst.srd_setup(options=options, stack=insts[:1], record=rec,
+                           profile=profile)
+        insts.insert(0, inst)
+
+    bottom = insts[0]
+    num_samples = capture.num_samples if capture else 0
+    signals = [capture.channels.get(channel_map.get(c, c)) if capture else None
+               for c in decoder_channels(bottom)]
+    bottom.srd_signals = signals
+    bottom.srd_num_samples = num_samples
+
+    for inst in insts:
+        if capture and hasattr(inst, 'metadata'):
+            inst.metadata(srd.SRD_CONF_SAMPLERATE, capture.samplerate)
+        inst.start()
+    try:
+        bottom.decode()
+    except srd.EndOfData:
+        pass
+    for inst in insts:
+        inst.last_samplenum = num_samples
+        if hasattr(inst, 'end'):
+            inst.end()
+    return insts
+
+class Scenario:
+    def __init__(self, name, stack, capture, channel_map=None):
+        self.name = name
+        self.stack = stack
+        self.capture = capture
+        self.channel_map = channel_map
+
+def _i2c_eeprom_transfers(count):
+    data = srdgen.random_bytes(count * 8)
+    transfers = []
+    for i in range(count):
+        addr = (8 * i) & 0xff
+        transfers.append((0x50, False, bytes([addr]) + data[8 * i:8 * i + 8]))
+        transfers.append((0x50, False, bytes([addr])))
+        transfers.append((0x50, True, data[8 * i:8 * i + 8]))
+    return transfers
+
+def _i2c_lm75_transfers(count):
+    # Temperature reads, between EEPROM traffic for the filter to drop.
+    data = srdgen.random_bytes(count * 2)
+    transfers = []
+    for i in range(count):
+        transfers.append((0x48, True, data[2 * i:2 * i + 2]))
+        transfers.extend(_i2c_eeprom_transfers(1))
+    return transfers
+
+def _onewire_transactions(count):
+    rom = [0x28, 0xff, 0x4c, 0x11, 0x62, 0x16, 0x04, 0xfa]
+    trans = []
+    for i in range(count):
+        # Match ROM, Convert T, then Match ROM, Read Scratchpad.
+        trans.append([(0x55, False)] + [(b, False) for b in rom] + [(0x44, False)])
+        trans.append([(0x55, False)] + [(b, False) for b in rom] + [(0xbe, False)] +
+                     [(b, True) for b in srdgen.random_bytes(9, seed=i)])
+    return trans
+
+def _usb_packets(count):
+    packets = []
+    for i in range(count):
+        packets.append(srdgen.usb_sof(i & 0x7ff))
+        packets.append(srdgen.usb_token(srdgen.USB_IN, 3, 1))
+        packets.append(srdgen.usb_data(srdgen.USB_DATA0 if i & 1 else srdgen.USB_DATA1,
+                                       srdgen.random_bytes(32, seed=i)))
+        packets.append(srdgen.usb_handshake(srdgen.USB_ACK))
+    return packets
+
+# Consumer, PCM, copy permitted, 48 kHz, 24 bit words.
+SPDIF_STATUS = bytes([0x04, 0x00, 0x00, 0x02, 0x0b])
+
+def _spdif_samples(count):
+    data = srdgen.random_bytes(6 * count, seed=3)
+    return [(int.from_bytes(data[i:i + 3], 'little'), int.from_bytes(data[i + 3:i + 6], 'little'))
+            for i in range(0, len(data), 6)]
+
+def _modbus_frames(count):
+    '''Request/response pairs, registers and coils with random contents.'''
+    frames = []
+    for i in range(count):
+        data = srdgen.random_bytes(2 * (i % 8 + 1), seed=i)
+        frames.append([1, 3, 0, i & 0xff, 0, len(data) // 2])
+        frames.append([1, 3, len(data)] + list(data))
+        frames.append([1, 16, 0, i & 0xff, 0, len(data) // 2, len(data)] + list(data))
+        frames.append([1, 16, 0, i & 0xff, 0, len(data) // 2])
+        frames.append([1, 5, 0, i & 0xff, 0xff if i & 1 else 0, 0])
+        frames.append(frames[-1])
+        frames.append([1, 8, 0, 0, data[0], data[1]])
+        frames.append([1, 0x81 + i % 6, 1 + i % 4])
+    return frames
+
+def _pd_header(msg_type, count, msg_id, source, ext=False):
+    return msg_type | (1 << 6) | (source << 8) | (msg_id << 9) | (count << 12) | (ext << 15)
+
+def _usb_pd_packets(count):
+    '''Power negotiations with noise, corrupted K-codes and bad CRCs.'''
+    packets = []
+    for i in range(count):
+        n = i & 7
+        packets.append(150)
+        packets.append((srdgen.PD_SOP, _pd_header(1, 2, n, 1),
+                        [(100 << 10) | 300, (3 << 30) | (110 << 17) | (33 << 8) | 60]))
+        packets.append((srdgen.PD_SOP, _pd_header(1, 0, n, 0), []))
+        packets.append((srdgen.PD_SOP, _pd_header(2, 1, n, 0), [(1 << 28) | (300 << 10) | 300]))
+        # One bad K-code, which still makes a SOP.
+        packets.append(((srdgen.PD_SYNC1, srdgen.PD_SYNC3, srdgen.PD_SYNC1, srdgen.PD_SYNC2),
+                        _pd_header(3, 0, n, 1), []))
+        packets.append((srdgen.PD_SOP, _pd_header(6, 0, n, 1), [], 0x12345678))
+        packets.append((srdgen.PD_SOP1, _pd_header(15, 1, n, 1), [0xff008001]))
+        packets.append((srdgen.PD_SOP, _pd_header(2, 2, n, 0, True),
+                        [0x8006 | (0x1234 << 16), 0x56789abc]))
+        if i % 4 == 3:
+            packets.append((srdgen.PD_HARD_RESET, None, None))
+    return packets
+
+def _ws281x_frames(count, leds=60, bits=24):
+    '''An LED strip animation, every other frame repeats the one before
+    and the others change a few LEDs.'''
+    data = srdgen.random_bytes(count * 12 + leds * bits // 8)
+    frame = [int.from_bytes(data[i:i + bits // 8], 'big')
+             for i in range(0, leds * bits // 8, bits // 8)]
+    pos = leds * bits // 8
+    frames = []
+    for i in range(count):
+        if i & 1:
+            for j in range(1 + i % 3):
+                frame[data[pos] % leds] = int.from_bytes(data[pos + 1:pos + 4], 'big')
+                pos += 4
+        frames.append(list(frame))
+    return frames
+
+def _audio_frames(count, bits=16, channels=2):
+    '''Signed words (a ramp per channel plus noise), as unsigned 'bits'
+    bit values.'''
+    data = srdgen.random_bytes(count * channels)
+    mask = (1 << bits) - 1
+    step = 1 << (bits - 6)
+    return [tuple(((i * step * (c + 1) - (1 << (bits - 1)) + data[i * channels + c]) & mask)
+                  for c in range(channels)) for i in range(count)]
+
+def scenarios(scale=1):
+    '''The default scenarios, 'scale' multiplies the amount of data.'''
+    n = max(1, int(scale * 100))
+    return [
+        Scenario('uart', [('1-uart', {'baudrate': 115200})],
+                 lambda: srdgen.uart(10000000, srdgen.random_bytes(40 * n), 115200)),
+        Scenario('spi', [('1-spi', {})],
+                 lambda: srdgen.spi(20000000, srdgen.random_bytes(40 * n), bitrate=1000000)),
+        Scenario('i2c', [('1-i2c', {})],
+                 lambda: srdgen.i2c(4000000, _i2c_eeprom_transfers(2 * n))),
+        Scenario('i2c-eeprom', [('1-i2c', {}), ('eeprom24xx', {})],
+                 lambda: srdgen.i2c(4000000, _i2c_eeprom_transfers(2 * n))),
+        Scenario('i2c-lm75', [('1-i2c', {}), ('i2cfilter', {'address': 0x48}),
+                              ('lm75', {})],
+                 lambda: srdgen.i2c(4000000, _i2c_lm75_transfers(2 * n))),
+        Scenario('can', [('can', {'bitrate': 500000})],
+                 lambda: srdgen.can(8000000, [(0x100 + i, srdgen.random_bytes(8, seed=i))
+                                              for i in range(5 * n)], 500000)),
+        # The link decoder tells bits apart by the high time of a slot
+        # with these options (its defaults don't decode standard timing).
+        Scenario('onewire', [('onewire_link', {'data order': 'space first',
+                                               'min height level pulse time': 15.0}),
+                             ('onewire_network', {})],
+                 lambda: srdgen.onewire(1000000, _onewire_transactions(n))),
+        Scenario('usb', [('usb_signalling', {'signalling': 'full-speed'}),
+                         ('usb_packet', {})],
+                 lambda: srdgen.usb(48000000, _usb_packets(2 * n))),
+        Scenario('modbus', [('1-uart', {'baudrate': 115200}),
+                            ('modbus', {'scchannel': 'RX', 'cschannel': 'RX'})],
+                 lambda: srdgen.modbus_rtu(2000000, _modbus_frames(n), 115200)),
+        Scenario('spdif', [('spdif', {})],
+                 lambda: srdgen.spdif(100000000, _spdif_samples(4 * n),
+                                      channel_status=SPDIF_STATUS)),
+        Scenario('usb-pd', [('usb_power_delivery', {})],
+                 lambda: srdgen.usb_pd(4000000, _usb_pd_packets(n // 4 + 1))),
+        Scenario('ws281x', [('rgb_led_ws281x', {})],
+                 lambda: srdgen.ws281x(8000000, _ws281x_frames(n // 2 + 1))),
+        Scenario('ws281x-frames', [('rgb_led_ws281x', {'mode': 'frames'})],
+                 lambda: srdgen.ws281x(8000000, _ws281x_frames(n // 2 + 1))),
+        Scenario('i2s', [('i2s', {})],
+                 lambda: srdgen.i2s(10000000, _audio_frames(50 * n))),
+        Scenario('tdm-audio', [('tdm_audio', {'channels': 4})],
+                 lambda: srdgen.tdm(25000000, _audio_frames(25 * n, channels=4))),
+        Scenario('pwm', [('pwm', {})],
+                 lambda: srdgen.pulses(1000000, 200 * n)),
+        Scenario('timing', [('timing', {})],
+                 lambda: srdgen.pulses(1000000, 200 * n)),
+    ]
+
+def measure(scenario, repeat=1, memory=True, profile=False):
+    '''Run a scenario, return a dict with the results.'''
+    capture = scenario.capture()
+    best = None
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        insts = run_stack(scenario.stack, capture, scenario.channel_map)
+        elapsed = time.perf_counter() - t
+        if best is None or elapsed < best:
+            best = elapsed
+    annotations = sum(i.srd_counts[srd.OUTPUT_ANN] for i in insts)
+    res = {
+        'scenario': scenario.name,
+        'stack': [name for name, _ in scenario.stack],
+        'samples': capture.num_samples,
+        'annotations': annotations,
+        'wait_calls': insts[0].srd_wait_calls,
+        'seconds': best,
+        'samples_per_sec': capture.num_samples / best if best else 0,
+        'annotations_per_sec': annotations / best if best else 0,
+    }
+    if memory:
+        # A separate run, tracing allocations slows the decoders down.
+        gc.collect()
+        tracemalloc.start()
+        run_stack(scenario.stack, capture, scenario.channel_map)
+        res['peak_memory'] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    if profile:
+        # Also a separate run, the profile has its own overhead.
+        insts = run_stack(scenario.stack, capture, scenario.channel_map, profile=True)
+        res['profile'] = [i.srd_profile_report() for i in insts]
+    return res
+
+def print_profile(res, states=8):
+    for p in res['profile']:
+        print('  %s: %d wait() calls (%.3f s in the harness)%s, %d put() calls %s' % (
+              p['decoder'], p['wait_calls'], p['wait_seconds'],
+              ', %d edges' % p['edges'] if p['edges'] else '',
+              p['put_calls'], p['puts']))
+        if p['matched']:
+            print('    matched conditions: %s' % ' '.join('%d:%d' % (i, n)
+                  for i, n in enumerate(p['matched']) if n))
+        for title, counts in (('annotations', p['annotations']),
+                              ('binary bytes', p['binary_bytes'])):
+            if counts:
+                print('    %s: %s' % (title, ' '.join('%s:%d' % kv for kv in counts.items())))
+        for st in p['states'][:states]:
+            print('    %9.3f s %9d  %s' % (st['seconds'], st['calls'], st['state']))
+        if len(p['states']) > states:
+            print('    ... %d more states' % (len(p['states']) - states))
+
+def main():
+    parser = argparse.ArgumentParser(description='Offline decoder benchmark.')
+    parser.add_argument('names', nargs='*', help='scenarios to run (default: all)')
+    parser.add_argument('-l', '--list', action='store_true', help='list the scenarios')
+    parser.add_argument('-s', '--scale', type=float, default=1,
+                        help='scale the amount of data per scenario')
+    parser.add_argument('-n', '--repeat', type=int, default=1,
+                        help='runs per scenario, the fastest one is reported')
+    parser.add_argument('--no-memory', action='store_true',
+                        help='skip the peak memory measurement')
+    parser.add_argument('--profile', action='store_true',
+                        help='add a profile of every decoder in the stack')
+    parser.add_argument('--json', action='store_true', help='print JSON')
+    args = parser.parse_args()
+
+    todo = scenarios(args.scale)
+    if args.list:
+        for s in todo:
+            print('%-12s %s' % (s.name, ' -> '.join(name for name, _ in s.stack)))
+        return 0
+    if args.names:
+        unknown = set(args.names) - set(s.name for s in todo)
+        if unknown:
+            parser.error('unknown scenario(s): %s' % ', '.join(sorted(unknown)))
+        todo = [s for s in todo if s.name in args.names]
+
+    results = []
+    if not args.json:
+        print('%-12s %10s %8s %9s %12s %10s %10s' % ('scenario', 'samples',
+              'annots', 'seconds', 'samples/s', 'annots/s', 'peak KiB'))
+    for s in todo:
+        res = measure(s, max(1, args.repeat), not args.no_memory, args.profile)
+        results.append(res)
+        if not args.json:
+            peak = res.get('peak_memory')
+            print('%-12s %10d %8d %9.3f %12.0f %10.0f %10s' % (s.name, res['samples'],
+                  res['annotations'], res['seconds'], res['samples_per_sec'],
+                  res['annotations_per_sec'], '-' if peak is None else '%d' % (peak // 1024)))
+            if args.profile:
+                print_profile(res)
+    if args.json:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
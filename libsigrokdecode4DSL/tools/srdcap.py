@@ -0,0 +1,116 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Compact storage of logic captures for the decoder test corpus.
+
+A capture file is gzip compressed JSON:
+
+    {"samplerate": 25000000, "num_samples": 131072,
+     "channels": {"SDA": [1, 120, 7, ...], ...}}
+
+Each channel holds its initial level followed by the distances between
+consecutive transitions (the first one counted from sample 0). Protocol
+captures are mostly idle, so this is much smaller than one bit per
+sample even before compression.
+
+DSView session files (.dsl, and the .demo files of the virtual device)
+with logic data can be converted with load_dsl().
+'''
+
+import configparser
+import gzip
+import json
+import zipfile
+from sigrokdecode import Signal
+from srdgen import Capture
+
+def save(path, capture):
+    channels = {}
+    for name, sig in capture.channels.items():
+        deltas, last = [sig.init], 0
+        for e in sig.edges:
+            deltas.append(e - last)
+            last = e
+        channels[name] = deltas
+    doc = {'samplerate': capture.samplerate, 'num_samples': capture.num_samples,
+           'channels': channels}
+    with gzip.GzipFile(path, 'wb', mtime=0) as f:
+        f.write(json.dumps(doc, separators=(',', ':'), sort_keys=True).encode())
+
+def load(path):
+    with gzip.open(path, 'rb') as f:
+        doc = json.loads(f.read().decode())
+    n = doc['num_samples']
+    channels = {}
+    for name, deltas in doc['channels'].items():
+        edges, pos = [], 0
+        for d in deltas[1:]:
+            pos += d
+            edges.append(pos)
+        channels[name] = Signal(deltas[0], edges, n)
+    return Capture(doc['samplerate'], n, channels)
+
+def _parse_samplerate(text):
+    value, _, unit = text.strip().partition(' ')
+    scale = {'': 1, 'Hz': 1, 'KHz': 1e3, 'kHz': 1e3, 'MHz': 1e6, 'GHz': 1e9}[unit.strip()]
+    return int(float(value) * scale)
+
+def _bits_to_signal(data, num_samples):
+    # Samples are packed LSB first. Whole bytes at the current level are
+    # skipped, only bytes with a transition are looked at bit by bit.
+    init = data[0] & 1 if data else 0
+    level, edges = init, []
+    same = (0x00, 0xff)
+    for i, byte in enumerate(data):
+        if byte == same[level]:
+            continue
+        for b in range(8):
+            bit = (byte >> b) & 1
+            if bit != level:
+                pos = 8 * i + b
+                if pos >= num_samples:
+                    break
+                edges.append(pos)
+                level = bit
+    return Signal(init, edges, num_samples)
+
+def load_dsl(path, named_only=True):
+    '''Load the logic channels of a DSView session file. Channels are named
+    after their probe names; with 'named_only', channels which still have
+    their default (numeric) name are skipped.'''
+    with zipfile.ZipFile(path) as z:
+        header = configparser.ConfigParser()
+        header.read_string(z.read('header').decode())
+        h = header['header']
+        num_samples = int(h['total samples'])
+        samplerate = _parse_samplerate(h['samplerate'])
+        blocks = int(h.get('total blocks', '1'))
+        names = set(z.namelist())
+        channels = {}
+        for key, name in h.items():
+            if not key.startswith('probe') or not key[5:].isdigit():
+                continue
+            index = int(key[5:])
+            if named_only and name.isdigit():
+                continue
+            data = b''.join(z.read('L-%d/%d' % (index, b)) for b in range(blocks)
+                            if 'L-%d/%d' % (index, b) in names)
+            channels[name] = _bits_to_signal(data, num_samples)
+    return Capture(samplerate, num_samples, channels)
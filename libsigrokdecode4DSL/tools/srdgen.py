@@ -0,0 +1,502 @@
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Synthetic logic captures for the decoder harness.
+
+Every generator returns a Capture, which holds the samplerate, the number
+of samples and one sigrokdecode.Signal per named channel. Timing is kept
+in fractional samples and rounded per edge, so bit times which are not
+a whole number of samples get the usual one sample jitter.
+
+    cap = uart(10000000, b'Hello', baudrate=115200)
+    cap.channels['rxtx'], cap.num_samples
+'''
+
+import random
+import zlib
+from sigrokdecode import Signal
+
+class Capture:
+    def __init__(self, samplerate, num_samples, channels):
+        self.samplerate = samplerate
+        self.num_samples = num_samples
+        self.channels = channels
+
+class Bus:
+    '''Build the waveforms of a set of channels which share a time base.'''
+
+    def __init__(self, samplerate, **levels):
+        self.samplerate = samplerate
+        self.t = 0.0
+        self.init = dict(levels)
+        self.levels = dict(levels)
+        self.edges = {name: [] for name in levels}
+
+    def set(self, **levels):
+        pos = int(round(self.t))
+        for name, level in levels.items():
+            if level == self.levels[name]:
+                continue
+            self.levels[name] = level
+            edges = self.edges[name]
+            if pos == 0:
+                self.init[name] = level
+            elif edges and edges[-1] == pos:
+                # Toggled twice at the same sample.
+                edges.pop()
+            else:
+                edges.append(pos)
+
+    def hold(self, seconds):
+        self.t += seconds * self.samplerate
+
+    def pulse(self, seconds, **levels):
+        self.set(**levels)
+        self.hold(seconds)
+
+    def capture(self):
+        n = int(round(self.t)) + 1
+        return Capture(self.samplerate, n, {name: Signal(self.init[name], edges, n)
+                                            for name, edges in self.edges.items()})
+
+def _msb(value, count):
+    return [(value >> (count - 1 - i)) & 1 for i in range(count)]
+
+def _lsb(value, count):
+    return [(value >> i) & 1 for i in range(count)]
+
+def random_bytes(count, seed=1):
+    r = random.Random(seed)
+    return bytes(r.getrandbits(8) for _ in range(count))
+
+def _uart_char(bus, bit, value, data_bits=8, parity='none', stop_bits=1):
+    bits = [0] + _lsb(value, data_bits)
+    if parity != 'none':
+        p = bin(value & ((1 << data_bits) - 1)).count('1') & 1
+        bits.append(p ^ (parity == 'odd'))
+    bits += [1] * stop_bits
+    for b in bits:
+        bus.pulse(bit, rxtx=b)
+
+def uart(samplerate, data, baudrate=115200, data_bits=8, parity='none',
+         stop_bits=1, idle_bits=2):
+    '''Asynchronous serial frames (LSB first) on channel 'rxtx'.'''
+    bus = Bus(samplerate, rxtx=1)
+    bit = 1.0 / baudrate
+    bus.hold(10 * bit)
+    for value in data:
+        _uart_char(bus, bit, value, data_bits, parity, stop_bits)
+        bus.hold(idle_bits * bit)
+    bus.hold(10 * bit)
+    return bus.capture()
+
+def _crc16_modbus(data):
+    crc = 0xffff
+    for b in data:
+        crc ^= b
+        for _ in range(8):
+            crc = (crc >> 1) ^ 0xa001 if crc & 1 else crc >> 1
+    return bytes([crc & 0xff, crc >> 8])
+
+def modbus_rtu(samplerate, frames, baudrate=19200):
+    '''Modbus RTU frames (8N1) on channel 'rxtx'. The CRC is appended to
+    every frame in 'frames', which are separated by 5 character times.'''
+    bus = Bus(samplerate, rxtx=1)
+    bit = 1.0 / baudrate
+    bus.hold(10 * bit)
+    for frame in frames:
+        for value in bytes(frame) + _crc16_modbus(frame):
+            _uart_char(bus, bit, value)
+        bus.hold(55 * bit)
+    return bus.capture()
+
+def spi(samplerate, mosi, miso=None, bitrate=1000000, word_size=8,
+        words_per_transfer=16):
+    '''SPI mode 0, MSB first, CS# active low. Channels: clk, miso, mosi, cs.'''
+    miso = miso if miso is not None else [~w & ((1 << word_size) - 1) for w in mosi]
+    bus = Bus(samplerate, clk=0, miso=0, mosi=0, cs=1)
+    half = 0.5 / bitrate
+    bus.hold(8 * half)
+    for i, (wo, wi) in enumerate(zip(mosi, miso)):
+        if i % words_per_transfer == 0:
+            bus.pulse(2 * half, cs=0)
+        for bo, bi in zip(_msb(wo, word_size), _msb(wi, word_size)):
+            bus.pulse(half, clk=0, mosi=bo, miso=bi)
+            bus.pulse(half, clk=1)
+        bus.pulse(half, clk=0)
+        if i % words_per_transfer == words_per_transfer - 1 or i == len(mosi) - 1:
+            bus.pulse(4 * half, cs=1)
+    bus.hold(8 * half)
+    return bus.capture()
+
+def i2c(samplerate, transfers, bitrate=100000):
+    '''I2C transfers (addr7, is_read, data), each from START to STOP. The
+    slave ACKs everything, the master NAKs the last byte of a read.
+    Channels: scl, sda.'''
+    bus = Bus(samplerate, scl=1, sda=1)
+    q = 0.25 / bitrate
+    bus.hold(8 * q)
+    for addr, is_read, data in transfers:
+        bus.pulse(2 * q, sda=0)
+        bus.pulse(q, scl=0)
+        octets = [(addr << 1) | bool(is_read)] + list(data)
+        for i, value in enumerate(octets):
+            ack = 1 if is_read and i == len(octets) - 1 else 0
+            for b in _msb(value, 8) + [ack]:
+                bus.pulse(q, sda=b)
+                bus.pulse(2 * q, scl=1)
+                bus.pulse(q, scl=0)
+        bus.pulse(q, sda=0)
+        bus.pulse(q, scl=1)
+        bus.pulse(8 * q, sda=1)
+    return bus.capture()
+
+def _crc(bits, width, poly, init):
+    reg, top, mask = init, 1 << (width - 1), (1 << width) - 1
+    for b in bits:
+        msb = 1 if reg & top else 0
+        reg = (reg << 1) & mask
+        if msb ^ b:
+            reg ^= poly
+    return reg
+
+def _stuff(bits, run=5):
+    out, last, count = [], None, 0
+    for b in bits:
+        out.append(b)
+        count = count + 1 if b == last else 1
+        last = b
+        if count == run:
+            out.append(1 - b)
+            last, count = 1 - b, 1
+    return out
+
+def can_frame(ident, data, extended=False, rtr=False):
+    '''Wire bits of a classic CAN data frame, from SOF to the end of the
+    intermission, with stuff bits and an ACK from the receivers.'''
+    r = int(bool(rtr))
+    if extended:
+        bits = [0] + _msb(ident >> 18, 11) + [1, 1] + _msb(ident & 0x3ffff, 18) + [r, 0, 0]
+    else:
+        bits = [0] + _msb(ident, 11) + [r, 0, 0]
+    bits += _msb(len(data), 4)
+    if not rtr:
+        for value in data:
+            bits += _msb(value, 8)
+    bits += _msb(_crc(bits, 15, 0x4599, 0), 15)
+    return _stuff(bits) + [1, 0, 1] + [1] * 7 + [1] * 3
+
+def can(samplerate, frames, bitrate=500000, idle_bits=0):
+    '''CAN frames (ident, data[, extended]) on channel 'can_rx'.'''
+    bus = Bus(samplerate, can_rx=1)
+    bit = 1.0 / bitrate
+    bus.hold(20 * bit)
+    for frame in frames:
+        for b in can_frame(*frame):
+            bus.pulse(bit, can_rx=b)
+        bus.hold(idle_bits * bit)
+    bus.hold(20 * bit)
+    return bus.capture()
+
+def onewire(samplerate, transactions, overdrive=False):
+    '''1-Wire transactions on channel 'owr'. Each transaction is a reset
+    with a presence pulse, followed by (value, is_read) bytes. Read slots
+    are answered by the device, LSB first.'''
+    us = 1e-6 if not overdrive else 1e-6 / 8
+    bus = Bus(samplerate, owr=1)
+    bus.hold(100 * us)
+    for octets in transactions:
+        bus.pulse(480 * us, owr=0)
+        bus.pulse(30 * us, owr=1)
+        bus.pulse(120 * us, owr=0)
+        bus.pulse(500 * us, owr=1)
+        for value, is_read in octets:
+            for b in _lsb(value, 8):
+                if is_read:
+                    # The device extends the master's pulse for a zero.
+                    bus.pulse(2 * us if b else 50 * us, owr=0)
+                    bus.pulse(68 * us if b else 20 * us, owr=1)
+                elif b:
+                    bus.pulse(6 * us, owr=0)
+                    bus.pulse(64 * us, owr=1)
+                else:
+                    bus.pulse(60 * us, owr=0)
+                    bus.pulse(10 * us, owr=1)
+        bus.hold(100 * us)
+    return bus.capture()
+
+# USB packet identifiers.
+USB_OUT, USB_IN, USB_SOF, USB_SETUP = 0x1, 0x9, 0x5, 0xd
+USB_DATA0, USB_DATA1 = 0x3, 0xb
+USB_ACK, USB_NAK = 0x2, 0xa
+
+def _crc_lsb(bits, width, poly, init):
+    # CRC over LSB first wire bits, complemented result, sent LSB first.
+    reg, top, mask = init, 1 << (width - 1), (1 << width) - 1
+    for b in bits:
+        msb = 1 if reg & top else 0
+        reg = (reg << 1) & mask
+        if msb ^ b:
+            reg ^= poly
+    reg ^= mask
+    return [(reg >> (width - 1 - i)) & 1 for i in range(width)]
+
+def usb_token(pid, addr, endp):
+    field = _lsb(addr, 7) + _lsb(endp, 4)
+    return (pid, field + _crc_lsb(field, 5, 0x05, 0x1f))
+
+def usb_sof(frame):
+    field = _lsb(frame, 11)
+    return (USB_SOF, field + _crc_lsb(field, 5, 0x05, 0x1f))
+
+def usb_data(pid, payload):
+    field = []
+    for value in payload:
+        field += _lsb(value, 8)
+    return (pid, field + _crc_lsb(field, 16, 0x8005, 0xffff))
+
+def usb_handshake(pid):
+    return (pid, [])
+
+def usb(samplerate, packets, speed='full', idle_bits=8):
+    '''USB packets (see usb_token() and friends) on channels 'dp' and
+    'dm', NRZI coded with bit stuffing, SYNC and EOP.'''
+    bitrate = 12000000 if speed == 'full' else 1500000
+    bit = 1.0 / bitrate
+    # Idle/J state: D+ high for full speed, D- high for low speed.
+    j = (1, 0) if speed == 'full' else (0, 1)
+    bus = Bus(samplerate, dp=j[0], dm=j[1])
+    bus.hold(idle_bits * bit)
+    for pid, field in packets:
+        bits = [0] * 7 + [1] + _lsb(pid | ((~pid & 0xf) << 4), 8) + field
+        state = 1
+        for b in _usb_stuff(bits):
+            if not b:
+                state ^= 1
+            level = j if state else (j[1], j[0])
+            bus.pulse(bit, dp=level[0], dm=level[1])
+        bus.pulse(2 * bit, dp=0, dm=0)
+        bus.pulse(idle_bits * bit, dp=j[0], dm=j[1])
+    return bus.capture()
+
+def _usb_stuff(bits):
+    # A zero is inserted after six consecutive ones.
+    out, ones = [], 0
+    for b in bits:
+        out.append(b)
+        ones = ones + 1 if b else 0
+        if ones == 6:
+            out.append(0)
+            ones = 0
+    return out
+
+def pulses(samplerate, count, period=1e-5, seed=1):
+    '''A pulse train with random duty cycle on channel 'data'.'''
+    r = random.Random(seed)
+    bus = Bus(samplerate, data=0)
+    bus.hold(period)
+    for _ in range(count):
+        duty = r.uniform(0.1, 0.9)
+        bus.pulse(period * duty, data=1)
+        bus.pulse(period * (1 - duty), data=0)
+    return bus.capture()
+
+# S/PDIF preambles, as run lengths in UI (half bit times).
+SPDIF_B, SPDIF_M, SPDIF_W = (3, 1, 1, 3), (3, 3, 1, 1), (3, 2, 1, 2)
+
+def spdif(samplerate, samples, rate=48000, channel_status=b'', first_frame=0):
+    '''Biphase mark coded S/PDIF on channel 'data'. 'samples' lists (left,
+    right) pairs of 24 bit words (4 aux bits and the 20 bit sample, sent
+    LSB first). 'channel_status' holds the 24 bytes of the channel status
+    block, 'first_frame' is the frame number within the 192 frame block
+    of the first frame.'''
+    ui = 1.0 / (rate * 128)
+    status = int.from_bytes(bytes(channel_status).ljust(24, b'\0'), 'little')
+    bus = Bus(samplerate, data=0)
+    level = 0
+    bus.hold(8 * ui)
+    def runs(lengths):
+        nonlocal level
+        for r in lengths:
+            level ^= 1
+            bus.pulse(r * ui, data=level)
+    for i, pair in enumerate(samples):
+        frame = (first_frame + i) % 192
+        for ch, value in enumerate(pair):
+            if ch:
+                runs(SPDIF_W)
+            else:
+                runs(SPDIF_B if frame == 0 else SPDIF_M)
+            c = (status >> frame) & 1
+            bits = _lsb(value & 0xffffff, 24) + [0, 0, c]
+            bits.append(sum(bits) & 1)
+            for b in bits:
+                runs((1, 1) if b else (2,))
+    level ^= 1
+    bus.pulse(8 * ui, data=level)
+    return bus.capture()
+
+def jtag(samplerate, scans, bitrate=1000000, seed=1):
+    '''JTAG on channels 'tck', 'tms', 'tdi' and 'tdo'. 'scans' lists
+    ('ir' or 'dr', bit count, value) tuples, the value is shifted in LSB
+    first and TDO shifts out random bits. A scan with a fourth item
+    pauses (PAUSE-xR) after that many bits. The TAP is reset first and
+    returns to RUN-TEST/IDLE after every scan.'''
+    r = random.Random(seed)
+    period = 1.0 / bitrate
+    bus = Bus(samplerate, tck=0, tms=1, tdi=0, tdo=0)
+    bus.hold(period)
+    def clock(tms, tdi=0, tdo=0):
+        bus.set(tck=0, tms=tms, tdi=tdi, tdo=tdo)
+        bus.hold(period / 2)
+        bus.pulse(period / 2, tck=1)
+    for _ in range(5):
+        clock(1)
+    clock(0)
+    for scan in scans:
+        kind, count, value = scan[:3]
+        pause = scan[3] if len(scan) > 3 else None
+        # RUN-TEST/IDLE -> SELECT-DR-SCAN (-> SELECT-IR-SCAN) -> CAPTURE -> SHIFT
+        for tms in ((1, 1, 0, 0) if kind == 'ir' else (1, 0, 0)):
+            clock(tms)
+        for i in range(count):
+            last = i == count - 1
+            clock(1 if last or i + 1 == pause else 0, (value >> i) & 1, r.randint(0, 1))
+            if i + 1 == pause and not last:
+                # EXIT1 -> PAUSE -> PAUSE -> EXIT2 -> SHIFT
+                for tms in (0, 0, 1, 0):
+                    clock(tms)
+        # EXIT1 -> UPDATE -> RUN-TEST/IDLE
+        clock(1)
+        clock(0)
+        clock(0)
+    return bus.capture()
+
+# USB PD 4b5b codes (sent LSB first) of the nibbles and K-codes.
+PD_4B5B = [0b11110, 0b01001, 0b10100, 0b10101, 0b01010, 0b01011, 0b01110, 0b01111,
+           0b10010, 0b10011, 0b10110, 0b10111, 0b11010, 0b11011, 0b11100, 0b11101]
+PD_SYNC1, PD_SYNC2, PD_SYNC3 = 0b11000, 0b10001, 0b00110
+PD_RST1, PD_RST2, PD_EOP = 0b00111, 0b11001, 0b01101
+PD_SOP = (PD_SYNC1, PD_SYNC1, PD_SYNC1, PD_SYNC2)
+PD_SOP1 = (PD_SYNC1, PD_SYNC1, PD_SYNC3, PD_SYNC3)
+PD_HARD_RESET = (PD_RST1, PD_RST1, PD_RST1, PD_RST2)
+
+def usb_pd(samplerate, packets, seed=1):
+    '''USB Power Delivery BMC on channel 'cc1' (300 kbit/s). 'packets'
+    lists (sop, header, data words) tuples, 'sop' holds the four K-codes
+    (a reset has no header). A fourth item replaces the CRC. An int
+    item stands for that many random edges (noise).'''
+    r = random.Random(seed)
+    half = 1.0 / 600000
+    bus = Bus(samplerate, cc1=0)
+    level = 0
+    def toggle(t):
+        nonlocal level
+        level ^= 1
+        bus.pulse(t, cc1=level)
+    def nibbles(value, count):
+        return [PD_4B5B[(value >> (4 * i)) & 15] for i in range(count)]
+    bus.hold(20 * half)
+    for p in packets:
+        if isinstance(p, int):
+            for _ in range(p):
+                toggle(r.uniform(0.6, 2.9) * half)
+            bus.hold(200 * half)
+            continue
+        codes = list(p[0])
+        if p[1] is not None:
+            header, data = p[1], p[2]
+            codes += nibbles(header, 4)
+            for d in data:
+                codes += nibbles(d, 8)
+            raw = header.to_bytes(2, 'little') + b''.join(d.to_bytes(4, 'little') for d in data)
+            crc = p[3] if len(p) > 3 else zlib.crc32(raw)
+            codes += nibbles(crc, 8) + [PD_EOP]
+        bits = [i & 1 for i in range(64)]
+        for c in codes:
+            bits += _lsb(c, 5)
+        for b in bits:
+            if b:
+                toggle(half)
+                toggle(half)
+            else:
+                toggle(2 * half)
+        toggle(200 * half)
+    return bus.capture()
+
+def ws281x(samplerate, frames, bits=24):
+    '''WS281x LED strip data on channel 'din' (800 kbit/s). 'frames' lists
+    the LED values of each frame ('bits' bits per LED, sent MSB first),
+    the frames are separated by a reset (80 us low).'''
+    bus = Bus(samplerate, din=0)
+    bus.hold(100e-6)
+    for leds in frames:
+        for value in leds:
+            for b in _msb(value, bits):
+                t = 0.8e-6 if b else 0.4e-6
+                bus.pulse(t, din=1)
+                bus.pulse(1.25e-6 - t, din=0)
+        bus.hold(80e-6)
+    return bus.capture()
+
+def i2s(samplerate, frames, wordsize=16, slot=None, rate=48000, shift=0):
+    '''I2S on channels 'sck', 'ws' and 'sd'. 'frames' lists (left, right)
+    pairs of 'wordsize' bit words, sent MSB first and left aligned in
+    slots of 'slot' bits. WS is high for the left channel and changes
+    'shift' bits before the first bit of a slot, SD and WS change on the
+    falling edge of SCK.'''
+    slot = slot or wordsize
+    half = 0.5 / (rate * 2 * slot)
+    ws, sd = [0] * 4, [0] * 4
+    for pair in list(frames) + [(0, 0)]:
+        for ch, value in enumerate(pair):
+            ws += [1 - ch] * slot
+            sd += _msb(value & ((1 << wordsize) - 1), wordsize) + [0] * (slot - wordsize)
+    ws = ws[shift:] + [1] * shift
+    bus = Bus(samplerate, sck=0, ws=0, sd=0)
+    for w, d in zip(ws, sd):
+        bus.pulse(half, sck=0, ws=w, sd=d)
+        bus.pulse(half, sck=1)
+    bus.pulse(half, sck=0)
+    return bus.capture()
+
+def tdm(samplerate, frames, bits=16, rate=48000):
+    '''TDM audio on channels 'clock', 'frame' and 'data'. 'frames' lists
+    the slot values of each frame, 'bits' bits each, sent MSB first. The
+    frame sync is high during the first bit of a frame, the frames have
+    as many slots as the longest one. Data and frame sync change on the
+    falling edge of the clock.'''
+    slots = max(len(f) for f in frames)
+    half = 0.5 / (rate * slots * bits)
+    bus = Bus(samplerate, clock=0, frame=0, data=0)
+    def bit(f, d):
+        bus.pulse(half, clock=0, frame=f, data=d)
+        bus.pulse(half, clock=1)
+    for _ in range(4):
+        bit(0, 0)
+    for values in list(frames) + [()]:
+        stream = []
+        for v in values:
+            stream += _msb(v & ((1 << bits) - 1), bits)
+        stream += [0] * ((slots - len(values)) * bits)
+        for i, d in enumerate(stream):
+            bit(int(i == 0), d)
+    bus.pulse(half, clock=0)
+    return bus.capture()
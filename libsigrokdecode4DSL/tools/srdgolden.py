@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+##
+## This file is part of the libsigrokdecode project.
+##
+## Copyright (C) 2024 DreamSourceLab <support@dreamsourcelab.com>
+##
+## This program is free software; you can redistribute it and/or modify
+## it under the terms of the GNU General Public License as published by
+## the Free Software Foundation; either version 2 of the License, or
+## (at your option) any later version.
+##
+## This program is distributed in the hope that it will be useful,
+## but WITHOUT ANY WARRANTY; without even the implied warranty of
+## MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+## GNU General Public License for more details.
+##
+## You should have received a copy of the GNU General Public License
+## along with this program; if not, see <http://www.gnu.org/licenses/>.
+##
+
+'''
+Golden output regression check for the protocol decoders.
+
+Every case runs a decoder stack on a capture of the corpus (corpus/*.cap.gz,
+see srdcap.py) and compares the annotations and the OUTPUT_PYTHON packets
+of all decoders in the stack with the stored golden file (corpus/*.golden.gz,
+gzip compressed, one JSON record per line):
+
+    [<decoder>, "ann", <ss>, <es>, <class>, [<texts>]]
+    [<decoder>, "py", <ss>, <es>, <data>]
+
+where <decoder> is the position in the stack (0 is the logic decoder).
+
+    ./srdgolden.py                  # check all cases
+    ./srdgolden.py -t 2 demo-uart   # allow +/-2 samples on ss/es
+    ./srdgolden.py --update can     # accept the current output
+    ./srdgolden.py --import-dsl session.dsl NAME
+
+Records are matched by their contents first (ignoring ss/es), matched
+records whose ss or es moved by more than the tolerance are reported as
+moved, the others as missing or new.
+'''
+
+import argparse
+import difflib
+import gzip
+import io
+import json
+import os
+import sys
+import traceback
+from array import array
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+CORPUS_DIR = os.path.join(TOOLS_DIR, 'corpus')
+if TOOLS_DIR not in sys.path:
+    sys.path.insert(0, TOOLS_DIR)
+
+import sigrokdecode as srd
+import srdbench
+import srdcap
+import srdgen
+
+class Case:
+    def __init__(self, name, capture, stack, channel_map=None, record=True):
+        self.name = name
+        self.capture = capture
+        self.stack = stack
+        self.channel_map = channel_map
+        # 'top': only the top decoder's output is recorded, see run_stack().
+        self.record = record
+
+DEMO_MAP_SPI = {'mosi': 'MOSI', 'clk': 'CLK', 'cs': 'CS#', 'miso': 'MISO'}
+
+# The decoders and options of DSView's protocol demo, plus the synthetic
+# captures of the benchmark.
+CASES = [
+    Case('demo-i2c-eeprom', 'protocol-demo',
+         [('1-i2c', {'address_format': 'shifted'}),
+          ('eeprom24xx', {'addr_counter': 0, 'chip': 'generic'})],
+         {'sda': 'SDA', 'scl': 'SCL'}),
+    Case('demo-uart', 'protocol-demo',
+         [('1-uart', {'anno_startstop': 'yes', 'baudrate': 115200})],
+         {'rxtx': 'UART'}),
+    Case('demo-spi', 'protocol-demo',
+         [('1-spi', {'cs_polarity': 'active-low', 'wordsize': 8})], DEMO_MAP_SPI),
+    Case('demo-can-fd', 'protocol-demo',
+         [('can-fd', {'nominal_bitrate': 500000, 'fast_bitrate': 2000000,
+                      'sample_point': 70})],
+         {'can_rx': 'CAN-FD'}),
+    Case('uart', 'uart', [('1-uart', {'baudrate': 115200})]),
+    Case('uart-frame', 'uart', [('1-uart', {'baudrate': 115200, 'decode_mode': 'frame'})]),
+    Case('uart-parity', 'uart-7e2',
+         [('1-uart', {'baudrate': 57600, 'num_data_bits': 7, 'parity_type': 'even',
+                      'num_stop_bits': 2.0})]),
+    Case('spi', 'spi', [('1-spi', {})]),
+    Case('i2c', 'i2c', [('1-i2c', {})]),
+    Case('i2c-eeprom', 'i2c', [('1-i2c', {}), ('eeprom24xx', {})]),
+    # Packet types on demand: transactions through the filter, single
+    # packets through the demux.
+    Case('i2c-filter-lm75', 'i2c-lm75',
+         [('1-i2c', {}), ('i2cfilter', {'address': 0x48}), ('lm75', {})],
+         record='top'),
+    # All decoders recorded: the filter and lm75 get the single packets.
+    Case('i2c-filter-lm75-all', 'i2c-lm75',
+         [('1-i2c', {}), ('i2cfilter', {'address': 0x48}), ('lm75', {})]),
+    Case('i2c-demux-eeprom', 'i2c',
+         [('1-i2c', {}), ('i2cdemux', {}), ('eeprom24xx', {})], record='top'),
+    Case('can', 'can', [('can', {'bitrate': 500000})]),
+    Case('onewire', 'onewire',
+         [('onewire_link', {'data order': 'space first',
+                            'min height level pulse time': 15.0}),
+          ('onewire_network', {})]),
+    Case('usb-fs', 'usb-fs',
+         [('usb_signalling', {'signalling': 'full-speed'}), ('usb_packet', {})]),
+    Case('usb-ls', 'usb-ls',
+         [('usb_signalling', {'signalling': 'low-speed'}), ('usb_packet', {})]),
+    Case('jtag', 'jtag', [('jtag', {}), ('jtag_stm32', {})]),
+    Case('spdif', 'spdif', [('spdif', {})]),
+    Case('modbus', 'modbus', [('1-uart', {'baudrate': 19200}),
+                              ('modbus', {'scchannel': 'RX', 'cschannel': 'RX'})]),
+    Case('usb-pd', 'usb-pd', [('usb_power_delivery', {'fulltext': 'yes'})]),
+    Case('ws281x', 'ws281x', [('rgb_led_ws281x', {})]),
+    Case('ws281x-frames', 'ws281x', [('rgb_led_ws281x', {'mode': 'frames'})]),
+    Case('ws281x-rgbw', 'ws281x-rgbw',
+         [('rgb_led_ws281x', {'default_color_order': 'GRBW',
+                              'view_color_order': 'RGBW'})]),
+    Case('i2s', 'i2s', [('i2s', {})]),
+    Case('i2s-lsb', 'i2s', [('i2s', {'bitorder': 'lsb-first', 'bit_align': 'right-aligned',
+                                     'wordsize': 12})]),
+    Case('i2s-short', 'i2s', [('i2s', {'wordsize': 20})]),
+    Case('i2s-24', 'i2s-24', [('i2s', {'bit_shift': 'right-shifted by one', 'wordsize': 24})]),
+    Case('tdm-audio', 'tdm', [('tdm_audio', {'channels': 4})]),
+    Case('tdm-audio-second-edge', 'tdm', [('tdm_audio', {'channels': 4, 'edge': 'falling',
+                                                          'sampling edge': 'second edge'})]),
+    Case('pwm', 'pulses', [('pwm', {})]),
+    Case('timing', 'pulses', [('timing', {'edge': 'rising', 'delta': 'yes'})]),
+    Case('counter', 'pulses', [('counter', {'divider': 8})]),
+]
+
+def _usb_packets(count):
+    packets = []
+    for i in range(count):
+        packets.append(srdgen.usb_token(srdgen.USB_SETUP if i == 0 else srdgen.USB_IN, 3, 0))
+        packets.append(srdgen.usb_data(srdgen.USB_DATA0 if i & 1 else srdgen.USB_DATA1,
+                                       srdgen.random_bytes(8, seed=i)))
+        packets.append(srdgen.usb_handshake(srdgen.USB_ACK if i % 3 else srdgen.USB_NAK))
+    return packets
+
+# How the synthetic captures of the corpus were made. The stored files
+# are the reference, changes to srdgen.py don't affect the corpus until
+# the captures are regenerated (--make-captures).
+SYNTHETIC = {
+    'uart': lambda: srdgen.uart(1000000, srdgen.random_bytes(64), 115200),
+    'uart-7e2': lambda: srdgen.uart(1000000, [b & 0x7f for b in srdgen.random_bytes(32, 2)],
+                                    57600, data_bits=7, parity='even', stop_bits=2),
+    'spi': lambda: srdgen.spi(8000000, srdgen.random_bytes(48), bitrate=1000000),
+    'i2c': lambda: srdgen.i2c(2000000, srdbench._i2c_eeprom_transfers(4)),
+    'i2c-lm75': lambda: srdgen.i2c(2000000, srdbench._i2c_lm75_transfers(3)),
+    'can': lambda: srdgen.can(4000000, [(0x123, b'\x01\x02\x03'), (0x7ff, b''),
+                                        (0x1abcdef, srdgen.random_bytes(8), True),
+                                        (0x000, b'\x00' * 8), (0x555, b'\xff' * 8)], 500000),
+    'onewire': lambda: srdgen.onewire(500000, srdbench._onewire_transactions(1)),
+    'usb-fs': lambda: srdgen.usb(48000000, _usb_packets(4)),
+    'usb-ls': lambda: srdgen.usb(12000000, _usb_packets(2), speed='low'),
+    'pulses': lambda: srdgen.pulses(1000000, 100),
+    'jtag': lambda: srdgen.jtag(8000000, [('ir', 9, 0x1fe), ('dr', 32, 0x3ba00477),
+                                          ('ir', 9, 0x1ff), ('dr', 1, 1),
+                                          ('dr', 40, 0x1234567890, 17), ('dr', 600, 3 ** 370)]),
+    'modbus': lambda: srdgen.modbus_rtu(1000000, srdbench._modbus_frames(3)),
+    'usb-pd': lambda: srdgen.usb_pd(4000000, srdbench._usb_pd_packets(8)),
+    'ws281x': lambda: srdgen.ws281x(8000000, srdbench._ws281x_frames(6, leds=8)),
+    'ws281x-rgbw': lambda: srdgen.ws281x(8000000, srdbench._ws281x_frames(4, leds=5, bits=32),
+                                         bits=32),
+    'spdif': lambda: srdgen.spdif(50000000, srdbench._spdif_samples(200),
+                                  channel_status=srdbench.SPDIF_STATUS, first_frame=188),
+    'i2s': lambda: srdgen.i2s(10000000, srdbench._audio_frames(40)),
+    'i2s-24': lambda: srdgen.i2s(25000000, srdbench._audio_frames(41, bits=24),
+                                 wordsize=24, slot=32, shift=1),
+    'tdm': lambda: srdgen.tdm(25000000, srdbench._audio_frames(30, channels=4) + [(1, 2, 3)]),
+}
+
+def capture_path(name):
+    return os.path.join(CORPUS_DIR, name + '.cap.gz')
+
+def golden_path(name):
+    return os.path.join(CORPUS_DIR, name + '.golden.gz')
+
+def normalize(obj):
+    '''Turn OUTPUT_PYTHON data into plain JSON values.'''
+    if obj is None or isinstance(obj, (bool, int, float, str)):
+        return obj
+    if isinstance(obj, (bytes, bytearray)):
+        return {'bytes': obj.hex()}
+    if isinstance(obj, (list, tuple, array)):
+        return [normalize(o) for o in obj]
+    if isinstance(obj, dict):
+        return {str(k): normalize(v) for k, v in sorted(obj.items(), key=lambda i: str(i[0]))}
+    if hasattr(obj, '__dict__'):
+        d = {'class': type(obj).__name__}
+        d.update((k, normalize(v)) for k, v in sorted(vars(obj).items()))
+        return d
+    return repr(obj)
+
+def run_case(case):
+    '''Return the output records of a case.'''
+    capture = srdcap.load(capture_path(case.capture))
+    insts = srdbench.run_stack(case.stack, capture, case.channel_map,
+                               record=case.record)
+    records = []
+    for level, inst in enumerate(insts):
+        for output_type, ss, es, data in inst.srd_data:
+            if output_type == srd.OUTPUT_ANN:
+                records.append([level, 'ann', ss, es, data[0],
+                                srd.annotation_texts(inst, data)])
+            elif output_type == srd.OUTPUT_PYTHON:
+                records.append([level, 'py', ss, es, normalize(data)])
+    return records
+
+def dump(record):
+    return json.dumps(record, ensure_ascii=False, separators=(', ', ': '))
+
+def write_golden(path, records):
+    with gzip.GzipFile(path, 'wb', mtime=0) as z:
+        with io.TextIOWrapper(z, encoding='utf-8') as f:
+            for r in records:
+                f.write(dump(r) + '\n')
+
+def read_golden(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def diff_records(golden, actual, tolerance=0):
+    '''Compare two record lists, return a list of (kind, golden record,
+    actual record) for all differences.'''
+    # Round trip through JSON, so tuples and lists compare equal.
+    actual = json.loads(json.dumps(actual))
+    if golden == actual:
+        return []
+    key = lambda r: dump(r[:2] + r[4:])
+    gkeys, akeys = [key(r) for r in golden], [key(r) for r in actual]
+    if gkeys == akeys:
+        opcodes = [('equal', 0, len(golden), 0, len(actual))]
+    else:
+        sm = difflib.SequenceMatcher(None, gkeys, akeys, autojunk=False)
+        opcodes = sm.get_opcodes()
+    diffs = []
+    for tag, g0, g1, a0, a1 in opcodes:
+        if tag == 'equal':
+            for g, a in zip(golden[g0:g1], actual[a0:a1]):
+                if abs(g[2] - a[2]) > tolerance or abs(g[3] - a[3]) > tolerance:
+                    diffs.append(('moved', g, a))
+            continue
+        for g in golden[g0:g1]:
+            diffs.append(('missing', g, None))
+        for a in actual[a0:a1]:
+            diffs.append(('new', None, a))
+    return diffs
+
+def check(case, tolerance, show):
+    path = golden_path(case.name)
+    if not os.path.exists(path):
+        print('%s: no golden file, run with --update' % case.name)
+        return False
+    try:
+        actual = run_case(case)
+    except Exception:
+        print('%s: decoder failed' % case.name)
+        traceback.print_exc()
+        return False
+    diffs = diff_records(read_golden(path), actual, tolerance)
+    if not diffs:
+        print('%s: ok (%d records)' % (case.name, len(actual)))
+        return True
+    print('%s: %d differences' % (case.name, len(diffs)))
+    for kind, g, a in diffs[:show]:
+        if g is not None:
+            print('  - %-7s %s' % (kind, dump(g)))
+        if a is not None:
+            print('  + %-7s %s' % (kind, dump(a)))
+    if len(diffs) > show:
+        print('  ... %d more' % (len(diffs) - show))
+    return False
+
+def main():
+    parser = argparse.ArgumentParser(description='Check decoder output against golden files.')
+    parser.add_argument('names', nargs='*', help='cases to run (default: all)')
+    parser.add_argument('-l', '--list', action='store_true', help='list the cases')
+    parser.add_argument('-t', '--tolerance', type=int, default=0,
+                        help='allowed deviation of ss/es in samples')
+    parser.add_argument('--show', type=int, default=10, help='differences shown per case')
+    parser.add_argument('--update', action='store_true',
+                        help='write the current output as the golden files')
+    parser.add_argument('--make-captures', action='store_true',
+                        help='regenerate the synthetic captures of the corpus')
+    parser.add_argument('--import-dsl', nargs=2, metavar=('FILE', 'NAME'),
+                        help='store the logic data of a DSView session in the corpus')
+    args = parser.parse_args()
+
+    if args.import_dsl:
+        path, name = args.import_dsl
+        srdcap.save(capture_path(name), srdcap.load_dsl(path))
+        return 0
+    if args.make_captures:
+        for name, make in sorted(SYNTHETIC.items()):
+            srdcap.save(capture_path(name), make())
+        return 0
+    if args.list:
+        for c in CASES:
+            print('%-16s %-14s %s' % (c.name, c.capture, ' -> '.join(n for n, _ in c.stack)))
+        return 0
+
+    cases = CASES
+    if args.names:
+        unknown = set(args.names) - set(c.name for c in CASES)
+        if unknown:
+            parser.error('unknown case(s): %s' % ', '.join(sorted(unknown)))
+        cases = [c for c in CASES if c.name in args.names]
+
+    if args.update:
+        for c in cases:
+            records = run_case(c)
+            write_golden(golden_path(c.name), records)
+            print('%s: %d records' % (c.name, len(records)))
+        return 0
+
+    failed = [c.name for c in cases if not check(c, args.tolerance, args.show)]
+    if failed:
+        print('FAILED: %s' % ' '.join(failed))
+        return 1
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -51,7 +51,7 @@ static void release_annotation(struct srd_proto_data_annotation *pda)
 {
 	if (!pda)
 		return;
-	if (pda->ann_text)
+	if (pda->ann_text && !pda->ann_text_shared)
 		g_strfreev(pda->ann_text);
 }
 
@@ -174,6 +174,67 @@ err:
 	return ret;
 }
 
+/*
+ Structured annotation [class, template, value, ...]: the text lines are
+ taken from the decoder's annotation templates, the values are passed in
+ the numeric field as space separated hex numbers. The frontend formats
+ them when the annotation is shown ("{$}" stands for all values, "{$N}"
+ for the N-th one, "{$N:d}" and "{$N:x}" for the N-th one in decimal and
+ hex, whatever the display format, "{$N:04x}" zero padded to four
+ digits), so the decoder doesn't build any strings.
+*/
+static int py_parse_ann_template(struct srd_decoder_inst *di, PyObject *obj,
+		int list_size, char ***out_strv, char *hex_str_buf, long long *numberic_value)
+{
+	PyObject *py_tmp;
+	GPtrArray *templates;
+	unsigned long long lv;
+	long tpl;
+	int i, len, n;
+
+	templates = di->decoder->ann_templates;
+	tpl = PyLong_AsLong(PyList_GetItem(obj, 1));
+	if (!templates || tpl < 0 || tpl >= (long)templates->len) {
+		srd_err("Protocol decoder %s submitted unregistered "
+			"annotation template %ld.", di->decoder->name, tpl);
+		return SRD_ERR_PYTHON;
+	}
+
+	len = 0;
+	hex_str_buf[0] = 0;
+
+	for (i = 2; i < list_size; i++) {
+		py_tmp = PyList_GetItem(obj, i);
+		if (!PyLong_Check(py_tmp)) {
+			srd_err("Protocol decoder %s submitted annotation template "
+				"values which are not integers.", di->decoder->name);
+			return SRD_ERR_PYTHON;
+		}
+		lv = PyLong_AsUnsignedLongLong(py_tmp);
+		if (PyErr_Occurred()) {
+			srd_exception_catch(NULL, "Protocol decoder %s submitted an "
+				"invalid annotation template value", di->decoder->name);
+			return SRD_ERR_PYTHON;
+		}
+		if (i == 2)
+			*numberic_value = (long long)lv;
+
+		n = snprintf(hex_str_buf + len, DECODE_NUM_HEX_MAX_LEN - len,
+			i == 2 ? "%02llX" : " %02llX", lv);
+		if (n < 0 || len + n >= DECODE_NUM_HEX_MAX_LEN) {
+			srd_err("Protocol decoder %s submitted too many annotation "
+				"template values.", di->decoder->name);
+			return SRD_ERR_PYTHON;
+		}
+		len += n;
+	}
+
+	/* The lines are shared with the template, not copied. */
+	*out_strv = g_ptr_array_index(templates, tpl);
+
+	return SRD_OK;
+}
+
 /*
  @obj is the fourth param from python calls put()
 */
@@ -186,21 +247,27 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
     char **ann_text;
 	gpointer ann_type_ptr;
 	PyGILState_STATE gstate;
-	int ann_size; 
+	int ann_size;
+	int is_template;
 
 	pda = pdata->data;
 
 	gstate = PyGILState_Ensure();
 
-	/* Should be a list of [annotation class, [string, ...]]. */
+	/*
+	 * Should be a list of [annotation class, [string, ...]], or of
+	 * [annotation class, template, value, ...].
+	 */
 	if (!PyList_Check(obj)) {
 		srd_err("Protocol decoder %s submitted an annotation that"
 			" is not a list", di->decoder->name);
 		goto err;
 	}
 
-	/* Should have 2 elements. */
-	if (PyList_Size(obj) != 2) {
+	/* Should have 2 elements, unless it's a structured annotation. */
+	ann_size = PyList_Size(obj);
+	is_template = ann_size >= 2 && PyLong_Check(PyList_GetItem(obj, 1));
+	if (ann_size != 2 && !is_template) {
 		srd_err("Protocol decoder %s submitted annotation list with "
 			"%zd elements instead of 2", di->decoder->name,
 			PyList_Size(obj));
@@ -226,6 +293,18 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 	}
 	ann_type_ptr = g_slist_nth_data(di->decoder->ann_types, ann_class);
 
+	pda->str_number_hex[0] = 0;
+	ann_text = NULL;
+	pda->numberic_value = 0;
+	pda->ann_text_shared = is_template;
+
+	if (is_template) {
+		if (py_parse_ann_template(di, obj, ann_size, &ann_text,
+				pda->str_number_hex, &pda->numberic_value) != SRD_OK)
+			goto err;
+		goto done;
+	}
+
 	/* 
 		Second element must be a list.
 	 */
@@ -242,16 +321,13 @@ static int convert_annotation(struct srd_decoder_inst *di, PyObject *obj,
 		goto err;
 	}
 	 
-	pda->str_number_hex[0] = 0;
-	ann_text = NULL;
-	pda->numberic_value = 0; 
-
     if (py_parse_ann_data(py_tmp, &ann_text, ann_size, pda->str_number_hex, &pda->numberic_value) != SRD_OK) {
         srd_err("Protocol decoder %s submitted annotation list, but "
             "second element was malformed.", di->decoder->name);
         goto err;
     }
- 
+
+done:
 	pda->ann_class = ann_class;
 	pda->ann_type = GPOINTER_TO_INT(ann_type_ptr);
     pda->ann_text = ann_text;
@@ -737,28 +813,19 @@ static int get_term_type(const char *v)
 }
 
 /**
- * Get the pin values at the current sample number.
+ * Store the pin values at the current sample number in a tuple.
  *
  * @param di The decoder instance to use. Must not be NULL.
- *           The number of channels must be >= 1.
+ * @param py_pins A PyTuple with one item per decoder channel.
  *
- * @return A newly allocated PyTuple containing the pin values at the
- *         current sample number.
+ * The caller must hold the GIL.
  */
-static int get_current_pinvalues(const struct srd_decoder_inst *di)
+static void fill_pinvalues(const struct srd_decoder_inst *di, PyObject *py_pins)
 {
 	int i;
 	uint8_t sample;
 	const uint8_t *sample_pos;
     int bit_offset;
-	PyGILState_STATE gstate;
-
-	if (!di) {
-		srd_err("Invalid decoder instance.");
-        return SRD_ERR_ARG;
-	}
-
-	gstate = PyGILState_Ensure();
 
 	for (i = 0; i < di->dec_num_channels; i++) {
 		/* A channelmap value of -1 means "unused optional channel". */
@@ -766,19 +833,42 @@ static int get_current_pinvalues(const struct srd_decoder_inst *di)
 			/* Value of unused channel is 0xff, instead of 0 or 1. 
 			   Done set -1 by srd_inst_channel_set_all()
 			*/
-            PyTuple_SetItem(di->py_pinvalues, i, PyLong_FromLong(0xff));
+            PyTuple_SetItem(py_pins, i, PyLong_FromLong(0xff));
 		} else {
             if (*(di->inbuf + i) == NULL) {
                 sample = *(di->inbuf_const + i) ? 1 : 0;
-                PyTuple_SetItem(di->py_pinvalues, i, PyLong_FromLong(sample));
+                PyTuple_SetItem(py_pins, i, PyLong_FromLong(sample));
             } else {
                 sample_pos = *(di->inbuf + i) + ((di->abs_cur_samplenum - di->abs_start_samplenum) / 8);
                 bit_offset = (di->abs_cur_samplenum - di->abs_start_samplenum) % 8;
                 sample = *sample_pos & (1 << bit_offset) ? 1 : 0;
-                PyTuple_SetItem(di->py_pinvalues, i, PyLong_FromLong(sample));
+                PyTuple_SetItem(py_pins, i, PyLong_FromLong(sample));
             }
 		}
 	}
+}
+
+/**
+ * Get the pin values at the current sample number.
+ *
+ * @param di The decoder instance to use. Must not be NULL.
+ *           The number of channels must be >= 1.
+ *
+ * @return A newly allocated PyTuple containing the pin values at the
+ *         current sample number.
+ */
+static int get_current_pinvalues(const struct srd_decoder_inst *di)
+{
+	PyGILState_STATE gstate;
+
+	if (!di) {
+		srd_err("Invalid decoder instance.");
+        return SRD_ERR_ARG;
+	}
+
+	gstate = PyGILState_Ensure();
+
+	fill_pinvalues(di, di->py_pinvalues);
 
 	PyGILState_Release(gstate);
 
@@ -1035,6 +1125,84 @@ static int set_skip_condition(struct srd_decoder_inst *di, uint64_t count)
 	return SRD_OK;
 }
 
+/**
+ * Create a condition list with one EITHER_EDGE condition per channel.
+ *
+ * @param di Decoder instance.
+ * @param py_channels A Python list (or tuple) of decoder channel indices.
+ *
+ * @retval SRD_OK The new condition list was set successfully.
+ * @retval SRD_ERR The channel list was invalid.
+ *
+ * Used by .wait_edges(), the channels in the list are "or"ed, like the
+ * conditions of a .wait([{ch0: 'e'}, {ch1: 'e'}, ...]) call.
+ */
+static int set_edge_condition_list(struct srd_decoder_inst *di, PyObject *py_channels)
+{
+	PyObject *py_seq, *py_item;
+	struct srd_term *term;
+	GSList *term_list;
+	Py_ssize_t i, num_channels;
+	long channel;
+
+	py_seq = PySequence_Fast(py_channels, "Channels must be a list of channel indices.");
+	if (!py_seq)
+		return SRD_ERR;
+
+	num_channels = PySequence_Fast_GET_SIZE(py_seq);
+	if (num_channels == 0) {
+		srd_err("Channel list is empty.");
+		Py_DecRef(py_seq);
+		return SRD_ERR;
+	}
+
+	/* Check all indices before the old condition list is replaced. */
+	for (i = 0; i < num_channels; i++) {
+		py_item = PySequence_Fast_GET_ITEM(py_seq, i);
+		channel = PyLong_Check(py_item) ? PyLong_AsLong(py_item) : -1;
+		if (channel < 0 || channel >= di->dec_num_channels) {
+			srd_err("Invalid channel index in channel list.");
+			Py_DecRef(py_seq);
+			return SRD_ERR;
+		}
+	}
+
+	condition_list_free(di);
+
+	for (i = 0; i < num_channels; i++) {
+		term = g_try_malloc0(sizeof(struct srd_term));
+		if (term == NULL) {
+			srd_err("%s,ERROR:failed to alloc memory.", __func__);
+			break;
+		}
+		term->type = SRD_TERM_EITHER_EDGE;
+		term->channel = PyLong_AsLong(PySequence_Fast_GET_ITEM(py_seq, i));
+		term_list = g_slist_append(NULL, term);
+		di->condition_list = g_slist_append(di->condition_list, term_list);
+	}
+
+	Py_DecRef(py_seq);
+
+	return SRD_OK;
+}
+
+/*
+ Reset the state for the next chunk and signal the main thread that all
+ samples were handled. Called with the data_mutex held.
+*/
+static void release_chunk(struct srd_decoder_inst *di)
+{
+	di->got_new_samples = FALSE;
+	di->handled_all_samples = TRUE;
+	di->chunk_release_pending = FALSE;
+	di->abs_start_samplenum = 0;
+	di->abs_end_samplenum = 0;
+	di->inbuf = NULL;
+	di->inbuflen = 0;
+
+	g_cond_signal(&di->handled_all_samples_cond);
+}
+
 static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 {
 	int ret;
@@ -1089,6 +1257,8 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
 
         /* Wait for new samples to process, or termination request. */
         g_mutex_lock(&di->data_mutex);
+        if (di->chunk_release_pending)
+            release_chunk(di);
         while (!di->got_new_samples && !di->want_wait_terminate)
             g_cond_wait(&di->got_new_samples_cond, &di->data_mutex);
 
@@ -1130,15 +1300,7 @@ static PyObject *Decoder_wait(PyObject *self, PyObject *args)
         } 
  
 		/* No match, reset state for the next chunk. */
-		di->got_new_samples = FALSE;
-		di->handled_all_samples = TRUE;
-		di->abs_start_samplenum = 0;
-		di->abs_end_samplenum = 0;
-		di->inbuf = NULL;
-		di->inbuflen = 0;
-
-		/* Signal the main thread that we handled all samples. */
-		g_cond_signal(&di->handled_all_samples_cond);
+		release_chunk(di);
 
 		/*
 		 * When termination of wait() and decode() was requested,
@@ -1164,6 +1326,165 @@ err:
 	return NULL;
 }
 
+/**
+ * Wait for edges on a set of channels, and return them in batches.
+ *
+ * Takes a list of channel indices and an optional maximum number of
+ * edges (default 1024). Returns a list of (samplenum, pins) tuples, one
+ * per sample with an edge on any of the channels, where 'pins' holds the
+ * values of all channels like the return value of .wait().
+ *
+ * The list ends when it holds the maximum number of edges, or when all
+ * samples of the current chunk were processed, so it is never empty.
+ * self.samplenum and self.matched are those of the last edge (bit i of
+ * self.matched is set for an edge on the i-th channel of the list).
+ *
+ * Compared to one .wait() call per edge, this saves the condition list
+ * setup, the thread handover and the creation of the Python objects for
+ * each edge, which dominates the cost for decoders that only measure
+ * the time between edges.
+ */
+static PyObject *Decoder_wait_edges(PyObject *self, PyObject *args)
+{
+	PyObject *py_channels, *py_edges, *py_edge, *py_pins, *py_matched;
+	unsigned int limit;
+	uint64_t last_matched;
+	gboolean found_match;
+	struct srd_decoder_inst *di;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		PyGILState_Release(gstate);
+		Py_RETURN_NONE;
+	}
+
+	if (di->want_wait_terminate) {
+		srd_dbg("%s: %s: Skip (want_term).", di->inst_id, __func__);
+		goto err;
+	}
+
+	limit = 1024;
+	if (!PyArg_ParseTuple(args, "O|I", &py_channels, &limit))
+		goto err;
+	if (limit == 0)
+		limit = 1;
+
+	if (set_edge_condition_list(di, py_channels) != SRD_OK) {
+		srd_dbg("%s: %s: Aborting wait_edges().", di->inst_id, __func__);
+		goto err;
+	}
+
+	if (!(py_edges = PyList_New(0)))
+		goto err;
+	last_matched = 0;
+
+	while (1) {
+
+		Py_BEGIN_ALLOW_THREADS
+
+		/* Wait for new samples to process, or termination request. */
+		g_mutex_lock(&di->data_mutex);
+		if (di->chunk_release_pending)
+			release_chunk(di);
+		while (!di->got_new_samples && !di->want_wait_terminate)
+			g_cond_wait(&di->got_new_samples_cond, &di->data_mutex);
+
+		found_match = FALSE;
+		process_samples_until_condition_match(di, &found_match);
+
+		Py_END_ALLOW_THREADS
+
+		if (found_match) {
+			if (!(py_pins = PyTuple_New(di->dec_num_channels))) {
+				g_mutex_unlock(&di->data_mutex);
+				goto err_edges;
+			}
+			fill_pinvalues(di, py_pins);
+			/* "N" steals the py_pins reference, also on failure. */
+			py_edge = Py_BuildValue("(KN)",
+				(unsigned long long)di->abs_cur_samplenum, py_pins);
+			if (!py_edge) {
+				g_mutex_unlock(&di->data_mutex);
+				goto err_edges;
+			}
+			if (PyList_Append(py_edges, py_edge) < 0) {
+				Py_DECREF(py_edge);
+				g_mutex_unlock(&di->data_mutex);
+				goto err_edges;
+			}
+			Py_DECREF(py_edge);
+			/* The match bits of a later, failed search don't count. */
+			last_matched = di->match_array;
+
+			if ((unsigned int)PyList_Size(py_edges) < limit) {
+				/* Continue in the same chunk. */
+				g_mutex_unlock(&di->data_mutex);
+				continue;
+			}
+
+			g_mutex_unlock(&di->data_mutex);
+			goto done;
+		}
+
+		/*
+		 * Hand out the edges of this chunk. The chunk is released
+		 * at the next wait() or wait_edges() call: the main thread
+		 * only resumes while the decoder is blocked in here, else
+		 * it could end the session (and call end()) while decode()
+		 * still works on the edges.
+		 */
+		if (PyList_Size(py_edges) > 0) {
+			di->chunk_release_pending = TRUE;
+			g_mutex_unlock(&di->data_mutex);
+			goto done;
+		}
+
+		/* No match, reset state for the next chunk. */
+		release_chunk(di);
+
+		if (di->want_wait_terminate) {
+			srd_dbg("%s: %s: Will return from wait_edges().",
+				di->inst_id, __func__);
+			g_mutex_unlock(&di->data_mutex);
+			goto err_edges;
+		}
+
+		g_mutex_unlock(&di->data_mutex);
+	}
+
+done:
+	/* Set self.samplenum and self.matched to those of the last edge. */
+	py_edge = PyList_GetItem(py_edges, PyList_Size(py_edges) - 1);
+	if (PyObject_SetAttrString(di->py_inst, "samplenum",
+			PyTuple_GetItem(py_edge, 0)) < 0)
+		goto err_edges;
+
+	if (!(py_matched = PyLong_FromUnsignedLongLong(last_matched)))
+		goto err_edges;
+	if (PyObject_SetAttrString(di->py_inst, "matched", py_matched) < 0) {
+		Py_DECREF(py_matched);
+		goto err_edges;
+	}
+	Py_DECREF(py_matched);
+
+	PyGILState_Release(gstate);
+
+	return py_edges;
+
+err_edges:
+	Py_DECREF(py_edges);
+err:
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
 /**
  * Return whether the specified channel was supplied to the decoder.
  *
@@ -1224,6 +1545,113 @@ err:
 	return NULL;
 }
 
+/**
+ * Return the OUTPUT_PYTHON packet types which the consumers of an output
+ * make use of.
+ *
+ * Stacked decoders may list the packet types (the first item of the
+ * packet) they handle in an 'input_packets' class attribute. A decoder
+ * without that attribute, and a frontend callback for OUTPUT_PYTHON, take
+ * every packet type. Decoders use this to skip building packets which
+ * nobody receives.
+ *
+ * @param self The calling decoder instance. Must not be NULL.
+ * @param args The output ID, as returned by register(). Must not be NULL.
+ *
+ * @retval Py_None All packet types are used, or the output is not an
+ *                 OUTPUT_PYTHON output.
+ * @retval frozenset The packet types which are used (empty if the output
+ *                   has no consumers).
+ * @retval NULL An error occurred.
+ */
+static PyObject *Decoder_output_packets(PyObject *self, PyObject *args)
+{
+	GSList *l;
+	int output_id;
+	struct srd_decoder_inst *di, *next_di;
+	struct srd_pd_output *pdo;
+	PyObject *py_set, *py_types, *py_iter, *py_item, *py_res;
+	PyGILState_STATE gstate;
+
+	if (!self || !args)
+		return NULL;
+
+	py_set = NULL;
+
+	gstate = PyGILState_Ensure();
+
+	if (!(di = srd_inst_find_by_obj(NULL, self))) {
+		PyErr_SetString(PyExc_Exception, "decoder instance not found");
+		goto err;
+	}
+
+	if (!PyArg_ParseTuple(args, "i", &output_id)) {
+		/* Let Python raise this exception. */
+		goto err;
+	}
+
+	if (!(l = g_slist_nth(di->pd_output, output_id))) {
+		srd_err("Protocol decoder %s queried invalid output ID %d.",
+			di->decoder->name, output_id);
+		PyErr_SetString(PyExc_IndexError, "invalid output ID");
+		goto err;
+	}
+	pdo = l->data;
+
+	if (pdo->output_type != SRD_OUTPUT_PYTHON)
+		goto all;
+	if (srd_pd_output_callback_find(di->sess, SRD_OUTPUT_PYTHON))
+		goto all;
+
+	if (!(py_set = PySet_New(NULL)))
+		goto err;
+
+	for (l = di->next_di; l; l = l->next) {
+		next_di = l->data;
+		if (!PyObject_HasAttrString(next_di->py_inst, "input_packets"))
+			goto all;
+		if (!(py_types = PyObject_GetAttrString(next_di->py_inst, "input_packets")))
+			goto err;
+		if (py_types == Py_None) {
+			Py_DECREF(py_types);
+			goto all;
+		}
+		py_iter = PyObject_GetIter(py_types);
+		Py_DECREF(py_types);
+		if (!py_iter)
+			goto err;
+		while ((py_item = PyIter_Next(py_iter))) {
+			if (PySet_Add(py_set, py_item) < 0) {
+				Py_DECREF(py_item);
+				Py_DECREF(py_iter);
+				goto err;
+			}
+			Py_DECREF(py_item);
+		}
+		Py_DECREF(py_iter);
+		if (PyErr_Occurred())
+			goto err;
+	}
+
+	py_res = PyFrozenSet_New(py_set);
+	Py_DECREF(py_set);
+	PyGILState_Release(gstate);
+
+	return py_res;
+
+all:
+	Py_XDECREF(py_set);
+	PyGILState_Release(gstate);
+
+	Py_RETURN_NONE;
+
+err:
+	Py_XDECREF(py_set);
+	PyGILState_Release(gstate);
+
+	return NULL;
+}
+
 /*
  Receive python debug log, and print it to console
 */
@@ -1285,9 +1713,15 @@ static PyMethodDef Decoder_methods[] = {
 	{ "wait", Decoder_wait, METH_VARARGS,
 			"Wait for one or more conditions to occur" },
 
+	{ "wait_edges", Decoder_wait_edges, METH_VARARGS,
+			"Wait for edges on channels, return a list of (samplenum, pins)" },
+
 	{ "has_channel", Decoder_has_channel, METH_VARARGS,
 			"Report whether a channel was supplied" },
 
+	{ "output_packets", Decoder_output_packets, METH_VARARGS,
+			"Return the packet types the consumers of an output use (None: all)" },
+
 	{ "printlog", Decoder_printlog, METH_VARARGS,
 			"Print string from python" },
 